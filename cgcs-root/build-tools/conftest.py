@@ -0,0 +1,65 @@
+#
+# Copyright (c) 2018 Wind River Systems, Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+#
+
+#
+# Fixtures shared by the tests of the dependency cache tools.  The trees
+# are written by dependancy_cache_synth.py, so no mirror is needed.
+#
+
+import os
+
+import pytest
+
+import create_dependancy_cache
+import dependancy_cache_synth
+
+# Number of rpms of the shared tree, enough for cycles, file requires and
+# kernel-rt packages, small enough to build in about a second
+SYNTH_PACKAGES = 300
+
+
+# Return the mirror roots of a tree written by dependancy_cache_synth.py
+def synth_mirror_roots(root, build_types=create_dependancy_cache.build_types):
+    return create_dependancy_cache.make_mirror_roots(os.path.join(root, 'repo'),
+                                                     os.path.join(root, 'workspace'),
+                                                     build_types=build_types)
+
+# Build the cache of the tree under 'root' into 'cache_dir', as the command
+# line does, with the options given as keyword arguments, quiet unless
+# they say otherwise.  Returns the DependancyCache.
+def build_cache(root, cache_dir, **kwargs):
+    kwargs.setdefault('quiet', True)
+    options = create_dependancy_cache.get_default_options(**kwargs)
+    build_type_roots = {}
+    for bt in create_dependancy_cache.get_option_build_types(options):
+        build_type_roots[bt] = synth_mirror_roots(root, build_types=[bt])
+    cache = create_dependancy_cache.DependancyCache(synth_mirror_roots(root), options,
+                                                    build_type_roots=build_type_roots)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    cache.create_cache(cache_dir)
+    return cache
+
+
+@pytest.fixture(scope='session')
+def synth_tree(tmp_path_factory):
+    root = str(tmp_path_factory.mktemp('synth') / 'tree')
+    dependancy_cache_synth.write_tree(root, SYNTH_PACKAGES, cycles=5, seed=1)
+    return root
+
+# The cache of 'synth_tree', with an index of each file, and the SQLite
+# store, as (DependancyCache, cache_dir, db_path).  Read only.
+@pytest.fixture(scope='session')
+def synth_cache(synth_tree, tmp_path_factory):
+    cache_dir = str(tmp_path_factory.mktemp('cache'))
+    db_path = str(tmp_path_factory.mktemp('db') / 'graph.db')
+    cache = build_cache(synth_tree, cache_dir, index=True, db=db_path)
+    return (cache, cache_dir, db_path)
+
+# build_cache(), for the tests that build caches of their own
+@pytest.fixture
+def cache_builder():
+    return build_cache
@@ -1,4 +1,4 @@
-#!/usr/bin/python2
+#!/usr/bin/python3
 
 #
 # Copyright (c) 2018 Wind River Systems, Inc.
@@ -37,18 +37,111 @@
 #   rpm-to-srpm                   Map RPM back to the SRPM that created it
 #   srpm-to-rpm                   Map a SRPM to the set of RPMS it builds
 #
+# With --index, each file also gets a binary index, <file>.idx, that can be
+# searched without reading the whole file.  See dependancy_cache_index.py.
+#
+# With --state_file, the dependency data is also saved for a later
+# --incremental run, which only recomputes the relations of the packages
+# that changed, and copies all other lines from the existing cache files.
+#
+# With --db, the dependency graph itself is also saved, to a SQLite store
+# that can be queried later.  See dependancy_cache_db.py.
+#
+# A cache file whose content did not change is not rewritten, so it keeps
+# its modification time, and syncing the cache to the build nodes only
+# copies the files that changed.  With --compress, a zstd compressed copy
+# of each file, <file>.zst, is kept next to it.  This needs the optional
+# zstandard module, see optional-requirements.txt.  With --manifest, the
+# sha256 of every file published is listed in MANIFEST.sha256, in the
+# format of sha256sum, so a node can tell which files it is missing.
+#
+# The cache covers the rpms built by every build type of the workspace.
+# With --build_types, a cache of each of the given build types is also
+# written to <cache_dir>/<build_type>, made from the mirrors and the rpms
+# of that build type only, as if the workspace held no other.  Each
+# repodata file is still searched for and parsed once: the parsed records
+# are kept, and applied again for each build type.
+#
+# Requirements that can't be resolved, and rpms whose source rpm is not
+# known, are counted as they are found, see Diagnostics, and reported once
+# at the end, one line per capability or rpm with the packages that hit
+# it.  With --diagnostics the report goes to a file, else to stdout.
+#
+# By default a requirement is satisfied by the last package read that
+# provides it, whatever the version.  With --versioned_requires, the
+# version constraint of the requirement is honored, and among the packages
+# providing it, one of a matching version is picked.
+#
+# The work is done by the DependancyCache class, which other tools can
+# import to keep one dependency graph in memory for many queries, e.g.
+#    mirror_roots = make_mirror_roots(my_repo, my_workspace)
+#    cache = DependancyCache(mirror_roots, get_default_options(quiet=True))
+#    cache.build()
+#    cache.query('RPM-transitive-requires', 'bash')
+# Run as a script, it reads MY_REPO, MY_WORKSPACE and its options, and
+# writes the cache files, see main().
+#
 
 import xml.etree.ElementTree as ET
+from array import array
+import concurrent.futures
+import contextlib
+import cProfile
 import fnmatch
 import os
 import gzip
+import bz2
+import hashlib
+import itertools
+import json
+import multiprocessing
+import pickle
+import shutil
+import sqlite3
 import sys
-import string
+import tempfile
+import time
 from optparse import OptionParser
+from functools import cmp_to_key
+
+import dependancy_cache_db
+import dependancy_cache_index
+from dependancy_cache_graph import strongly_connected_components
+
+# Peak memory is only known where the resource module exists
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Optional decompressors for .xz and .zst repodata
+try:
+    import lzma
+except ImportError:
+    lzma = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 ns = { 'root': 'http://linux.duke.edu/metadata/common',
        'filelists': 'http://linux.duke.edu/metadata/filelists',
-       'rpm': 'http://linux.duke.edu/metadata/rpm' }
+       'rpm': 'http://linux.duke.edu/metadata/rpm',
+       'repo': 'http://linux.duke.edu/metadata/repo' }
+
+# Return the fully qualified form, '{namespace}tag', of a 'prefix:tag' of 'ns'
+def qualified_tag(prefixed_tag):
+    (prefix, tag) = prefixed_tag.split(':')
+    return "{%s}%s" % (ns[prefix], tag)
+
+# map 'prefix:tag' -> '{namespace}tag', for the tags looked up in repodata.
+# find() is much faster given the qualified tag: a 'prefix:tag' path goes
+# through ElementPath, which maps the prefix with 'ns' again on every call.
+tags = dict([(t, qualified_tag(t)) for t in
+             [ 'root:package', 'root:name', 'root:arch', 'root:version', 'root:format', 'root:file',
+               'rpm:sourcerpm', 'rpm:requires', 'rpm:provides', 'rpm:entry',
+               'filelists:package', 'filelists:version', 'filelists:file',
+               'repo:data', 'repo:location' ]])
 
 build_types=['std', 'rt']
 rpm_types=['RPM', 'SRPM']
@@ -58,647 +151,2554 @@ default_arch_by_type = {'RPM': [ 'x86_64', 'noarch' ],
                         'SRPM': [ 'src' ]
                        }
 
-repodata_dir="/export/jenkins/mirrors"
-if not os.path.isdir(repodata_dir):
-    repodata_dir="/import/mirrors"
-    if not os.path.isdir(repodata_dir):
-        print("ERROR: directory not found %s" % repodata_dir)
-        sys.exit(1)
-
-publish_cache_dir="%s/cgcs-tis-repo/dependancy-cache" % os.environ['MY_REPO']
-centos_repo_dir="%s/cgcs-centos-repo" % os.environ['MY_REPO']
-
-workspace_repo_dirs={}
-for rt in rpm_types:
-    workspace_repo_dirs[rt]={}
-    for bt in build_types:
-        workspace_repo_dirs[rt][bt]="%s/%s/rpmbuild/%sS" % (os.environ['MY_WORKSPACE'], bt, rt)
-
-if not os.path.isdir(os.environ['MY_REPO']):
-    print("ERROR: directory not found MY_REPO=%s" % os.environ['MY_REPO'])
-    sys.exit(1)
-
-if not os.path.isdir(centos_repo_dir):
-    print("ERROR: directory not found %s" % centos_repo_dir)
-    sys.exit(1)
-
-bin_rpm_mirror_roots = ["%s/Binary" % centos_repo_dir]
-src_rpm_mirror_roots = ["%s/Source" % centos_repo_dir]
-
-for bt in build_types:
-    bin_rpm_mirror_roots.append(workspace_repo_dirs['RPM'][bt])
-    src_rpm_mirror_roots.append(workspace_repo_dirs['SRPM'][bt])
-
-parser = OptionParser('create_dependancy_cache')
-parser.add_option('-c', '--cache_dir', action='store', type='string',
-    dest='cache_dir', help='set cache directory')
-parser.add_option('-t', '--third_party_repo_dir', action='store',
-    type='string', dest='third_party_repo_dir',
-    help='set third party directory')
-(options, args) = parser.parse_args()
-
-if options.cache_dir:
-    publish_cache_dir = options.cache_dir
-
-if options.third_party_repo_dir:
-    third_party_repo_dir = options.third_party_repo_dir
-    bin_rpm_mirror_roots.append(third_party_repo_dir)
-    src_rpm_mirror_roots.append(third_party_repo_dir)
-    if not os.path.isdir(third_party_repo_dir):
-        print("ERROR: directory not found %s" % third_party_repo_dir)
-        sys.exit(1)
-
-# Create directory if required
-if not os.path.isdir(publish_cache_dir):
-    print("Creating directory: %s" % publish_cache_dir)
-    os.makedirs(publish_cache_dir, 0o755)
-
-# The Main data structure
-pkg_data={}
-
-for rpm_type in rpm_types:
-    pkg_data[rpm_type]={}
-
-    # map provided_name -> pkg_name
-    pkg_data[rpm_type]['providers']={}
-
-    # map pkg_name -> required_names ... could be a pkg, capability or file
-    pkg_data[rpm_type]['requires']={}
-
-    # map file_name -> pkg_name
-    pkg_data[rpm_type]['file_owners']={}
-
-    # map pkg_name -> file_name
-    pkg_data[rpm_type]['files']={}
-
-    # map pkg_name -> required_pkg_names ... only pkg names, and only direct requirement
-    pkg_data[rpm_type]['pkg_direct_requires']={}
-
-    # map pkg_name -> required_pkg_names ... only pkg names, but this is the transitive list of all requirements
-    pkg_data[rpm_type]['pkg_transitive_requires']={}
-
-    # map pkg_name -> descendant_pkgs ... only packages the directly require this package
-    pkg_data[rpm_type]['pkg_direct_descendants']={}
-
-    # map pkg_name -> descendant_pkgs ... packages that have a transitive requiremant on this package
-    pkg_data[rpm_type]['pkg_transitive_descendants']={}
-
-    # Map package name to a source rpm file name
-    pkg_data[rpm_type]['sourcerpm']={}
-    pkg_data[rpm_type]['binrpm']={}
-
-    # Map file name to package name
-    pkg_data[rpm_type]['fn_to_name']={}
+# Name of the --manifest file in the cache directory
+MANIFEST_NAME='MANIFEST.sha256'
+
+# Suffix of the --compress copy of a cache file
+COMPRESSED_SUFFIX='.zst'
+
+# The mirrors of the build servers, the first one found is used
+mirror_dirs = [ "/export/jenkins/mirrors", "/import/mirrors" ]
+
+# Return the default directory of the cache files, for MY_REPO 'my_repo'
+def get_default_cache_dir(my_repo):
+    return "%s/cgcs-tis-repo/dependancy-cache" % my_repo
+
+# Return the directory of the centos mirror, for MY_REPO 'my_repo'
+def get_centos_repo_dir(my_repo):
+    return "%s/cgcs-centos-repo" % my_repo
+
+# Return the directories searched for repodata, as a map
+# rpm_type -> [ directory ], for MY_REPO 'my_repo' and MY_WORKSPACE
+# 'my_workspace'.  A third party repo is searched for both types.
+#    build_types= the build types whose workspace rpms are searched
+def make_mirror_roots(my_repo, my_workspace, third_party_repo_dir=None, build_types=build_types):
+    centos_repo_dir = get_centos_repo_dir(my_repo)
+    mirror_roots = { 'RPM': ["%s/Binary" % centos_repo_dir],
+                     'SRPM': ["%s/Source" % centos_repo_dir] }
+    for rt in rpm_types:
+        for bt in build_types:
+            mirror_roots[rt].append("%s/%s/rpmbuild/%sS" % (my_workspace, bt, rt))
+        if third_party_repo_dir:
+            mirror_roots[rt].append(third_party_repo_dir)
+    return mirror_roots
+
+def make_option_parser():
+    parser = OptionParser('create_dependancy_cache')
+    parser.add_option('-c', '--cache_dir', action='store', type='string',
+        dest='cache_dir', help='set cache directory')
+    parser.add_option('-t', '--third_party_repo_dir', action='store',
+        type='string', dest='third_party_repo_dir',
+        help='set third party directory')
+    parser.add_option('-j', '--jobs', action='store', type='int',
+        dest='jobs', default=1,
+        help='number of processes used to parse repodata files')
+    parser.add_option('-r', '--repodata_cache_dir', action='store',
+        type='string', dest='repodata_cache_dir',
+        help='keep parsed repodata in this directory, and reuse it for repodata files that have not changed')
+    parser.add_option('-l', '--lazy_filelists', action='store_true',
+        dest='lazy_filelists', default=False,
+        help='only load the files from filelists.xml that some package requires')
+    parser.add_option('-s', '--state_file', action='store',
+        type='string', dest='state_file',
+        help='save the dependency data to this file, for use by --incremental')
+    parser.add_option('-u', '--incremental', action='store_true',
+        dest='incremental', default=False,
+        help='only recompute what changed since the run that wrote --state_file')
+    parser.add_option('-v', '--versioned_requires', action='store_true',
+        dest='versioned_requires', default=False,
+        help='honor the version of versioned requires, and pick a provider of a matching version')
+    parser.add_option('-p', '--primary_db', action='store_true',
+        dest='primary_db', default=False,
+        help='read the primary sqlite database of a repo in place of primary.xml, where repomd.xml lists one')
+    parser.add_option('-b', '--db', action='store',
+        type='string', dest='db',
+        help='also save the dependency graph to this SQLite store, see dependancy_cache_db.py')
+    parser.add_option('-T', '--timing_report', action='store',
+        type='string', dest='timing_report',
+        help='write the wall time, cpu time, peak memory and item counts of each phase to this file, as JSON')
+    parser.add_option('-D', '--diagnostics', action='store',
+        type='string', dest='diagnostics',
+        help='write the unresolved requirements and missing source rpms found to this file, in place of stdout')
+    parser.add_option('-P', '--profile', action='store',
+        type='string', dest='profile',
+        help='write cProfile stats of the dependency closure phase to this file')
+    parser.add_option('-w', '--write_jobs', action='store', type='int',
+        dest='write_jobs', default=1,
+        help='number of threads used to write the cache files')
+    parser.add_option('-d', '--discovery_jobs', action='store', type='int',
+        dest='discovery_jobs', default=4,
+        help='number of threads used to search the mirror roots for repodata')
+    parser.add_option('-q', '--quiet', action='store_true',
+        dest='quiet', default=False,
+        help='do not trace every package and requirement on stdout')
+    parser.add_option('-i', '--index', action='store_true',
+        dest='index', default=False,
+        help='also write a binary index (.idx) of each cache file')
+    parser.add_option('-B', '--build_types', action='store',
+        type='string', dest='build_types',
+        help='also write a cache of each of these comma seperated build types, e.g. std,rt, to <cache_dir>/<build_type>')
+    parser.add_option('-z', '--compress', action='store_true',
+        dest='compress', default=False,
+        help='also write a zstd compressed copy (.zst) of each cache file')
+    parser.add_option('-m', '--manifest', action='store_true',
+        dest='manifest', default=False,
+        help='also write %s, the sha256 of every file in the cache directory' % MANIFEST_NAME)
+    return parser
+
+# Return the default options, as the command line would give them, with
+# the keyword arguments set on top, e.g. get_default_options(jobs=4)
+def get_default_options(**kwargs):
+    options = make_option_parser().get_default_values()
+    for (key, value) in kwargs.items():
+        if not hasattr(options, key):
+            raise ValueError("unknown option '%s'" % key)
+        setattr(options, key, value)
+    return options
+
+# Raise ValueError if 'options' can't be used
+def validate_options(options):
+    if options.jobs < 1:
+        raise ValueError("invalid number of jobs %d" % options.jobs)
+    if options.write_jobs < 1:
+        raise ValueError("invalid number of write jobs %d" % options.write_jobs)
+    if options.discovery_jobs < 1:
+        raise ValueError("invalid number of discovery jobs %d" % options.discovery_jobs)
+    if options.incremental and not options.state_file:
+        raise ValueError("--incremental requires --state_file")
+    if options.compress and zstandard is None:
+        raise ValueError("--compress needs the zstandard module")
+    for bt in get_option_build_types(options):
+        if bt not in build_types:
+            raise ValueError("invalid build type '%s', valid types are %s" % (bt, ','.join(build_types)))
+
+# Return the list of --build_types
+def get_option_build_types(options):
+    if not options.build_types:
+        return []
+    return [bt for bt in options.build_types.split(',') if bt != ""]
+
+# Table of interned strings.  Each package name, capability and rpm file name
+# is stored once, and is referred to everywhere else by its integer id.
+class StringTable(object):
+    def __init__(self):
+        # map string -> id
+        self.ids = {}
+        # map id -> string
+        self.names = []
+
+    # Return the id of 's', adding 's' to the table if required.
+    # The same int object is returned every time, so the many maps keyed by
+    # ids share it rather than holding a copy each.  The string kept is the
+    # sys.intern() one, the same object as in the package records, see
+    # parse_primary_package().
+    def intern(self, s):
+        i = self.ids.get(s)
+        if i is None:
+            # None stands for an empty <rpm:sourcerpm/>, as of every SRPM
+            if s is not None:
+                s = sys.intern(s)
+            i = len(self.names)
+            self.ids[s] = i
+            self.names.append(s)
+        return i
+
+    # Return the id of 's', or None if 's' is not in the table
+    def lookup(self, s):
+        return self.ids.get(s)
+
+    def __len__(self):
+        return len(self.names)
+
+    # Replace the content of the table with 'names', as saved from 'names'
+    # by an earlier run, so that ids keep their meaning.
+    def restore(self, names):
+        self.names[:] = [s if s is None else sys.intern(s) for s in names]
+        self.ids.clear()
+        for (i, s) in enumerate(self.names):
+            self.ids[s] = i
+
+
+# Compare two version or release strings the way rpm does.
+# Returns -1, 0 or 1.
+def rpmvercmp(a, b):
+    if a == b:
+        return 0
+    i = 0
+    j = 0
+    while i < len(a) or j < len(b):
+        while i < len(a) and not (a[i].isalnum() or a[i] in '~^'):
+            i += 1
+        while j < len(b) and not (b[j].isalnum() or b[j] in '~^'):
+            j += 1
+
+        # '~' sorts before everything, even the end of the string
+        if a[i:i+1] == '~' or b[j:j+1] == '~':
+            if a[i:i+1] != '~':
+                return 1
+            if b[j:j+1] != '~':
+                return -1
+            i += 1
+            j += 1
+            continue
+
+        # '^' sorts after the end of the string, but before anything else
+        if a[i:i+1] == '^' or b[j:j+1] == '^':
+            if i >= len(a):
+                return -1
+            if j >= len(b):
+                return 1
+            if a[i] != '^':
+                return 1
+            if b[j] != '^':
+                return -1
+            i += 1
+            j += 1
+            continue
+
+        if i >= len(a) or j >= len(b):
+            break
+
+        # Compare a segment of digits or of letters, a numeric segment
+        # is newer than an alpha one
+        si = i
+        sj = j
+        isnum = a[i].isdigit()
+        if isnum:
+            while i < len(a) and a[i].isdigit():
+                i += 1
+            while j < len(b) and b[j].isdigit():
+                j += 1
+        else:
+            while i < len(a) and a[i].isalpha():
+                i += 1
+            while j < len(b) and b[j].isalpha():
+                j += 1
+        seg_a = a[si:i]
+        seg_b = b[sj:j]
+        if seg_b == "":
+            return 1 if isnum else -1
+        if isnum:
+            seg_a = seg_a.lstrip('0')
+            seg_b = seg_b.lstrip('0')
+            if len(seg_a) != len(seg_b):
+                return 1 if len(seg_a) > len(seg_b) else -1
+        if seg_a != seg_b:
+            return 1 if seg_a > seg_b else -1
+
+    if i >= len(a) and j >= len(b):
+        return 0
+    return -1 if i >= len(a) else 1
+
+# Compare two (epoch, version, release) tuples.  A missing epoch is 0.
+# The releases are not compared if 'ignore_release' is set, as for a
+# requirement on a version without a release.
+def compare_evr(a, b, ignore_release=False):
+    (epoch_a, version_a, release_a) = a
+    (epoch_b, version_b, release_b) = b
+    epoch_a = int(epoch_a or 0)
+    epoch_b = int(epoch_b or 0)
+    if epoch_a != epoch_b:
+        return 1 if epoch_a > epoch_b else -1
+    c = rpmvercmp(version_a or "", version_b or "")
+    if c != 0 or ignore_release:
+        return c
+    return rpmvercmp(release_a or "", release_b or "")
+
+# Does comparison result 'c', of a provided version against a required
+# one, satisfy 'flags'
+evr_flag_tests = { 'EQ': lambda c: c == 0,
+                   'LT': lambda c: c < 0,
+                   'LE': lambda c: c <= 0,
+                   'GT': lambda c: c > 0,
+                   'GE': lambda c: c >= 0 }
+
+# Map of capability -> every package that provides it, with the version
+# it is provided at, for --versioned_requires.
+#
+# The candidates of a capability are kept sorted by version, so the
+# candidates that satisfy a versioned requirement are one contiguous
+# range, found with a binary search.  A capability provided without an
+# exact version satisfies any requirement on it.
+class ProviderIndex(object):
+    # strings= the StringTable the capabilities and packages are ids of
+    def __init__(self, strings):
+        self.strings = strings
+        # capability -> [ (evr, pkg_name) ], sorted by evr
+        self.versioned = {}
+        # capability -> pkg_name, the last package providing it without a version
+        self.unversioned = {}
+        # capability -> (pkg_name, flags_evr), the last writer, as in 'providers'
+        self.last = {}
+        # capabilities whose 'versioned' list needs sorting
+        self.unsorted = set()
+        # (capability, flags_evr) of the requirements no version satisfies
+        self.unsatisfied = set()
+
+    # Record that 'pkg' provides 'cap'
+    #    flags_evr= (flags, (epoch, version, release)) or None
+    def add(self, cap, pkg, flags_evr):
+        self.last[cap] = (pkg, flags_evr)
+        if flags_evr is None or flags_evr[0] != 'EQ' or flags_evr[1][1] is None:
+            self.unversioned[cap] = pkg
+            return
+        self.versioned.setdefault(cap, []).append((flags_evr[1], pkg))
+        self.unsorted.add(cap)
+
+    def sorted_candidates(self, cap):
+        candidates = self.versioned.get(cap, [])
+        if cap in self.unsorted:
+            candidates.sort(key=cmp_to_key(lambda x, y: compare_evr(x[0], y[0])))
+            self.unsorted.discard(cap)
+        return candidates
+
+    # Return the package that best provides 'cap' at the version required
+    # by 'flags_evr', (flags, (epoch, version, release)), or None if 'cap'
+    # is not in the index.
+    # The last writer is kept if it qualifies, else the newest version that
+    # does, else a package providing 'cap' without a version.  If nothing
+    # qualifies, the last writer is returned anyway, and the requirement is
+    # added to 'unsatisfied'.
+    def select(self, cap, flags_evr):
+        last = self.last.get(cap)
+        if last is None:
+            return None
+        (flags, evr) = flags_evr
+        test = evr_flag_tests.get(flags)
+        if test is None or evr[1] is None:
+            return last[0]
+        ignore_release = (evr[2] is None)
+        if last[1] is None or last[1][0] != 'EQ' or test(compare_evr(last[1][1], evr, ignore_release)):
+            return last[0]
+
+        candidates = self.sorted_candidates(cap)
+        # [lo, hi) is the range of candidates equal to 'evr'
+        lo = 0
+        hi = len(candidates)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if compare_evr(candidates[mid][0], evr, ignore_release) < 0:
+                lo = mid + 1
+            else:
+                hi = mid
+        eq_start = lo
+        hi = len(candidates)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if compare_evr(candidates[mid][0], evr, ignore_release) <= 0:
+                lo = mid + 1
+            else:
+                hi = mid
+        eq_end = lo
+
+        end = { 'EQ': eq_end, 'LT': eq_start, 'LE': eq_end }.get(flags, len(candidates))
+        start = { 'GT': eq_end, 'GE': eq_start }.get(flags, 0)
+        if start < end:
+            return candidates[end - 1][1]
+        if cap in self.unversioned:
+            return self.unversioned[cap]
+        self.unsatisfied.add((cap, flags_evr))
+        return last[0]
+
+# Return (epoch, version, release) as a string, [epoch:]version[-release]
+def format_evr(evr):
+    (epoch, version, release) = evr
+    s = version or ""
+    if epoch is not None and epoch != "0":
+        s = "%s:%s" % (epoch, s)
+    if release is not None:
+        s = "%s-%s" % (s, release)
+    return s
+
+
+# Bump whenever the layout of the package records changes, to invalidate
+# the parsed repodata kept in 'repodata_cache_dir'.
+REPODATA_CACHE_VERSION=3
+
+# Size of the chunks the cache files are written in
+WRITE_CHUNK_SIZE=1024*1024
+
+# Bump whenever the content of the --state_file changes
+STATE_VERSION=2
+
+# The maps of pkg_data saved to the --state_file
+state_keys = {'RPM': [ 'requires', 'pkg_direct_requires', 'pkg_direct_descendants',
+                       'pkg_transitive_requires', 'pkg_transitive_descendants' ],
+              'SRPM': [ 'requires', 'pkg_direct_requires', 'pkg_direct_descendants',
+                        'pkg_transitive_requires', 'pkg_transitive_descendants',
+                        'pkg_direct_requires_rpm', 'pkg_transitive_requires_rpm' ]
+             }
+
+# Return the entries of directory 'dir' as a list of (name, is_dir).
+# scandir() gets is_dir from the directory entry on most file systems,
+# where listdir() needs an extra stat of each entry.
+def list_dir(dir):
+    return [(entry.name, entry.is_dir()) for entry in os.scandir(dir)]
+
+# Return a list of (path, level), starting in 'dir', matching 'pattern'.
+# level is the number of directories between 'dir' and the match.
+# A matching directory is not searched any further.
+#    dir= directory to search under
+#    pattern= search for file or directory matching pattern, wildcards allowed
+#    recursive_depth= how many levels of directory before giving up
+#    prune= names of directories not to search
+#    files_only= only match files, search every directory
+def search_tree(dir, pattern, recursive_depth=0, prune=(), files_only=False, level=0):
+    match_list = []
+    for (name, is_dir) in list_dir(dir):
+        path = "%s/%s" % (dir, name)
+        if (not files_only or not is_dir) and fnmatch.fnmatch(name, pattern):
+            match_list.append((path, level))
+        elif (recursive_depth > 0) and is_dir and name not in prune:
+            match_list.extend(search_tree(path, pattern, recursive_depth=recursive_depth - 1,
+                                          prune=prune, files_only=files_only, level=level + 1))
+    return match_list
 
-pkg_data['SRPM']['pkg_direct_requires_rpm']={}
-pkg_data['SRPM']['pkg_transitive_requires_rpm']={}
 
+# Return (user + system cpu time of this process, and of its waited for
+# children), in seconds
+def get_cpu_times():
+    t = os.times()
+    return (t[0] + t[1], t[2] + t[3])
+
+# Return the peak resident set size of this process, and of its largest
+# waited for child, in KB, or (None, None) if not known
+def get_peak_rss():
+    if resource is None:
+        return (None, None)
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+# Time the phase 'name' of the run, and add it to the list 'report'.
+# The with block gets a dict to fill with item counts, e.g.
+#    with timed_phase(report, 'primary', rpm_type='RPM') as counts:
+#        ...
+#        counts['packages'] = n
+@contextlib.contextmanager
+def timed_phase(report, name, rpm_type=None):
+    counts = {}
+    wall = time.time()
+    (cpu, cpu_children) = get_cpu_times()
+    yield counts
+    (cpu_end, cpu_children_end) = get_cpu_times()
+    (peak_rss, peak_rss_children) = get_peak_rss()
+    entry = { 'phase': name,
+              'wall_s': round(time.time() - wall, 3),
+              'cpu_s': round(cpu_end - cpu, 3),
+              'cpu_children_s': round(cpu_children_end - cpu_children, 3),
+              'peak_rss_kb': peak_rss,
+              'peak_rss_children_kb': peak_rss_children,
+              'counts': counts }
+    if rpm_type is not None:
+        entry['rpm_type'] = rpm_type
+    report.append(entry)
+
+# Write the phases of a run, as timed by timed_phase(), and the options of
+# the run to 'report_path', as JSON
+def write_timing_report(report_path, phases, options):
+    report = { 'argv': sys.argv,
+               'options': vars(options),
+               'phases': phases }
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2, separators=(',', ': '), sort_keys=True)
+        f.write("\n")
+    print("timing: report written to %s" % report_path)
+
+# Kinds of problem counted by Diagnostics
+#    unresolved-requirement   nothing provides the requirement
+#    rpm-without-srpm         a required rpm has no source rpm in its repodata
+#    unknown-srpm-file        the source rpm of a required rpm is not in any
+#                             SRPM repodata
+#    no-transitive-requires   a required rpm has no transitive requires, so
+#                             the SRPM list of a package misses its closure
+#    unsatisfied-version      no version of the capability satisfies a
+#                             versioned requirement, so the last package read
+#                             that provides it is used
+UNRESOLVED_REQUIREMENT = 'unresolved-requirement'
+RPM_WITHOUT_SRPM = 'rpm-without-srpm'
+UNKNOWN_SRPM_FILE = 'unknown-srpm-file'
+NO_TRANSITIVE_REQUIRES = 'no-transitive-requires'
+UNSATISFIED_VERSION = 'unsatisfied-version'
+
+# Problems found while working out the dependencies.  Logging each one as it
+# is found makes a full mirror run print hundreds of MB, as the same
+# capability is missed by many packages.  Rather, each problem is keyed by
+# (kind, rpm_type, subject), the subject being the requirement, rpm or srpm
+# file name involved, and the set of packages that hit it is kept.
+# The subject is a name id, or for an unsatisfied-version the pair
+# (capability id, flags_evr), only formatted when the report is written, so
+# the requirements never end up in the StringTable.
+class Diagnostics(object):
+    def __init__(self, strings):
+        self.strings = strings
+        # (kind, rpm_type, subject) -> set of package ids
+        self.entries = {}
+
+    def add(self, kind, rpm_type, subject, name):
+        key = (kind, rpm_type, subject)
+        if key not in self.entries:
+            self.entries[key] = set()
+        self.entries[key].add(name)
+
+    # Return map kind -> (number of subjects, number of packages hit)
+    def counts(self):
+        counts = {}
+        for ((kind, rpm_type, subject), pkgs) in self.entries.items():
+            (subjects, hits) = counts.get(kind, (0, 0))
+            counts[kind] = (subjects + 1, hits + len(pkgs))
+        return counts
+
+    # Return the subject 'subject' as text, e.g. "libfoo GE 2.0-1" for a
+    # (capability id, flags_evr)
+    def format_subject(self, subject):
+        names = self.strings.names
+        if isinstance(subject, tuple):
+            (cap, (flags, evr)) = subject
+            return "%s %s %s" % (names[cap], flags, format_evr(evr))
+        return names[subject]
+
+    # Iterate over the report lines, sorted by kind, rpm_type and subject,
+    #    <kind>;<rpm_type>;<subject>;<number of packages>;<comma-seperated-list-of-packages>
+    def iter_lines(self):
+        names = self.strings.names
+        lines = []
+        for ((kind, rpm_type, subject), pkgs) in self.entries.items():
+            lines.append(((kind, rpm_type, self.format_subject(subject)),
+                          sorted([names[i] for i in pkgs])))
+        lines.sort()
+        for ((kind, rpm_type, subject), pkgs) in lines:
+            yield "%s;%s;%s;%d;%s" % (kind, rpm_type, subject, len(pkgs), ",".join(pkgs))
+
+    # Print one line of counts per kind
+    def print_counts(self):
+        counts = self.counts()
+        if not counts:
+            print("diagnostics: no problems found")
+            return
+        print("diagnostics: %s" % ", ".join(["%d %s (%d packages)" % (counts[kind][0], kind, counts[kind][1])
+                                             for kind in sorted(counts)]))
+
+    # Write the report to 'path', or to stdout if None.
+    #    partial= only some packages were looked at, e.g. by an incremental
+    #             update, so problems may be missing
+    def write(self, path=None, partial=False):
+        header = ["# <kind>;<rpm_type>;<subject>;<number of packages>;<packages>"]
+        if partial:
+            header.append("# incremental update: only the packages recomputed were checked")
+        if path is None:
+            for line in header:
+                print(line)
+            for line in self.iter_lines():
+                print(line)
+            return
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        try:
+            with open(tmp_path, 'w') as f:
+                for line in header:
+                    f.write(line + "\n")
+                for line in self.iter_lines():
+                    f.write(line + "\n")
+            os.rename(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        print("diagnostics: report written to %s" % path)
 
 # Return a list of file paths, starting in 'dir', matching 'pattern'
 #    dir= directory to search under
 #    pattern= search for file or directory matching pattern, wildcards allowed
 #    recursive_depth= how many levels of directory before giving up
-def file_search(dir, pattern, recursive_depth=0):
-    match_list = []
-    new_depth = recursive_depth - 1
-    # print "file_search(%s,%s,%s)" % (dir, pattern, recursive_depth)
-    for file in os.listdir(dir):
-        path = "%s/%s" % (dir, file)
-        if fnmatch.fnmatch(file, pattern):
+def file_search(dir, pattern, recursive_depth=0, quiet=False):
+    match_list = [path for (path, level) in search_tree(dir, pattern, recursive_depth=recursive_depth)]
+    if not quiet:
+        for path in match_list:
             print(path)
-            match_list.append(path)
-        elif (recursive_depth > 0) and os.path.isdir(path):
-            sub_list = []
-            sub_list = file_search(path, pattern, recursive_depth=new_depth)
-            match_list.extend(sub_list)
     return match_list
 
-# Return the list of .../repodate/*primary.xml.gz files
-#    rpm_type= 'RPM' or 'SRPM'
-#    arch= e.g. x86_64, only relevant of rpm_type=='RPM'
-def get_repo_primary_data_list(rpm_type='RPM', arch_list=default_arch_list):
-    rpm_repodata_roots = []
-    repodata_list = []
-
-    if rpm_type == 'RPM':
-        for d in bin_rpm_mirror_roots:
-            if os.path.isdir(d):
-                sub_list = file_search(d, 'repodata', 25)
-                rpm_repodata_roots.extend(sub_list)
-    elif rpm_type == 'SRPM':
-        for d in src_rpm_mirror_roots:
-            if os.path.isdir(d):
-                sub_list = file_search(d, 'repodata', 5)
-                rpm_repodata_roots.extend(sub_list)
-    else:
-        print("invalid rpm_type '%s', valid types are %s" % (rpm_type, str(rpm_types)))
-        return repodata_list
-
-    for d in rpm_repodata_roots:
-        sub_list = file_search(d, '*primary.xml.gz', 2)
-        repodata_list.extend(sub_list)
-   
-    return repodata_list
-
-
-# Return the list of .../repodate/*filelists.xml.gz files
-#    rpm_type= 'RPM' or 'SRPM'
-#    arch= e.g. x86_64, only relevant of rpm_type=='RPM'
-def get_repo_filelists_data_list(rpm_type='RPM', arch_list=default_arch_list):
-    rpm_repodata_roots = []
-    repodata_list = []
-
-    if rpm_type == 'RPM':
-        for d in bin_rpm_mirror_roots:
-            if os.path.isdir(d):
-                sub_list = file_search(d, 'repodata', 25)
-                rpm_repodata_roots.extend(sub_list)
-    elif rpm_type == 'SRPM':
-        for d in src_rpm_mirror_roots:
-            if os.path.isdir(d):
-                sub_list = file_search(d, 'repodata', 5)
-                rpm_repodata_roots.extend(sub_list)
-    else:
-        print "invalid rpm_type '%s', valid types are %s" % (rpm_type, str(rpm_types))
-        return repodata_list
-
-    for d in rpm_repodata_roots:
-       sub_list = file_search(d, '*filelists.xml.gz', 2)
-       repodata_list.extend(sub_list)
-
-    return repodata_list
 
-
-
-# Process a list of repodata files (*filelists.xml.gz) and extract package data.
-# Data is saved to the global 'pkg_data'.
-def read_data_from_repodata_filelists_list(repodata_list, rpm_type='RPM', arch=default_arch):
-    for repodata_path in repodata_list:
-        read_data_from_filelists_xml_gz(repodata_path, rpm_type=rpm_type, arch=arch)
+# Run func(w) for each w of 'work' on up to 'jobs' threads.
+# Returns the results in the order of 'work'.  If any call raises, the
+# first exception is raised again once all threads are done.
+def thread_map(func, work, jobs=1):
+    if jobs <= 1 or len(work) <= 1:
+        return [func(w) for w in work]
+    with concurrent.futures.ThreadPoolExecutor(min(jobs, len(work))) as pool:
+        futures = [pool.submit(func, w) for w in work]
+    return [f.result() for f in futures]
+
+# How deep under each mirror root to look for repodata directories
+repodata_search_depth = { 'RPM': 25, 'SRPM': 5 }
+
+# Directories that never hold a repodata directory, and can be big, e.g.
+# the Packages directory of a binary mirror.
+repodata_prune_dirs = set([ 'Packages', 'SPackages', 'repoview', 'drpms',
+                            'BUILD', 'BUILDROOT', 'SOURCES', 'SPECS',
+                            '.git', '.svn', 'lost+found' ])
+
+
+# Return the metadata files listed in 'repodata_dir'/repomd.xml, as a map
+# data type -> path, e.g. 'primary' -> '.../repodata/<checksum>-primary.xml.gz'
+# Returns None if there is no repomd.xml, or it can't be read.
+def read_repomd(repodata_dir):
+    repomd_path = "%s/repomd.xml" % repodata_dir
+    if not os.path.isfile(repomd_path):
+        return None
+    try:
+        root = ET.parse(repomd_path).getroot()
+    except (IOError, OSError, ET.ParseError) as e:
+        print("WARNING: can't read '%s': %s" % (repomd_path, e))
+        return None
+    # hrefs are relative to the repo, the parent of the repodata directory
+    repo_dir = os.path.dirname(repodata_dir)
+    data = {}
+    for d in root.findall(tags['repo:data']):
+        location = d.find(tags['repo:location'])
+        if location is None or location.get('href') is None:
+            continue
+        data[d.get('type')] = "%s/%s" % (repo_dir, location.get('href'))
+    return data
+
+# Compressions understood for repodata files, see open_repodata()
+repodata_compressions = [ '', '.gz', '.xz', '.bz2', '.zst' ]
+
+# Open a repodata file for reading, decompressing it according to its
+# extension: .gz, .xz, .bz2, .zst, or none.
+def open_repodata(repodata_path):
+    if repodata_path.endswith('.gz'):
+        return gzip.open(repodata_path, 'rb')
+    if repodata_path.endswith('.bz2'):
+        return bz2.BZ2File(repodata_path, 'rb')
+    if repodata_path.endswith('.xz'):
+        if lzma is None:
+            raise IOError("%s: reading .xz files needs the lzma module" % repodata_path)
+        return lzma.LZMAFile(repodata_path, 'rb')
+    if repodata_path.endswith('.zst'):
+        if zstandard is None:
+            raise IOError("%s: reading .zst files needs the zstandard module" % repodata_path)
+        return zstandard.ZstdDecompressor().stream_reader(open(repodata_path, 'rb'), closefd=True)
+    return open(repodata_path, 'rb')
+
+# Iterate over the <package> elements of a repodata xml stream, one at a time.
+# The whole document is never built in memory.  Each element is cleared, and
+# dropped from the root, as soon as the caller asks for the next one, so the
+# memory used stays flat regardless of the size of the repo.
+#    infile= file like object holding the (uncompressed) xml
+#    tag= fully qualified tag of the package element, e.g. '{ns}package'
+def iter_repodata_packages(infile, tag):
+    context = iter(ET.iterparse(infile, events=('start', 'end')))
+    event, root = next(context)
+    for event, elem in context:
+        if event == 'end' and elem.tag == tag:
+            yield elem
+            elem.clear()
+            root.clear()
+
+# What the parsing of a repodata file depends on, besides the file itself.
+# Passed to the worker processes, see parse_repodata_worker().
+#    versioned_requires= keep the version constraints of requires and
+#                        provides, see parse_entry_evrs()
+#    filelists_wanted= set of the file names worth keeping from the
+#                      filelists, None to keep every file
+#    filelists_wanted_digest= digest of 'filelists_wanted', for the key of
+#                             the parsed repodata cache
+#    repodata_cache_dir= keep parsed repodata here, see parse_repodata_file()
+class ParseConfig(object):
+    def __init__(self, versioned_requires=False, filelists_wanted=None,
+                 filelists_wanted_digest=None, repodata_cache_dir=None):
+        self.versioned_requires = versioned_requires
+        self.filelists_wanted = filelists_wanted
+        self.filelists_wanted_digest = filelists_wanted_digest
+        self.repodata_cache_dir = repodata_cache_dir
+
+# Return the bytes read so far from a repodata file.
+# For a compressed file, tell() is the offset in the decompressed stream.
+def count_repodata_bytes(infile):
+    return infile.tell()
+
+# The ParseConfig of a worker process, see init_parse_worker()
+worker_config = None
+
+# Initializer of the worker processes.  The config is inherited by the
+# forked workers, rather than sent along with each file.
+def init_parse_worker(config):
+    global worker_config
+    worker_config = config
+
+# Entry point of the worker processes, see parse_repodata_file()
+def parse_repodata_worker(work):
+    return parse_repodata_file(work, worker_config)
+
+# Parse one repodata file into package records.  If the config has a
+# repodata_cache_dir, records saved by an earlier run are reused as long as
+# the repodata file is unchanged.
+#    work= (repodata_path, kind, arch_list)
+#    config= a ParseConfig
+# Returns (by_arch, bytes_decompressed, cached), by_arch as for
+# read_data_from_*_xml_gz, cached is True if the parse was skipped.
+def parse_repodata_file(work, config):
+    (repodata_path, kind, arch_list) = work
+    key = None
+    if config.repodata_cache_dir:
+        key = get_repodata_cache_key(repodata_path, kind, arch_list, config)
+        by_arch = load_repodata_cache(config.repodata_cache_dir, repodata_path, arch_list, key)
+        if by_arch is not None:
+            return (by_arch, 0, True)
+    (by_arch, nbytes) = repodata_readers[kind](repodata_path, arch_list, config)
+    if key is not None:
+        save_repodata_cache(config.repodata_cache_dir, repodata_path, arch_list, key, by_arch)
+    return (by_arch, nbytes, False)
+
+# Return the path of the parsed data for 'repodata_path' in 'repodata_cache_dir'.
+# A third party repo is read both as 'RPM' and 'SRPM', so the arch list is part
+# of the name.
+def get_repodata_cache_path(repodata_cache_dir, repodata_path, arch_list):
+    name = "%s:%s" % (os.path.abspath(repodata_path), ','.join(arch_list))
+    digest = hashlib.sha1(name.encode('utf-8')).hexdigest()
+    return "%s/%s.pickle" % (repodata_cache_dir, digest)
+
+# Return the key that must match for parsed data to be reused.  Any change
+# to the repodata file shows up as a new mtime or size.
+# Filtered filelists data is only good for the same set of wanted files,
+# and primary data only for the same --versioned_requires setting.
+def get_repodata_cache_key(repodata_path, kind, arch_list, config):
+    st = os.stat(repodata_path)
+    variant = None
+    if kind == 'filelists':
+        variant = config.filelists_wanted_digest
+    elif config.versioned_requires:
+        variant = 'versioned'
+    return (REPODATA_CACHE_VERSION, os.path.abspath(repodata_path), kind,
+            tuple(arch_list), st.st_mtime, st.st_size, variant)
+
+# Return the parsed data saved for 'repodata_path', or None if there is no
+# usable data for 'key'.
+def load_repodata_cache(repodata_cache_dir, repodata_path, arch_list, key):
+    cache_path = get_repodata_cache_path(repodata_cache_dir, repodata_path, arch_list)
+    try:
+        with open(cache_path, 'rb') as f:
+            (saved_key, by_arch) = pickle.load(f)
+    except (IOError, OSError, EOFError, ValueError, TypeError, pickle.UnpicklingError):
+        return None
+    if saved_key != key:
+        return None
+    return by_arch
+
+# Save the parsed data for 'repodata_path'.  Written to a temporary file
+# first, so concurrent runs never see a partial file.
+def save_repodata_cache(repodata_cache_dir, repodata_path, arch_list, key, by_arch):
+    cache_path = get_repodata_cache_path(repodata_cache_dir, repodata_path, arch_list)
+    tmp_path = "%s.%d.tmp" % (cache_path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((key, by_arch), f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, cache_path)
+    except (IOError, OSError) as e:
+        print("WARNING: failed to save parsed repodata '%s': %s" % (cache_path, e))
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
 # Process a single repodata file (*filelists.xml.gz) and extract package data.
-# Data is saved to the global 'pkg_data'.
-def read_data_from_filelists_xml_gz(repodata_path, rpm_type='RPM', arch=default_arch):
+# The file may be compressed in any way open_repodata() knows.
+# Packages of the first arch in 'arch_list' are passed to add(record,
+# repodata_path) right away.  Packages of the other archs are returned in a
+# dict of arch -> [ package records ], for the caller to apply later.
+# With add=None, all archs are returned.
+# Returns (by_arch, bytes_decompressed).
+def read_data_from_filelists_xml_gz(repodata_path, arch_list, config, add=None):
     # print "repodata_path=%s" % repodata_path
-    infile = gzip.open(repodata_path)
-    root = ET.parse(infile).getroot()
-    for pkg in root.findall('filelists:package', ns):
-        name=pkg.get('name')
+    infile = open_repodata(repodata_path)
+    try:
+        by_arch = read_data_from_filelists_xml(infile, repodata_path, arch_list, config, add=add)
+        nbytes = count_repodata_bytes(infile)
+    finally:
+        infile.close()
+    return (by_arch, nbytes)
+
+def read_data_from_filelists_xml(infile, repodata_path, arch_list, config, add=None):
+    by_arch = {}
+    for arch in arch_list:
+        by_arch[arch] = []
+    for pkg in iter_repodata_packages(infile, tags['filelists:package']):
         pkg_arch=pkg.get('arch')
+        if pkg_arch is None or pkg_arch not in arch_list:
+            continue
 
-        version=""
-        release=""
-
-        if arch is not None:
-            if pkg_arch is None:
-                continue
-            if pkg_arch != arch:
-                continue
-
-        v=pkg.find('filelists:version', ns)
-        if v is not None:
-            version=v.get('ver')
-            release=v.get('rel')
+        record = parse_filelists_package(pkg, config.filelists_wanted)
+        if add is not None and pkg_arch == arch_list[0]:
+            add(record, repodata_path)
         else:
-            print("%s: %s.%s has no 'filelists:version'" % (repodata_path, name, pkg_arch))
-
-        # print "%s  %s  %s  %s  " % (name, pkg_arch, version,  release)
-
-        for f in pkg.findall('filelists:file', ns):
-            fn=f.text
-            # print "   fn=%s -> plg=%s" % (fn, name)
-            if not name in pkg_data[rpm_type]['files']:
-                pkg_data[rpm_type]['files'][name]=[]
-            pkg_data[rpm_type]['files'][name].append(fn)
-            if not fn in pkg_data[rpm_type]['file_owners']:
-                pkg_data[rpm_type]['file_owners'][fn]=[]
-            pkg_data[rpm_type]['file_owners'][fn]=name
-
-
-
-
-
-# Process a list of repodata files (*primary.xml.gz) and extract package data.
-# Data is saved to the global 'pkg_data'.
-def read_data_from_repodata_primary_list(repodata_list, rpm_type='RPM', arch=default_arch):
-    for repodata_path in repodata_list:
-        read_data_from_primary_xml_gz(repodata_path, rpm_type=rpm_type, arch=arch)
+            by_arch[pkg_arch].append(record)
+    return by_arch
+
+# Reduce a filelists <package> element to a compact record
+#    (name, arch, version, files)
+# version is None if the package has no version element, files a tuple.
+# If 'wanted' is set, files not in it are left out.
+def parse_filelists_package(pkg, wanted=None):
+    version=None
+    v=pkg.find(tags['filelists:version'])
+    if v is not None:
+        version=v.get('ver')
+    if wanted is None:
+        files = tuple([f.text for f in pkg.findall(tags['filelists:file'])])
+    else:
+        files = tuple([f.text for f in pkg.findall(tags['filelists:file']) if f.text in wanted])
+    return (pkg.get('name'), pkg.get('arch'), version, files)
 
 # Process a single repodata file (*primary.xml.gz) and extract package data.
-# Data is saved to the global 'pkg_data'.
-def read_data_from_primary_xml_gz(repodata_path, rpm_type='RPM', arch=default_arch):
+# The file may be compressed in any way open_repodata() knows, or be a
+# primary sqlite database, see read_data_from_primary_db().
+# Same arguments and result as read_data_from_filelists_xml_gz().
+def read_data_from_primary_xml_gz(repodata_path, arch_list, config, add=None):
     # print "repodata_path=%s" % repodata_path
-    infile = gzip.open(repodata_path)
-    root = ET.parse(infile).getroot()
-    for pkg in root.findall('root:package', ns):
-        name=pkg.find('root:name', ns).text
-        pkg_arch=pkg.find('root:arch', ns).text
-        version=""
-        release=""
-        license=""
-        sourcerpm=""
-
-        if arch is not None:
-            if pkg_arch is None:
-                continue
-            if pkg_arch != arch:
-                continue
+    if is_sqlite_path(repodata_path):
+        return read_data_from_primary_db(repodata_path, arch_list, config, add=add)
+    infile = open_repodata(repodata_path)
+    try:
+        by_arch = read_data_from_primary_xml(infile, repodata_path, arch_list, config, add=add)
+        nbytes = count_repodata_bytes(infile)
+    finally:
+        infile.close()
+    return (by_arch, nbytes)
+
+def read_data_from_primary_xml(infile, repodata_path, arch_list, config, add=None):
+    by_arch = {}
+    for arch in arch_list:
+        by_arch[arch] = []
+    for pkg in iter_repodata_packages(infile, tags['root:package']):
+        pkg_arch=pkg.find(tags['root:arch']).text
+        if pkg_arch is None or pkg_arch not in arch_list:
+            continue
+
+        record = parse_primary_package(pkg, config.versioned_requires)
+        if add is not None and pkg_arch == arch_list[0]:
+            add(record, repodata_path)
+        else:
+            by_arch[pkg_arch].append(record)
+    return by_arch
+
+# Is 'repodata_path' a sqlite database, as listed by repomd.xml as primary_db
+def is_sqlite_path(repodata_path):
+    for ext in repodata_compressions:
+        if repodata_path.endswith('.sqlite' + ext):
+            return True
+    return False
+
+# Same as read_data_from_primary_xml_gz(), for a primary sqlite database.
+# A compressed database is first decompressed to a temporary file.
+def read_data_from_primary_db(repodata_path, arch_list, config, add=None):
+    db_path = repodata_path
+    tmp_path = None
+    try:
+        if not repodata_path.endswith('.sqlite'):
+            (fd, tmp_path) = tempfile.mkstemp(suffix='.sqlite')
+            with os.fdopen(fd, 'wb') as outfile:
+                infile = open_repodata(repodata_path)
+                try:
+                    shutil.copyfileobj(infile, outfile, WRITE_CHUNK_SIZE)
+                finally:
+                    infile.close()
+            db_path = tmp_path
+        nbytes = os.path.getsize(db_path)
+        conn = sqlite3.connect(db_path)
+        try:
+            # plain str, as from the xml parser
+            conn.text_factory = str
+            by_arch = read_data_from_primary_db_connection(conn, repodata_path, arch_list, config, add=add)
+        finally:
+            conn.close()
+    finally:
+        if tmp_path is not None:
+            os.remove(tmp_path)
+    return (by_arch, nbytes)
+
+def read_data_from_primary_db_connection(conn, repodata_path, arch_list, config, add=None):
+    by_arch = {}
+    for arch in arch_list:
+        by_arch[arch] = []
+    arch_filter = "SELECT pkgKey FROM packages WHERE arch IN (%s)" % ','.join('?' * len(arch_list))
+
+    # map pkgKey -> [ row ] for each table, rows in the order of the xml
+    rows = {}
+    for (table, columns) in [ ('requires', 'name, flags, epoch, version, release'),
+                              ('provides', 'name, flags, epoch, version, release'),
+                              ('files', 'name') ]:
+        rows[table] = {}
+        query = "SELECT pkgKey, %s FROM %s WHERE pkgKey IN (%s) ORDER BY pkgKey, rowid" % (columns, table, arch_filter)
+        for row in conn.execute(query, arch_list):
+            rows[table].setdefault(row[0], []).append(row[1:])
+
+    query = "SELECT pkgKey, name, arch, epoch, version, release, rpm_sourcerpm FROM packages WHERE arch IN (%s) ORDER BY pkgKey" % ','.join('?' * len(arch_list))
+    for (pkg_key, name, pkg_arch, epoch, version, release, sourcerpm) in conn.execute(query, arch_list):
+        # empty lists are left out of the xml
+        requires = None
+        requires_evr = None
+        if pkg_key in rows['requires']:
+            requires = tuple([sys.intern(r[0]) for r in rows['requires'][pkg_key]])
+            if config.versioned_requires:
+                requires_evr = make_entry_evrs([r[1:] for r in rows['requires'][pkg_key]])
+        provides = None
+        provides_evr = None
+        if pkg_key in rows['provides']:
+            provides = tuple([sys.intern(p[0]) for p in rows['provides'][pkg_key]])
+            if config.versioned_requires:
+                provides_evr = make_entry_evrs([p[1:] for p in rows['provides'][pkg_key]])
+        files = tuple([f[0] for f in rows['files'].get(pkg_key, ())])
+        fmt = (sourcerpm or None, requires, provides, files, requires_evr, provides_evr)
+        record = (name, pkg_arch, version, release, fmt, epoch)
+        if add is not None and pkg_arch == arch_list[0]:
+            add(record, repodata_path)
+        else:
+            by_arch[pkg_arch].append(record)
+    return by_arch
+
+# Reduce a primary <package> element to a compact record
+#    (name, arch, version, release, format, epoch)
+# where format is None if the package has no format element, else
+#    (sourcerpm, requires, provides, files, requires_evr, provides_evr)
+# version, release and epoch are None if the package has no version element.
+# requires, provides and files are tuples, requires and provides None if
+# the element is absent.  The names in requires and provides are
+# sys.intern()ed, as a few capabilities are named by most packages.
+# requires_evr and provides_evr are only set with 'versioned_requires', see
+# parse_entry_evrs().
+def parse_primary_package(pkg, versioned_requires=False):
+    version=None
+    release=None
+    epoch=None
+    v=pkg.find(tags['root:version'])
+    if v is not None:
+        version=v.get('ver')
+        release=v.get('rel')
+        epoch=v.get('epoch')
+
+    fmt=None
+    f=pkg.find(tags['root:format'])
+    if f is not None:
+        sourcerpm=f.find(tags['rpm:sourcerpm']).text
+        requires=None
+        requires_evr=None
+        r=f.find(tags['rpm:requires'])
+        if r is not None:
+            entries = r.findall(tags['rpm:entry'])
+            requires = tuple([sys.intern(rr.get('name')) for rr in entries])
+            requires_evr = parse_entry_evrs(entries, versioned_requires)
+        provides=None
+        provides_evr=None
+        p=f.find(tags['rpm:provides'])
+        if p is not None:
+            entries = p.findall(tags['rpm:entry'])
+            provides = tuple([sys.intern(pp.get('name')) for pp in entries])
+            provides_evr = parse_entry_evrs(entries, versioned_requires)
+        files = tuple([fn.text for fn in f.findall(tags['root:file'])])
+        fmt = (sourcerpm, requires, provides, files, requires_evr, provides_evr)
+
+    return (pkg.find(tags['root:name']).text, pkg.find(tags['root:arch']).text, version, release, fmt, epoch)
+
+# Return the set of file paths required by any primary record of
+# 'parsed_records', see DependancyCache.  Only a path can be resolved by a
+# file owner.
+def get_required_paths(parsed_records):
+    paths = set()
+    for ((kind, repodata_path, arch_list), by_arch) in parsed_records.items():
+        if kind != 'primary':
+            continue
+        for records in by_arch.values():
+            for (name, pkg_arch, version, release, fmt, epoch) in records:
+                if fmt is not None and fmt[1] is not None:
+                    paths.update([req for req in fmt[1] if req.startswith('/')])
+    return paths
+
+# Return the version constraints of a list of <rpm:entry> elements, as a
+# list of (flags, (epoch, version, release)), or None for an entry without
+# flags.  Returns None if no entry has flags, or without 'versioned_requires'.
+def parse_entry_evrs(entries, versioned_requires=False):
+    if not versioned_requires:
+        return None
+    return make_entry_evrs([(e.get('flags'), e.get('epoch'), e.get('ver'), e.get('rel')) for e in entries])
+
+# Same as parse_entry_evrs(), for a list of (flags, epoch, version, release)
+def make_entry_evrs(entries):
+    evrs = []
+    versioned = False
+    for (flags, epoch, version, release) in entries:
+        if flags is None:
+            evrs.append(None)
+        else:
+            versioned = True
+            evrs.append((flags, (epoch, version, release)))
+    if not versioned:
+        return None
+    return evrs
+
+# The reader of each kind of repodata file
+repodata_readers = { 'primary': read_data_from_primary_xml_gz,
+                     'filelists': read_data_from_filelists_xml_gz }
+
+# Key of a requirement in the map returned by get_resolved_requirements()
+def requirement_key(req, flags_evr):
+    if flags_evr is None:
+        return req
+    return (req, flags_evr)
+
+# Return map node -> array('I') of the nodes reachable from that node over
+# one or more edges.  A node only reaches itself if it is part of a cycle.
+#    graph= map node id -> list of successor node ids.
+#    nodes= only compute the closures of these nodes.  Every strongly
+#           connected component must be either wholly in or wholly out.
+#    known= map node -> closure, for the successors outside 'nodes'.  A
+#           node missing from it reaches nothing.
+# The closure of each strongly connected component is computed once, as a set,
+# from the closures of the components it points to.  It is then stored as an
+# array shared by all of its members.  Treat the returned arrays as read only.
+# A successor already reached is in the closure of one merged before, and so
+# is its own closure: only the others are merged, the largest first, as they
+# leave the most of the others to skip.
+def transitive_closure(graph, nodes=None, known=None):
+    if nodes is not None:
+        graph_of_nodes = {}
+        for node in nodes:
+            graph_of_nodes[node] = [succ for succ in graph.get(node, ()) if succ in nodes]
+    else:
+        graph_of_nodes = graph
+    if known is None:
+        known = {}
+    closure = {}
+    for component in strongly_connected_components(graph_of_nodes):
+        members = set(component)
+        reach = set()
+        merges = []
+        for node in component:
+            for succ in graph.get(node, ()):
+                if succ in members:
+                    reach.add(succ)
+                    continue
+                succ_reach = closure.get(succ)
+                if succ_reach is None:
+                    succ_reach = known.get(succ, ())
+                merges.append((len(succ_reach), succ, succ_reach))
+        if len(merges) > 1:
+            merges.sort(key=lambda m: m[0], reverse=True)
+        for (n, succ, succ_reach) in merges:
+            if succ not in reach:
+                reach.add(succ)
+                reach.update(succ_reach)
+        reach = array('I', reach)
+        for node in component:
+            closure[node] = reach
+    return closure
+
+# Return a memo for shared_sorted_names(), with a slot for every list of
+# 'id_map' that is shared by more than one key.
+def shared_lists_memo(id_map):
+    seen = set()
+    memo = {}
+    for ids in id_map.values():
+        key = id(ids)
+        if key in seen:
+            memo[key] = None
+        else:
+            seen.add(key)
+    return memo
 
-        pkg_data[rpm_type]['providers'][name]=name
-        pkg_data[rpm_type]['files'][name]=[]
-        pkg_data[rpm_type]['requires'][name] = []
-        pkg_data[rpm_type]['requires'][name].append(name)
+# Return the names of the files written to the cache directory
+def get_cache_names():
+    cache_names = []
+    for rpm_type in rpm_types:
+        cache_names.append("%s-direct-requires" % rpm_type)
+        cache_names.append("%s-direct-descendants" % rpm_type)
+        cache_names.append("%s-transitive-requires" % rpm_type)
+        cache_names.append("%s-transitive-descendants" % rpm_type)
+        if rpm_type != 'RPM':
+            cache_names.append("%s-direct-requires-rpm" % rpm_type)
+            cache_names.append("%s-transitive-requires-rpm" % rpm_type)
+    cache_names.append("rpm-to-srpm")
+    cache_names.append("srpm-to-rpm")
+    return cache_names
+
+# Sequential access to the lines of an existing cache file, by name.
+# Names must be asked for in sorted order, same as the lines of the file.
+class CacheFileLines(object):
+    def __init__(self, path):
+        self.f = open(path, "r")
+        self.next_line()
+
+    def next_line(self):
+        self.line = self.f.readline()
+        self.name = self.line[:self.line.find(';')]
+
+    # Return the line of 'name', or None if the file has no line for it
+    def get(self, name):
+        while self.line and self.name < name:
+            self.next_line()
+        if self.line and self.name == name:
+            return self.line
+        return None
+
+    def close(self):
+        self.f.close()
+
+# Return the sha256 hex digest of the file at 'path'
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(WRITE_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Rename 'tmp_path' to 'path', unless the file at 'path' already has the
+# same content, in which case it is left untouched, mtime included.
+#    sha256= digest of 'tmp_path', if known
+# Returns True if 'path' was replaced.  'tmp_path' is gone either way.
+def replace_if_changed(tmp_path, path, sha256=None):
+    if os.path.exists(path) and os.path.getsize(path) == os.path.getsize(tmp_path):
+        if sha256 is None:
+            sha256 = hash_file(tmp_path)
+        if hash_file(path) == sha256:
+            os.remove(tmp_path)
+            return False
+    os.rename(tmp_path, path)
+    return True
+
+# Write the lines in 'chunk' to the binary file 'f', and add them to the
+# hashlib 'digest'
+def write_chunk(f, digest, chunk):
+    data = "".join(chunk).encode('utf-8')
+    digest.update(data)
+    f.write(data)
+
+# Write a zstd compressed copy of the file at 'path' to 'path'.zst
+def write_compressed(path):
+    zst_path = path + COMPRESSED_SUFFIX
+    tmp_path = "%s.%d.tmp" % (zst_path, os.getpid())
+    try:
+        with open(path, 'rb') as infile:
+            with open(tmp_path, 'wb') as outfile:
+                zstandard.ZstdCompressor().copy_stream(infile, outfile, read_size=WRITE_CHUNK_SIZE)
+        os.rename(tmp_path, zst_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return zst_path
+
+# Write the --manifest of 'cache_dir', one line per file as sha256sum does,
+#    <sha256>  <file name>
+#    sha256s= map file name -> sha256
+# The manifest itself is only rewritten if it changed.
+def write_manifest(cache_dir, sha256s):
+    manifest_path = "%s/%s" % (cache_dir, MANIFEST_NAME)
+    tmp_path = "%s.%d.tmp" % (manifest_path, os.getpid())
+    try:
+        with open(tmp_path, 'w') as f:
+            for name in sorted(sha256s):
+                f.write("%s  %s\n" % (sha256s[name], name))
+        replace_if_changed(tmp_path, manifest_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return manifest_path
+
+# Return a value that changes whenever the file at 'path' is rewritten
+def get_output_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime)
+
+def array_from_bytes(b):
+    a = array('I')
+    a.frombytes(b)
+    return a
+
+# Return 'id_map', a map id -> list of ids, in a form that pickles quickly,
+# as (keys, refs, blobs).  A list shared by several keys is saved once.
+def pack_id_map(id_map):
+    keys = array('I')
+    refs = array('I')
+    blobs = []
+    blob_of = {}
+    for (name, ids) in id_map.items():
+        i = blob_of.get(id(ids))
+        if i is None:
+            i = len(blobs)
+            blob_of[id(ids)] = i
+            blobs.append(array('I', ids).tobytes())
+        keys.append(name)
+        refs.append(i)
+    return (keys.tobytes(), refs.tobytes(), blobs)
+
+# Reverse pack_id_map().  The lists come back as array('I').
+def unpack_id_map(packed):
+    (keys, refs, blobs) = packed
+    arrays = [array_from_bytes(b) for b in blobs]
+    return dict(zip(array_from_bytes(keys), [arrays[i] for i in array_from_bytes(refs)]))
+
+# Return the set of nodes reachable from 'start', 'start' included
+#    graphs= list of maps node -> list of successor nodes
+def get_reachable(start, graphs):
+    reached = set(start)
+    work = list(start)
+    while work:
+        node = work.pop()
+        for graph in graphs:
+            for succ in graph.get(node, ()):
+                if succ not in reached:
+                    reached.add(succ)
+                    work.append(succ)
+    return reached
+
+# Recompute the closures of the 'affected' nodes of 'graph' in 'closures'.
+# The closures of all other nodes must still be valid.
+# Returns the set of nodes whose closure did change.
+def update_transitive_closure(closures, graph, affected):
+    closure = transitive_closure(graph, nodes=affected, known=closures)
+    changed = set()
+    same = {}
+    for name in affected:
+        old = closures.pop(name, None)
+        if name not in graph:
+            if old is not None:
+                changed.add(name)
+            continue
+        new = closure[name]
+        closures[name] = new
+        if old is None:
+            changed.add(name)
+            continue
+        # closures are shared, compare each pair once
+        key = (id(old), id(new))
+        if key not in same:
+            same[key] = (len(old) == len(new) and set(old) == set(new))
+        if not same[key]:
+            changed.add(name)
+    return changed
+
+# Return True if the lists of ids 'a' and 'b' hold the same ids, in any order
+def same_ids(a, b):
+    return a is not None and b is not None and sorted(a) == sorted(b)
+
+# Iterate over (a, b) for each b in id_map[a], with 'prefix' prepended
+def iter_db_pairs(id_map, prefix=()):
+    for (name, ids) in id_map.items():
+        for i in ids:
+            yield prefix + (name, i)
+
+# Iterate over (rpm_type, key) for each key of 'id_map'
+def iter_db_keys(id_map, rpm_type='RPM'):
+    for name in id_map:
+        yield (rpm_type, name)
+
+# Iterate over (rpm_type, key, value) for each item of 'id_map'
+def iter_db_items(id_map, rpm_type='RPM'):
+    for (name, i) in id_map.items():
+        yield (rpm_type, name, i)
+
+# The dependency cache engine.  It reads the repodata found under the
+# mirror roots, works out the requires and descendants of every package,
+# and writes them to the cache files, or answers queries on them.
+#    mirror_roots= map rpm_type -> [ directory searched for repodata ],
+#                  see make_mirror_roots()
+#    options= as parsed from the command line, see get_default_options().
+#             Raises ValueError for options that can't be used.
+#    build_type_roots= map build_type -> mirror_roots of that build type
+#             alone, for the --build_types caches, see make_build_type_view()
+#    strings= a StringTable shared with an other instance, by default a
+#             new one
+# All state lives in the instance, so several can be used side by side.
+#
+# Typical use:
+#    cache = DependancyCache(mirror_roots, options)
+#    cache.build()                 read the repodata, compute the graph
+#    cache.query('RPM-transitive-requires', 'bash')
+# or, as the command line does,
+#    cache.create_cache(cache_dir) also write the cache files, save state, ...
+class DependancyCache(object):
+    def __init__(self, mirror_roots, options=None, build_type_roots=None, strings=None):
+        if options is None:
+            options = get_default_options()
+        validate_options(options)
+        self.mirror_roots = mirror_roots
+        self.options = options
+        self.quiet = options.quiet
+        self.repodata_cache_dir = options.repodata_cache_dir
+        self.build_type_roots = build_type_roots or {}
+
+        # Table of the names, capabilities and rpm file names, see StringTable
+        if strings is None:
+            strings = StringTable()
+        self.strings = strings
+
+        # The Main data structure.  Names are held as ids into 'strings',
+        # lists of names as array('I') of ids.
+        self.pkg_data = {}
+        for rpm_type in rpm_types:
+            self.pkg_data[rpm_type] = {}
+
+            # map provided_name -> pkg_name
+            self.pkg_data[rpm_type]['providers']={}
+
+            # map pkg_name -> required_names ... could be a pkg, capability or file
+            self.pkg_data[rpm_type]['requires']={}
+
+            # map file_name -> pkg_name ... file_name is a plain string, not an id.
+            # Nearly every file path is unique, so interning them would cost more
+            # memory than it saves.
+            self.pkg_data[rpm_type]['file_owners']={}
+
+            # map pkg_name -> required_pkg_names ... only pkg names, and only direct requirement
+            self.pkg_data[rpm_type]['pkg_direct_requires']={}
+
+            # map pkg_name -> required_pkg_names ... only pkg names, but this is the transitive list of all requirements
+            # For RPMS this is an array shared by all packages of a dependency cycle, and
+            # so includes the package itself if it is part of a cycle.
+            self.pkg_data[rpm_type]['pkg_transitive_requires']={}
+
+            # map pkg_name -> descendant_pkgs ... only packages the directly require this package
+            self.pkg_data[rpm_type]['pkg_direct_descendants']={}
+
+            # map pkg_name -> descendant_pkgs ... packages that have a transitive requiremant on this package
+            # An array shared by all packages of a dependency cycle, see 'pkg_transitive_requires'
+            self.pkg_data[rpm_type]['pkg_transitive_descendants']={}
+
+            # Map package name to a source rpm file name
+            self.pkg_data[rpm_type]['sourcerpm']={}
+            self.pkg_data[rpm_type]['binrpm']={}
+
+            # Map file name to package name
+            self.pkg_data[rpm_type]['fn_to_name']={}
+
+            # map pkg_name -> version constraints of 'requires', with --versioned_requires.
+            # A list parallel to 'requires', with None for an unversioned requirement.
+            # Absent if none of the requirements of the package is versioned.
+            self.pkg_data[rpm_type]['requires_evr']={}
+
+        # Requirements are only ever resolved against rpms
+        self.pkg_data['RPM']['provider_index']=ProviderIndex(self.strings)
+
+        self.pkg_data['SRPM']['pkg_direct_requires_rpm']={}
+        self.pkg_data['SRPM']['pkg_transitive_requires_rpm']={}
+
+        # Running totals for the repodata parsed so far
+        self.repodata_stats={'files': 0, 'bytes_decompressed': 0, 'cached': 0}
+
+        # With --lazy_filelists, the set of file names worth keeping from the
+        # filelists, and a digest of it for the parsed repodata cache key.
+        # None means keep every file.
+        self.filelists_wanted=None
+        self.filelists_wanted_digest=None
+
+        # Result of discover_repodata(), see there
+        self.repodata_discovery = None
+
+        # map (kind, repodata_path, arch_list) -> records by arch, of every
+        # repodata file parsed, so they can be applied again to the
+        # build type views.  None if there are no views to build.
+        self.parsed_records = None
+        if self.build_type_roots:
+            self.parsed_records = {}
+
+        # One entry per finished phase, for --timing_report, see timed_phase()
+        self.phase_report = []
+
+        # map cache file name -> write_cache_file() arguments, for query()
+        self.cache_maps = None
+
+        # Problems found by the last calculate()
+        self.diagnostics = Diagnostics(self.strings)
+
+    # Return the mirror roots searched for repodata of type 'rpm_type'
+    def get_mirror_roots(self, rpm_type='RPM'):
+        return self.mirror_roots[rpm_type]
+
+    # Find every repodata directory under the mirror roots of all rpm types,
+    # and the files in each.  The roots are searched in parallel, and a root
+    # searched for several rpm types is searched only once, to the greatest
+    # depth.  The result is kept for the rest of the run, as
+    #    (map root -> [ (repodata_dir, level) ], map repodata_dir -> [ path ],
+    #     map repodata_dir -> map from read_repomd())
+    def discover_repodata(self):
+        if self.repodata_discovery is not None:
+            return self.repodata_discovery
+
+        roots = []
+        depth = {}
+        for rpm_type in rpm_types:
+            for d in self.get_mirror_roots(rpm_type):
+                if d not in depth:
+                    if not os.path.isdir(d):
+                        continue
+                    roots.append(d)
+                    depth[d] = 0
+                depth[d] = max(depth[d], repodata_search_depth[rpm_type])
+
+        jobs = self.options.discovery_jobs
+        results = thread_map(lambda d: search_tree(d, 'repodata', recursive_depth=depth[d], prune=repodata_prune_dirs),
+                             roots, jobs=jobs)
+        repodata_dirs = dict(zip(roots, results))
+
+        dirs = []
+        for d in roots:
+            for (path, level) in repodata_dirs[d]:
+                if path not in dirs:
+                    dirs.append(path)
+        results = thread_map(lambda d: [path for (path, level) in search_tree(d, '*', recursive_depth=2, files_only=True)],
+                             dirs, jobs=jobs)
+        repodata_files = dict(zip(dirs, results))
+        repomd = dict(zip(dirs, thread_map(read_repomd, dirs, jobs=jobs)))
+
+        self.repodata_discovery = (repodata_dirs, repodata_files, repomd)
+        return self.repodata_discovery
+
+    # Return the list of repodata files of the given data types, one per
+    # repodata directory at most.
+    #    data_types= repomd.xml data types, in order of preference, e.g.
+    #                [ 'primary_db', 'primary' ]
+    #    rpm_type= 'RPM' or 'SRPM'
+    # The file is the one repomd.xml lists for the first of 'data_types' it
+    # has.  Only without a repomd.xml is the directory searched for files named
+    # *<data_type>.xml, with any of 'repodata_compressions'.
+    def get_repodata_file_list(self, data_types, rpm_type='RPM'):
+        repodata_list = []
+        if rpm_type not in repodata_search_depth:
+            print("invalid rpm_type '%s', valid types are %s" % (rpm_type, str(rpm_types)))
+            return repodata_list
+
+        (repodata_dirs, repodata_files, repomd) = self.discover_repodata()
+        patterns = [ "*%s.xml%s" % (data_types[-1], ext) for ext in repodata_compressions ]
+        for d in self.get_mirror_roots(rpm_type):
+            for (path, level) in repodata_dirs.get(d, ()):
+                if level > repodata_search_depth[rpm_type]:
+                    continue
+                found = []
+                if repomd[path] is not None:
+                    for data_type in data_types:
+                        fn = repomd[path].get(data_type)
+                        if fn is None:
+                            continue
+                        if os.path.isfile(fn):
+                            found.append(fn)
+                        else:
+                            print("WARNING: %s/repomd.xml lists missing file '%s'" % (path, fn))
+                        break
+                else:
+                    for fn in repodata_files[path]:
+                        name = os.path.basename(fn)
+                        if any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+                            found.append(fn)
+                for fn in found:
+                    if not self.quiet:
+                        print(fn)
+                    repodata_list.append(fn)
+        return repodata_list
 
-        url=pkg.find('root:url', ns).text
-        v=pkg.find('root:version', ns)
-        if v is not None:
-            version=v.get('ver')
-            release=v.get('rel')
+    # Return the list of .../repodate/*primary.xml.gz files, or with
+    # --primary_db the primary sqlite database where there is one.
+    #    rpm_type= 'RPM' or 'SRPM'
+    #    arch= e.g. x86_64, only relevant of rpm_type=='RPM'
+    def get_repo_primary_data_list(self, rpm_type='RPM', arch_list=default_arch_list):
+        if self.options.primary_db:
+            return self.get_repodata_file_list([ 'primary_db', 'primary' ], rpm_type=rpm_type)
+        return self.get_repodata_file_list([ 'primary' ], rpm_type=rpm_type)
+
+    # Return the list of .../repodate/*filelists.xml.gz files
+    #    rpm_type= 'RPM' or 'SRPM'
+    #    arch= e.g. x86_64, only relevant of rpm_type=='RPM'
+    def get_repo_filelists_data_list(self, rpm_type='RPM', arch_list=default_arch_list):
+        return self.get_repodata_file_list([ 'filelists' ], rpm_type=rpm_type)
+
+    # Return the ParseConfig for the repodata files read from now on
+    def get_parse_config(self):
+        return ParseConfig(versioned_requires=self.options.versioned_requires,
+                           filelists_wanted=self.filelists_wanted,
+                           filelists_wanted_digest=self.filelists_wanted_digest,
+                           repodata_cache_dir=self.repodata_cache_dir)
+
+    # Account for a fully read repodata file in 'repodata_stats'
+    def count_repodata(self, nbytes):
+        self.repodata_stats['files'] += 1
+        self.repodata_stats['bytes_decompressed'] += nbytes
+
+    # Process a list of repodata files and extract package data into 'pkg_data'.
+    #    kind= 'primary' or 'filelists'
+    #    arch_list= the archs of interest.  Each file is only parsed once; the
+    #               packages are sorted into a bucket per arch, and the buckets
+    #               are applied in arch_list order, same as one pass per arch.
+    #    jobs= number of worker processes used to parse the files.  Workers only
+    #          return package records; the records are applied here, in file
+    #          order, so the result is the same as a serial run.
+    # With 'parsed_records', the records of each file are kept there, and
+    # those of a file already in it are applied without parsing it again.
+    def read_data_from_repodata_list(self, repodata_list, kind, rpm_type='RPM', arch_list=default_arch_list, jobs=1):
+        add_package = { 'primary': self.add_primary_package,
+                        'filelists': self.add_filelists_package }[kind]
+        add = lambda record, repodata_path: add_package(record, repodata_path, rpm_type=rpm_type)
+        config = self.get_parse_config()
+        store = self.parsed_records
+        deferred = []
+        if store is not None or (jobs > 1 and len(repodata_list) > 1) or config.repodata_cache_dir:
+            keys = [(kind, repodata_path, tuple(arch_list)) for repodata_path in repodata_list]
+            stored = [store is not None and key in store for key in keys]
+            work = [(repodata_path, kind, arch_list) for (repodata_path, is_stored) in zip(repodata_list, stored)
+                    if not is_stored]
+            pool = None
+            if jobs > 1 and len(work) > 1:
+                pool = multiprocessing.Pool(min(jobs, len(work)), init_parse_worker, (config,))
+                results = pool.imap(parse_repodata_worker, work)
+            else:
+                results = (parse_repodata_file(w, config) for w in work)
+            try:
+                for (repodata_path, key, is_stored) in zip(repodata_list, keys, stored):
+                    if is_stored:
+                        by_arch = store[key]
+                    else:
+                        (by_arch, nbytes, cached) = next(results)
+                        if cached:
+                            self.repodata_stats['cached'] += 1
+                        else:
+                            self.count_repodata(nbytes)
+                        if store is not None:
+                            store[key] = by_arch
+                    if store is None:
+                        first = by_arch.pop(arch_list[0])
+                    else:
+                        first = by_arch[arch_list[0]]
+                    for pkg in first:
+                        add(pkg, repodata_path)
+                    deferred.append((repodata_path, by_arch))
+            finally:
+                if pool is not None:
+                    pool.close()
+                    pool.join()
         else:
+            for repodata_path in repodata_list:
+                (by_arch, nbytes) = repodata_readers[kind](repodata_path, arch_list, config, add=add)
+                self.count_repodata(nbytes)
+                deferred.append((repodata_path, by_arch))
+        for arch in arch_list[1:]:
+            for repodata_path, by_arch in deferred:
+                for pkg in by_arch[arch]:
+                    add(pkg, repodata_path)
+
+    # Process a list of repodata files (*filelists.xml.gz) and extract package data.
+    def read_data_from_repodata_filelists_list(self, repodata_list, rpm_type='RPM', arch_list=default_arch_list, jobs=1):
+        self.read_data_from_repodata_list(repodata_list, 'filelists', rpm_type=rpm_type, arch_list=arch_list, jobs=jobs)
+
+    # Process a list of repodata files (*primary.xml.gz) and extract package data.
+    def read_data_from_repodata_primary_list(self, repodata_list, rpm_type='RPM', arch_list=default_arch_list, jobs=1):
+        self.read_data_from_repodata_list(repodata_list, 'primary', rpm_type=rpm_type, arch_list=arch_list, jobs=jobs)
+
+    # Save a filelists package record to 'pkg_data'.
+    def add_filelists_package(self, record, repodata_path, rpm_type='RPM'):
+        (name, pkg_arch, version, files) = record
+        if version is None:
+            print("%s: %s.%s has no 'filelists:version'" % (repodata_path, name, pkg_arch))
+
+        name_id = self.strings.intern(name)
+        file_owners = self.pkg_data[rpm_type]['file_owners']
+        for fn in files:
+            # print "   fn=%s -> plg=%s" % (fn, name)
+            file_owners[fn]=name_id
+
+    # Save a primary package record to 'pkg_data'.
+    def add_primary_package(self, record, repodata_path, rpm_type='RPM'):
+        (name, pkg_arch, version, release, fmt, epoch) = record
+        pkg_data = self.pkg_data
+        strings = self.strings
+        providers = pkg_data[rpm_type]['providers']
+        file_owners = pkg_data[rpm_type]['file_owners']
+
+        name_id = strings.intern(name)
+        providers[name_id]=name_id
+        requires = array('I', [name_id])
+        pkg_data[rpm_type]['requires'][name_id] = requires
+        provider_index = None
+        if self.options.versioned_requires:
+            pkg_data[rpm_type]['requires_evr'].pop(name_id, None)
+            if rpm_type == 'RPM':
+                provider_index = pkg_data[rpm_type]['provider_index']
+                provider_index.add(name_id, name_id, ('EQ', (epoch, version, release)))
+
+        if version is None:
+            version=""
+            release=""
             print("%s: %s.%s has no 'root:version'" % (repodata_path, name, pkg_arch))
 
-        fn="%s-%s-%s.%s.rpm" % (name, version, release, arch)
-        pkg_data[rpm_type]['fn_to_name'][fn]=name
+        fn="%s-%s-%s.%s.rpm" % (name, version, release, pkg_arch)
+        pkg_data[rpm_type]['fn_to_name'][strings.intern(fn)]=name_id
 
         # SAL print "%s  %s  %s  %s  " % (name, pkg_arch, version,  release)
-        print("%s  %s  %s  %s  " % (name, pkg_arch, version,  release))
-        f=pkg.find('root:format', ns)
-        if f is not None:
-            license=f.find('rpm:license', ns).text
-            sourcerpm=f.find('rpm:sourcerpm', ns).text
+        if not self.quiet:
+            print("%s  %s  %s  %s  " % (name, pkg_arch, version,  release))
+        if fmt is not None:
+            (sourcerpm, required_names, provided_names, files, requires_evr, provides_evr) = fmt
             if sourcerpm != "":
-                pkg_data[rpm_type]['sourcerpm'][name] = sourcerpm
+                pkg_data[rpm_type]['sourcerpm'][name_id] = strings.intern(sourcerpm)
             # SAL print "--- requires ---"
-            print("--- requires ---")
-            r=f.find('rpm:requires', ns)
-            if r is not None:
-                for rr in r.findall('rpm:entry', ns):
-                    required_name=rr.get('name')
-                    # SAL print "    %s" % required_name
-                    print "    %s" % required_name
-                    pkg_data[rpm_type]['requires'][name].append(required_name)
+            if not self.quiet:
+                print("--- requires ---")
+            if required_names is not None:
+                if not self.quiet:
+                    for required_name in required_names:
+                        print("    %s" % required_name)
+                requires.extend([strings.intern(required_name) for required_name in required_names])
             else:
                 print("%s: %s.%s has no 'rpm:requires'" % (repodata_path, name, pkg_arch))
+            if requires_evr is not None:
+                # one more slot, for the package itself at the start of requires
+                pkg_data[rpm_type]['requires_evr'][name_id] = [None] + requires_evr
+
+            # A kernel-rt* package never takes over a capability or file from the
+            # matching kernel* package.  Those are dropped up front, once per
+            # package, so the loops below don't check every entry.
+            alt_id=None
+            if name.startswith('kernel-rt'):
+                alt_id=strings.lookup(name.replace('kernel-rt', 'kernel'))
+
             # print "--- provides ---"
-            p=f.find('rpm:provides', ns)
-            if p is not None:
-                for pp in p.findall('rpm:entry', ns):
-                    provided_name=pp.get('name')
-                    # print "    %s" % provided_name
-                    if name == "kernel-rt" and provided_name in pkg_data[rpm_type]['providers'] and pkg_data[rpm_type]['providers'][provided_name] == "kernel":
-                        continue
-                    if name.startswith('kernel-rt'):
-                        alt_name=string.replace(name, 'kernel-rt', 'kernel')
-                        if provided_name in pkg_data[rpm_type]['providers'] and pkg_data[rpm_type]['providers'][provided_name] == alt_name:
-                            continue
-                    pkg_data[rpm_type]['providers'][provided_name]=name
+            if provided_names is not None:
+                provided = [(strings.intern(provided_name), provides_evr and provides_evr[i])
+                            for (i, provided_name) in enumerate(provided_names)]
+                if alt_id is not None:
+                    provided = [p for p in provided if providers.get(p[0]) != alt_id]
+                for (provided_id, flags_evr) in provided:
+                    providers[provided_id]=name_id
+                if provider_index is not None:
+                    for (provided_id, flags_evr) in provided:
+                        provider_index.add(provided_id, name_id, flags_evr)
             else:
                 print("%s: %s.%s has no 'rpm:provides'" % (repodata_path, name, pkg_arch))
             # print "--- files ---"
-            for fn in f.findall('root:file', ns):
-               file_name=fn.text
-               # print "    %s" % file_name
-               pkg_data[rpm_type]['files'][name].append(file_name)
-               if name == "kernel-rt" and file_name in pkg_data[rpm_type]['file_owners'] and pkg_data[rpm_type]['file_owners'][file_name] == "kernel":
-                   continue
-               if name.startswith('kernel-rt'):
-                   alt_name=string.replace(name, 'kernel-rt', 'kernel')
-                   if provided_name in pkg_data[rpm_type]['file_owners'] and pkg_data[rpm_type]['file_owners'][file_name] == alt_name:
-                       continue
-               pkg_data[rpm_type]['file_owners'][file_name]=name
+            if alt_id is not None:
+                files = [file_name for file_name in files if file_owners.get(file_name) != alt_id]
+            for file_name in files:
+               file_owners[file_name]=name_id
         else:
             print("%s: %s.%s has no 'root:format'" % (repodata_path, name, pkg_arch))
-        # print "%s  %s  %s  %s  %s" % (name, pkg_arch, version,  release, license)
-    infile.close
-    
-def calulate_all_direct_requires_and_descendants(rpm_type='RPM'):
-    # print "calulate_all_direct_requires_and_descendants rpm_type=%s" % rpm_type
-    for name in pkg_data[rpm_type]['requires']:
-        calulate_pkg_direct_requires_and_descendants(name, rpm_type=rpm_type)
-
-def calulate_pkg_direct_requires_and_descendants(name, rpm_type='RPM'):
-    print("%s needs:" % name)
-    if not rpm_type in pkg_data:
-        print("Error: unknown rpm_type '%s'" % rpm_type)
-        return
-
-    if not name in pkg_data[rpm_type]['requires']:
-        print("Note: No requires data for '%s'" % name)
-        return
-
-    for req in pkg_data[rpm_type]['requires'][name]:
-        pro = '???'
-        if rpm_type == 'RPM':
-            if req in pkg_data[rpm_type]['providers']:
-                pro = pkg_data[rpm_type]['providers'][req]
-            elif req in pkg_data[rpm_type]['file_owners']:
-                pro = pkg_data[rpm_type]['file_owners'][req]
-            else:
-                pro = '???'
-                print("package %s has unresolved requirement '%s'" % (name, req))
-        else:
-            #  i.e. rpm_type == 'SRPM'
-            rpm_pro = '???'
-            if req in pkg_data['RPM']['providers']:
-                rpm_pro = pkg_data['RPM']['providers'][req]
-            elif req in pkg_data['RPM']['file_owners']:
-                rpm_pro = pkg_data['RPM']['file_owners'][req]
-            else:
-                rpm_pro = '???'
-                print("package %s has unresolved requirement '%s'" % (name, req))
 
-            if rpm_pro is not None and rpm_pro != '???':
+    # Return the set of required names that no package provides by name, and so
+    # can only be resolved by a file owner.  Requires of both RPMs and SRPMs are
+    # resolved against the RPM data, so all primary data must be read first.
+    def get_required_file_names(self):
+        names = self.strings.names
+        providers = self.pkg_data['RPM']['providers']
+        wanted = set()
+        for rpm_type in rpm_types:
+            for requires in self.pkg_data[rpm_type]['requires'].values():
+                for req in requires:
+                    if req not in providers:
+                        wanted.add(names[req])
+        return wanted
+
+    # Only keep the files in 'wanted' when reading filelists from now on.
+    def set_filelists_wanted(self, wanted):
+        self.filelists_wanted = wanted
+        digest = hashlib.sha1()
+        for fn in sorted(wanted):
+            digest.update(fn.encode('utf-8'))
+            digest.update(b'\n')
+        self.filelists_wanted_digest = digest.hexdigest()
+
+    def calulate_all_direct_requires_and_descendants(self, rpm_type='RPM'):
+        # print "calulate_all_direct_requires_and_descendants rpm_type=%s" % rpm_type
+        resolved = self.get_resolved_requirements(rpm_type=rpm_type)
+        self.pkg_data[rpm_type]['resolved'] = resolved
+        for name in self.pkg_data[rpm_type]['requires']:
+            self.calulate_pkg_direct_requires_and_descendants(name, rpm_type=rpm_type, resolved=resolved)
+
+    # Return the SRPM that builds the rpm 'rpm_name', or None if not known
+    def get_srpm_of_rpm(self, rpm_name):
+        fn = self.pkg_data['RPM']['sourcerpm'].get(rpm_name)
+        if fn is None:
+            return None
+        return self.pkg_data['SRPM']['fn_to_name'].get(fn)
+
+    # Resolve one requirement of a package of type 'rpm_type'.
+    # Returns (rpm_pro, pro), where rpm_pro is the rpm that satisfies 'req'
+    # and pro the package of type 'rpm_type' it stands for, i.e. the same rpm
+    # for an RPM, the SRPM that builds it for a SRPM.  Either can be None.
+    # Requirements are always satisfied by rpms, by capability or by file.
+    #    flags_evr= the version constraint of 'req', see parse_entry_evrs()
+    def resolve_requirement(self, req, rpm_type='RPM', flags_evr=None):
+        rpm_data = self.pkg_data['RPM']
+        rpm_pro = None
+        if flags_evr is not None:
+            rpm_pro = rpm_data['provider_index'].select(req, flags_evr)
+        if rpm_pro is None:
+            rpm_pro = rpm_data['providers'].get(req)
+        if rpm_pro is None:
+            rpm_pro = rpm_data['file_owners'].get(self.strings.names[req])
+        if rpm_pro is None or rpm_type == 'RPM':
+            return (rpm_pro, rpm_pro)
+        return (rpm_pro, self.get_srpm_of_rpm(rpm_pro))
+
+    # Iterate over the requirements of package 'name', as (req, flags_evr),
+    # with flags_evr None for an unversioned requirement.
+    def iter_requirements(self, name, rpm_type='RPM'):
+        requires = self.pkg_data[rpm_type]['requires'][name]
+        evrs = self.pkg_data[rpm_type]['requires_evr'].get(name)
+        if evrs is None:
+            return zip(requires, [None] * len(requires))
+        return zip(requires, evrs)
+
+    # Work out the direct requires of package 'name', and add it to the direct
+    # descendants of each of them.
+    #    resolved= map from get_resolved_requirements(), to save resolving
+    #              each requirement again
+    # The direct requires and descendants always mirror each other, so 'name'
+    # is in the descendants of exactly the packages already in its requires,
+    # and one set of those stands in for searching the descendants list of
+    # each requirement, which for a package like glibc is most packages.
+    def calulate_pkg_direct_requires_and_descendants(self, name, rpm_type='RPM', resolved=None):
+        pkg_data = self.pkg_data
+        names = self.strings.names
+        if not self.quiet:
+            print("%s needs:" % names[name])
+        if not rpm_type in pkg_data:
+            print("Error: unknown rpm_type '%s'" % rpm_type)
+            return
+
+        if not name in pkg_data[rpm_type]['requires']:
+            print("Note: No requires data for '%s'" % names[name])
+            return
+
+        direct_requires = pkg_data[rpm_type]['pkg_direct_requires']
+        direct_descendants = pkg_data[rpm_type]['pkg_direct_descendants']
+        unsatisfied = pkg_data['RPM']['provider_index'].unsatisfied
+        required = set(direct_requires.get(name, ()))
+        required_rpms = None
+        if rpm_type != 'RPM':
+            required_rpms = set(pkg_data[rpm_type]['pkg_direct_requires_rpm'].get(name, ()))
+        for (req, flags_evr) in self.iter_requirements(name, rpm_type=rpm_type):
+            if resolved is None:
+                (rpm_pro, pro) = self.resolve_requirement(req, rpm_type=rpm_type, flags_evr=flags_evr)
+            else:
+                (rpm_pro, pro) = resolved[requirement_key(req, flags_evr)]
+            if flags_evr is not None and (req, flags_evr) in unsatisfied:
+                self.diagnostics.add(UNSATISFIED_VERSION, rpm_type, (req, flags_evr), name)
+            if rpm_pro is None:
+                self.diagnostics.add(UNRESOLVED_REQUIREMENT, rpm_type, req, name)
+            elif rpm_type != 'RPM':
+                #  i.e. rpm_type == 'SRPM'
                 if not name in pkg_data[rpm_type]['pkg_direct_requires_rpm']:
-                    pkg_data[rpm_type]['pkg_direct_requires_rpm'][name] = []
-                if not rpm_pro in pkg_data[rpm_type]['pkg_direct_requires_rpm'][name]:
+                    pkg_data[rpm_type]['pkg_direct_requires_rpm'][name] = array('I')
+                if rpm_pro not in required_rpms:
+                    required_rpms.add(rpm_pro)
                     pkg_data[rpm_type]['pkg_direct_requires_rpm'][name].append(rpm_pro)
 
-                if rpm_pro in pkg_data['RPM']['sourcerpm']:
-                    fn = pkg_data['RPM']['sourcerpm'][rpm_pro]
-                    if fn in pkg_data['SRPM']['fn_to_name']:
-                        pro = pkg_data['SRPM']['fn_to_name'][fn]
+                if pro is None:
+                    if rpm_pro in pkg_data['RPM']['sourcerpm']:
+                        self.diagnostics.add(UNKNOWN_SRPM_FILE, rpm_type, pkg_data['RPM']['sourcerpm'][rpm_pro], name)
                     else:
-                        pro = '???'
-                        print("package %s requires srpm file name %s" % (name,fn))
-                else:
-                    pro = '???'
-                    print("package %s requires rpm %s, but that rpm has no known srpm" % (name,rpm_pro))
-
-        if pro is not None and pro != '???':
-            if not name in pkg_data[rpm_type]['pkg_direct_requires']:
-                pkg_data[rpm_type]['pkg_direct_requires'][name] = []
-            if not pro in pkg_data[rpm_type]['pkg_direct_requires'][name]:
-                pkg_data[rpm_type]['pkg_direct_requires'][name].append(pro)
-            if not pro in pkg_data[rpm_type]['pkg_direct_descendants']:
-                pkg_data[rpm_type]['pkg_direct_descendants'][pro] = []
-            if not name in pkg_data[rpm_type]['pkg_direct_descendants'][pro]:
-                pkg_data[rpm_type]['pkg_direct_descendants'][pro].append(name)
-
-        print("    %s -> %s" % (req, pro))
-
-
-
-def calulate_all_transitive_requires(rpm_type='RPM'):
-    for name in pkg_data[rpm_type]['pkg_direct_requires']:
-        calulate_pkg_transitive_requires(name, rpm_type=rpm_type)
-
-def calulate_pkg_transitive_requires(name, rpm_type='RPM'):
-    if not rpm_type in pkg_data:
-        print("Error: unknown rpm_type '%s'" % rpm_type)
-        return
-
-    if not name in pkg_data[rpm_type]['pkg_direct_requires']:
-        print("Note: No direct_requires data for '%s'" % name)
-        return
-
-    pkg_data[rpm_type]['pkg_transitive_requires'][name]=[]
-    if rpm_type != 'RPM':
-        pkg_data[rpm_type]['pkg_transitive_requires_rpm'][name]=[]
-    unresolved = []
-    unresolved.append(name)
-
-    while unresolved:
-        n = unresolved.pop(0)
-        # print "%s: remove %s" % (name, n)
+                        self.diagnostics.add(RPM_WITHOUT_SRPM, rpm_type, rpm_pro, name)
+
+            if pro is not None:
+                if not name in direct_requires:
+                    direct_requires[name] = array('I')
+                if pro not in required:
+                    required.add(pro)
+                    direct_requires[name].append(pro)
+                    if not pro in direct_descendants:
+                        direct_descendants[pro] = array('I')
+                    direct_descendants[pro].append(name)
+                if not self.quiet:
+                    print("    %s -> %s" % (names[req], names[pro]))
+            elif not self.quiet:
+                print("    %s -> ???" % names[req])
+
+    def calulate_all_transitive_requires(self, rpm_type='RPM'):
+        data = self.pkg_data[rpm_type]
         if rpm_type == 'RPM':
-            direct_requires='pkg_direct_requires'
-            transitive_requires='pkg_transitive_requires'
+            closure = transitive_closure(data['pkg_direct_requires'])
+            for name in data['pkg_direct_requires']:
+                data['pkg_transitive_requires'][name] = closure[name]
         else:
-            direct_requires='pkg_direct_requires_rpm'
-            transitive_requires='pkg_transitive_requires_rpm'
-        if n in pkg_data[rpm_type][direct_requires]:
-            for r in pkg_data[rpm_type][direct_requires][n]:
-                if r != name:
-                    if not r in pkg_data[rpm_type][transitive_requires][name]:
-                        pkg_data[rpm_type][transitive_requires][name].append(r)
-                        if r in pkg_data['RPM']['pkg_transitive_requires']:
-                            for r2 in pkg_data['RPM']['pkg_transitive_requires'][r]:
-                                if r2 != name:
-                                    if not r2 in pkg_data[rpm_type][transitive_requires][name]:
-                                        pkg_data[rpm_type][transitive_requires][name].append(r2)
-                        else:
-                            if rpm_type == 'RPM':
-                                unresolved.append(r)
-                            else:
-                                print("WARNING: calulate_pkg_transitive_requires: can't append rpm to SRPM list, name=%s, r=%s" % (name, r))
-                            # print "%s: add %s" % (name, r)
-    if rpm_type != 'RPM':
-        for r in pkg_data[rpm_type]['pkg_transitive_requires_rpm'][name]:
-            if r in pkg_data['RPM']['sourcerpm']:
-                fn = pkg_data['RPM']['sourcerpm'][r]
-                if fn in pkg_data['SRPM']['fn_to_name']:
-                    s = pkg_data['SRPM']['fn_to_name'][fn]
-                    pkg_data[rpm_type]['pkg_transitive_requires'][name].append(s)
-                else:
-                    print("package %s requires srpm file name %s, but srpm name is not known" % (name, fn))
+            rpm_to_srpm = self.get_rpm_to_srpm()
+            for name in data['pkg_direct_requires']:
+                self.calulate_srpm_transitive_requires(name, rpm_to_srpm=rpm_to_srpm)
+
+    # A SRPM's transitive requirement is the union of the rpms that satisfy its
+    # BuildRequires, plus the RPM transitive requires of those rpms.  The RPM
+    # results must already be calculated.
+    #    rpm_to_srpm= from get_rpm_to_srpm(), to save working it out for
+    #                 every SRPM
+    def calulate_srpm_transitive_requires(self, name, rpm_to_srpm=None):
+        rpm_type='SRPM'
+        pkg_data = self.pkg_data
+        if rpm_to_srpm is None:
+            rpm_to_srpm = self.get_rpm_to_srpm()
+        requires_rpm = set()
+        for r in pkg_data[rpm_type]['pkg_direct_requires_rpm'].get(name, []):
+            if r == name:
+                continue
+            requires_rpm.add(r)
+            if r in pkg_data['RPM']['pkg_transitive_requires']:
+                requires_rpm.update(pkg_data['RPM']['pkg_transitive_requires'][r])
             else:
-                print("package %s requires rpm %s, but that rpm has no known srpm" % (name, r))
-
-def calulate_all_transitive_descendants(rpm_type='RPM'):
-    for name in pkg_data[rpm_type]['pkg_direct_descendants']:
-        calulate_pkg_transitive_descendants(name, rpm_type=rpm_type)
-
-def calulate_pkg_transitive_descendants(name, rpm_type='RPM'):
-    if not rpm_type in pkg_data:
-        print("Error: unknown rpm_type '%s'" % rpm_type)
-        return
-
-    if not name in pkg_data[rpm_type]['pkg_direct_descendants']:
-        print("Note: No direct_requires data for '%s'" % name)
-        return
-
-    pkg_data[rpm_type]['pkg_transitive_descendants'][name]=[]
-    unresolved = []
-    unresolved.append(name)
-
-    while unresolved:
-        n = unresolved.pop(0)
-        # print "%s: remove %s" % (name, n)
-        if n in pkg_data[rpm_type]['pkg_direct_descendants']:
-            for r in pkg_data[rpm_type]['pkg_direct_descendants'][n]:
-                if r != name:
-                    if not r in pkg_data[rpm_type]['pkg_transitive_descendants'][name]:
-                        pkg_data[rpm_type]['pkg_transitive_descendants'][name].append(r)
-                        if r in pkg_data[rpm_type]['pkg_transitive_descendants']:
-                            for n2 in pkg_data[rpm_type]['pkg_transitive_descendants'][r]:
-                                if n2 != name:
-                                    if not n2 in pkg_data[rpm_type]['pkg_transitive_descendants'][name]:
-                                        pkg_data[rpm_type]['pkg_transitive_descendants'][name].append(n2)
-                        else:
-                            unresolved.append(r)
-                            # print "%s: add %s" % (name, r)
-
-def create_dest_rpm_data():
-    for name in sorted(pkg_data['RPM']['sourcerpm']):
-        fn=pkg_data['RPM']['sourcerpm'][name]
-        if fn in pkg_data['SRPM']['fn_to_name']:
-            sname = pkg_data['SRPM']['fn_to_name'][fn]
-            if not sname in pkg_data['SRPM']['binrpm']:
-                pkg_data['SRPM']['binrpm'][sname]=[]
-            pkg_data['SRPM']['binrpm'][sname].append(name)
-
-def create_cache(cache_dir):
-    for rpm_type in rpm_types:
-        print("")
-        print("==== %s ====" % rpm_type)
-        print("")
-        rpm_repodata_primary_list = get_repo_primary_data_list(rpm_type=rpm_type, arch_list=default_arch_by_type[rpm_type])
-        for arch in default_arch_by_type[rpm_type]:
-            read_data_from_repodata_primary_list(rpm_repodata_primary_list, rpm_type=rpm_type, arch=arch)
-        rpm_repodata_filelists_list = get_repo_filelists_data_list(rpm_type=rpm_type, arch_list=default_arch_by_type[rpm_type])
-        for arch in default_arch_by_type[rpm_type]:
-            read_data_from_repodata_filelists_list(rpm_repodata_filelists_list, rpm_type=rpm_type, arch=arch)
-        calulate_all_direct_requires_and_descendants(rpm_type=rpm_type)
-        calulate_all_transitive_requires(rpm_type=rpm_type)
-        calulate_all_transitive_descendants(rpm_type=rpm_type)
-
-        cache_name="%s/%s-direct-requires" % (cache_dir, rpm_type)
-        f=open(cache_name, "w")
-        for name in sorted(pkg_data[rpm_type]['pkg_direct_requires']):
-            print("%s needs %s" % (name, pkg_data[rpm_type]['pkg_direct_requires'][name]))
-            f.write("%s;" % name)
-            first=True
-            for req in sorted(pkg_data[rpm_type]['pkg_direct_requires'][name]):
-                if first:
-                    first=False
-                    f.write("%s" % req)
-                else:
-                    f.write(",%s" % req)
-            f.write("\n")
-        f.close()
-
-        cache_name="%s/%s-direct-descendants" % (cache_dir, rpm_type)
-        f=open(cache_name, "w")
-        for name in sorted(pkg_data[rpm_type]['pkg_direct_descendants']):
-            print("%s informs %s" % (name, pkg_data[rpm_type]['pkg_direct_descendants'][name]))
-            f.write("%s;" % name)
-            first=True
-            for req in sorted(pkg_data[rpm_type]['pkg_direct_descendants'][name]):
-                if first:
-                    first=False
-                    f.write("%s" % req)
-                else:
-                    f.write(",%s" % req)
-            f.write("\n")
-        f.close()
-
-        cache_name="%s/%s-transitive-requires" % (cache_dir, rpm_type)
-        f=open(cache_name, "w")
-        for name in sorted(pkg_data[rpm_type]['pkg_transitive_requires']):
-            f.write("%s;" % name)
-            first=True
-            for req in sorted(pkg_data[rpm_type]['pkg_transitive_requires'][name]):
-                if first:
-                    first=False
-                    f.write("%s" % req)
-                else:
-                    f.write(",%s" % req)
-            f.write("\n")
-        f.close()
-
-        cache_name="%s/%s-transitive-descendants" % (cache_dir, rpm_type)
-        f=open(cache_name, "w")
-        for name in sorted(pkg_data[rpm_type]['pkg_transitive_descendants']):
-            f.write("%s;" % name)
-            first=True
-            for req in sorted(pkg_data[rpm_type]['pkg_transitive_descendants'][name]):
-                if first:
-                    first=False
-                    f.write("%s" % req)
+                self.diagnostics.add(NO_TRANSITIVE_REQUIRES, rpm_type, r, name)
+        requires_rpm.discard(name)
+
+        requires_rpm = list(requires_rpm)
+        pkg_data[rpm_type]['pkg_transitive_requires_rpm'][name]=requires_rpm
+        srpms = [rpm_to_srpm[r] for r in requires_rpm if r in rpm_to_srpm]
+        pkg_data[rpm_type]['pkg_transitive_requires'][name]=srpms
+        if len(srpms) < len(requires_rpm):
+            for r in requires_rpm:
+                if r in rpm_to_srpm:
+                    continue
+                if r in pkg_data['RPM']['sourcerpm']:
+                    self.diagnostics.add(UNKNOWN_SRPM_FILE, rpm_type, pkg_data['RPM']['sourcerpm'][r], name)
                 else:
-                    f.write(",%s" % req)
-            f.write("\n")
-        f.close()
-
-        if rpm_type != 'RPM':
-            cache_name="%s/%s-direct-requires-rpm" % (cache_dir, rpm_type)
-            f=open(cache_name, "w")
-            for name in sorted(pkg_data[rpm_type]['pkg_direct_requires_rpm']):
-                print("%s needs rpm %s" % (name, pkg_data[rpm_type]['pkg_direct_requires_rpm'][name]))
-                f.write("%s;" % name)
-                first=True
-                for req in sorted(pkg_data[rpm_type]['pkg_direct_requires_rpm'][name]):
-                    if first:
-                        first=False
-                        f.write("%s" % req)
-                    else:
-                        f.write(",%s" % req)
-                f.write("\n")
+                    self.diagnostics.add(RPM_WITHOUT_SRPM, rpm_type, r, name)
+
+    def calulate_all_transitive_descendants(self, rpm_type='RPM'):
+        data = self.pkg_data[rpm_type]
+        closure = transitive_closure(data['pkg_direct_descendants'])
+        for name in data['pkg_direct_descendants']:
+            data['pkg_transitive_descendants'][name] = closure[name]
+
+    # Return the names of a list of ids, sorted
+    def sorted_names(self, ids):
+        names = self.strings.names
+        return sorted([names[i] for i in ids])
+
+    # Return the names of a list of ids, sorted.  A list shared by several keys,
+    # e.g. the closure of a dependency cycle, is only sorted once.
+    #    memo= from shared_lists_memo(), for the map holding 'ids'
+    def shared_sorted_names(self, ids, memo):
+        key = id(ids)
+        if key not in memo:
+            return self.sorted_names(ids)
+        if memo[key] is None:
+            memo[key] = self.sorted_names(ids)
+        return memo[key]
+
+    # Return the keys of a map keyed by id, sorted by name
+    def sorted_by_name(self, id_map):
+        return sorted(id_map, key=self.strings.names.__getitem__)
+
+    def create_dest_rpm_data(self):
+        pkg_data = self.pkg_data
+        pkg_data['SRPM']['binrpm'] = {}
+        for name in sorted(pkg_data['RPM']['sourcerpm']):
+            fn=pkg_data['RPM']['sourcerpm'][name]
+            if fn in pkg_data['SRPM']['fn_to_name']:
+                sname = pkg_data['SRPM']['fn_to_name'][fn]
+                if not sname in pkg_data['SRPM']['binrpm']:
+                    pkg_data['SRPM']['binrpm'][sname]=[]
+                pkg_data['SRPM']['binrpm'][sname].append(name)
+
+    # Write the cache file 'cache_name' in 'cache_dir', one line per key of
+    # 'id_map', sorted by name
+    #    <name>;<comma-seperated-list-of-names>
+    #    exclude_self= leave each key out of its own list
+    #    shared= lists may be shared by several keys, see shared_sorted_names()
+    #    verb= also log each line as '<name> <verb> <names>'
+    #    state, changed= for an incremental update, the state loaded from the
+    #        previous run, and the set of keys whose list may have changed.
+    #        The lines of all other keys are copied from the existing cache
+    #        file, if it is still the one written along with 'state'.
+    # Lines are written in chunks of about WRITE_CHUNK_SIZE bytes, to a
+    # temporary file that replaces the cache file once complete, so readers
+    # never see a partial cache file.  If the content is the same as that of
+    # the existing cache file, the existing file is kept as is, along with
+    # its .idx and .zst.
+    # Returns (changed, map file name -> sha256 of each file published for
+    # this cache file).
+    def write_cache_file(self, cache_dir, cache_name, id_map, exclude_self=False, shared=False, verb=None, state=None, changed=None):
+        names = self.strings.names
+        cache_path = "%s/%s" % (cache_dir, cache_name)
+        tmp_path = "%s.%d.tmp" % (cache_path, os.getpid())
+        memo = {}
+        if shared:
+            memo = shared_lists_memo(id_map)
+
+        previous = None
+        if changed is not None and get_output_stamp(cache_path) == state['outputs'].get(os.path.abspath(cache_path)):
+            previous = CacheFileLines(cache_path)
+
+        digest = hashlib.sha256()
+        f=open(tmp_path, "wb")
+        try:
+            chunk = []
+            chunk_size = 0
+            for name in self.sorted_by_name(id_map):
+                line = None
+                if previous is not None and name not in changed:
+                    line = previous.get(names[name])
+                if line is None:
+                    values = self.shared_sorted_names(id_map[name], memo)
+                    if verb is not None and not self.quiet:
+                        print("%s %s %s" % (names[name], verb, values))
+                    if exclude_self:
+                        values = [v for v in values if v != names[name]]
+                    line = "%s;%s\n" % (names[name], ",".join(values))
+                chunk.append(line)
+                chunk_size += len(line)
+                if chunk_size >= WRITE_CHUNK_SIZE:
+                    write_chunk(f, digest, chunk)
+                    chunk = []
+                    chunk_size = 0
+            write_chunk(f, digest, chunk)
             f.close()
-
-            cache_name="%s/%s-transitive-requires-rpm" % (cache_dir, rpm_type)
-            f=open(cache_name, "w")
-            for name in sorted(pkg_data[rpm_type]['pkg_transitive_requires_rpm']):
-                f.write("%s;" % name)
-                first=True
-                for req in sorted(pkg_data[rpm_type]['pkg_transitive_requires_rpm'][name]):
-                    if first:
-                        first=False
-                        f.write("%s" % req)
-                    else:
-                        f.write(",%s" % req)
-                f.write("\n")
+            sha256 = digest.hexdigest()
+            file_changed = replace_if_changed(tmp_path, cache_path, sha256=sha256)
+        finally:
             f.close()
-
-    cache_name="%s/rpm-to-srpm" % cache_dir
-    f=open(cache_name, "w")
-    for name in sorted(pkg_data['RPM']['sourcerpm']):
-        f.write("%s;" % name)
-        fn=pkg_data['RPM']['sourcerpm'][name]
-        if fn in pkg_data['SRPM']['fn_to_name']:
-            sname = pkg_data['SRPM']['fn_to_name'][fn]
-            f.write("%s" % sname)
-        f.write("\n")
-    f.close()
-
-    create_dest_rpm_data()
-    cache_name="%s/srpm-to-rpm" % cache_dir
-    f=open(cache_name, "w")
-    for name in sorted(pkg_data['SRPM']['binrpm']):
-        f.write("%s;" % name)
-        first=True
-        for bname in sorted(pkg_data['SRPM']['binrpm'][name]):
-            if first:
-                first=False
-                f.write("%s" % bname)
+            if previous is not None:
+                previous.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        sha256s = { cache_name: sha256 }
+        published = []
+        index_path = cache_path + dependancy_cache_index.INDEX_SUFFIX
+        if self.options.index:
+            if file_changed or not os.path.exists(index_path):
+                index_path = dependancy_cache_index.write_index_from_text(cache_path)
+                print("Created index: %s" % index_path)
+            published.append(index_path)
+        elif file_changed and os.path.exists(index_path):
+            # A stale index would not match the new cache file
+            os.remove(index_path)
+        zst_path = cache_path + COMPRESSED_SUFFIX
+        if self.options.compress:
+            if file_changed or not os.path.exists(zst_path):
+                write_compressed(cache_path)
+            published.append(zst_path)
+        elif file_changed and os.path.exists(zst_path):
+            # A stale copy would not match the new cache file
+            os.remove(zst_path)
+        if self.options.manifest:
+            for path in published:
+                sha256s[os.path.basename(path)] = hash_file(path)
+        return (file_changed, sha256s)
+
+    # Write a list of cache files, each given as the keyword arguments of
+    # write_cache_file().  With jobs > 1 the files are written by that many
+    # threads.  The maps written must not change until this returns.
+    # Returns the results of write_cache_file(), in the same order.
+    def write_cache_files(self, write_list, jobs=1):
+        return thread_map(lambda kwargs: self.write_cache_file(**kwargs), write_list, jobs=jobs)
+
+    # Return map requirement -> (rpm_pro, pro) for every requirement of the
+    # packages of type 'rpm_type', see resolve_requirement().  Each distinct
+    # requirement is resolved once.  The key of a requirement is the
+    # required_name, or with --versioned_requires a (required_name, flags_evr)
+    # for a versioned one, see requirement_key().
+    def get_resolved_requirements(self, rpm_type='RPM'):
+        resolved = {}
+        for name in self.pkg_data[rpm_type]['requires']:
+            for (req, flags_evr) in self.iter_requirements(name, rpm_type=rpm_type):
+                key = requirement_key(req, flags_evr)
+                if key not in resolved:
+                    resolved[key] = self.resolve_requirement(req, rpm_type=rpm_type, flags_evr=flags_evr)
+        return resolved
+
+    # Return map rpm_name -> [ srpm_name ], for all rpms with a source rpm.
+    # The list is empty if that source rpm is not known.
+    def get_rpm_to_srpm_lists(self):
+        rpm_to_srpm = {}
+        for name in self.pkg_data['RPM']['sourcerpm']:
+            sname = self.get_srpm_of_rpm(name)
+            if sname is None:
+                rpm_to_srpm[name] = []
             else:
-                f.write(",%s" % bname)
-        f.write("\n")
-    f.close()
-
+                rpm_to_srpm[name] = [sname]
+        return rpm_to_srpm
+
+    # Return map rpm_name -> srpm_name, for all rpms with a known SRPM
+    def get_rpm_to_srpm(self):
+        rpm_to_srpm = {}
+        for name in self.pkg_data['RPM']['sourcerpm']:
+            sname = self.get_srpm_of_rpm(name)
+            if sname is not None:
+                rpm_to_srpm[name] = sname
+        return rpm_to_srpm
+
+    # Save what an incremental update needs from this run to 'state_file':
+    # the string table, the dependency maps, how each requirement was resolved,
+    # and a stamp of each cache file written.
+    def save_state(self, state_file, cache_dir):
+        state = { 'version': STATE_VERSION,
+                  'versioned_requires': self.options.versioned_requires,
+                  'names': self.strings.names,
+                  'pkg_data': {},
+                  'rpm_to_srpm': self.get_rpm_to_srpm(),
+                  'outputs': {} }
+        for rpm_type in rpm_types:
+            data = self.pkg_data[rpm_type]
+            state['pkg_data'][rpm_type] = {}
+            for key in state_keys[rpm_type]:
+                state['pkg_data'][rpm_type][key] = pack_id_map(data[key])
+            state['pkg_data'][rpm_type]['requires_evr'] = data['requires_evr']
+            resolved = data.get('resolved')
+            if resolved is None:
+                resolved = self.get_resolved_requirements(rpm_type=rpm_type)
+            state['pkg_data'][rpm_type]['resolved'] = resolved
+        for cache_name in get_cache_names():
+            cache_path = os.path.abspath("%s/%s" % (cache_dir, cache_name))
+            state['outputs'][cache_path] = get_output_stamp(cache_path)
+
+        tmp_path = "%s.%d.tmp" % (state_file, os.getpid())
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_path, state_file)
+        except (IOError, OSError) as e:
+            print("WARNING: failed to save state '%s': %s" % (state_file, e))
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    # Return the state saved by an earlier run, or None if there is no usable
+    # state.  The string table is restored from it, so this must be called
+    # before any repodata is read.
+    def load_state(self, state_file):
+        try:
+            with open(state_file, 'rb') as f:
+                state = pickle.load(f)
+        except (IOError, OSError, EOFError, ValueError, TypeError, pickle.UnpicklingError) as e:
+            print("WARNING: can't load state '%s': %s" % (state_file, e))
+            return None
+        if not isinstance(state, dict) or state.get('version') != STATE_VERSION:
+            print("WARNING: state '%s' is from an other version" % state_file)
+            return None
+        if state['versioned_requires'] != self.options.versioned_requires:
+            print("WARNING: state '%s' is from a run with a different --versioned_requires" % state_file)
+            return None
+        self.strings.restore(state['names'])
+        for rpm_type in rpm_types:
+            for key in state_keys[rpm_type]:
+                state['pkg_data'][rpm_type][key] = unpack_id_map(state['pkg_data'][rpm_type][key])
+        return state
+
+    # Update the dependency maps of 'rpm_type' loaded from 'state' to match the
+    # newly read repodata, in place of the calulate_all_* functions.
+    #
+    # Direct edges are recomputed only for the 'dirty' packages, those whose
+    # requires changed, or that have a requirement that now resolves
+    # differently.  Transitive requires are recomputed only for the packages
+    # that reach a dirty package, and transitive descendants only for the
+    # packages reachable from one whose direct descendants changed, either
+    # before or after the change.
+    #
+    # Returns map cache file suffix -> set of keys whose line may have changed.
+    def update_dependencies(self, state, rpm_type='RPM'):
+        old = state['pkg_data'][rpm_type]
+        data = self.pkg_data[rpm_type]
+        requires = data['requires']
+        old_requires = old['requires']
+        for key in state_keys[rpm_type]:
+            if key != 'requires':
+                data[key] = old[key]
+        direct_requires = data['pkg_direct_requires']
+        direct_descendants = data['pkg_direct_descendants']
+
+        resolved = self.get_resolved_requirements(rpm_type=rpm_type)
+        data['resolved'] = resolved
+        old_resolved = old['resolved']
+        changed_reqs = set()
+        for key in resolved:
+            if old_resolved.get(key) != resolved[key]:
+                if isinstance(key, tuple):
+                    changed_reqs.add(key[0])
+                else:
+                    changed_reqs.add(key)
+
+        requires_evr = data['requires_evr']
+        old_requires_evr = old['requires_evr']
+        dirty = set()
+        for name in requires:
+            if old_requires.get(name) != requires[name]:
+                dirty.add(name)
+            elif old_requires_evr.get(name) != requires_evr.get(name):
+                dirty.add(name)
+            elif changed_reqs and not changed_reqs.isdisjoint(requires[name]):
+                dirty.add(name)
+        for name in old_requires:
+            if name not in requires:
+                dirty.add(name)
+        print("incremental: %d of %d %s packages changed" % (len(dirty), len(requires), rpm_type))
+
+        # Drop the edges of the dirty packages, and work them out again
+        old_edges = {}
+        old_descendant_edges = {}
+        for name in dirty:
+            old_edges[name] = direct_requires.pop(name, ())
+            for pro in old_edges[name]:
+                direct_descendants[pro].remove(name)
+                if not direct_descendants[pro]:
+                    del direct_descendants[pro]
+                old_descendant_edges.setdefault(pro, []).append(name)
+            if rpm_type != 'RPM':
+                data['pkg_direct_requires_rpm'].pop(name, None)
+        for name in dirty:
+            if name in requires:
+                self.calulate_pkg_direct_requires_and_descendants(name, rpm_type=rpm_type, resolved=resolved)
+
+        changed_descendants = set()
+        for name in dirty:
+            changed_descendants.update(old_edges[name])
+            changed_descendants.update(direct_requires.get(name, ()))
+
+        requires_affected = get_reachable(dirty, [direct_descendants, old_descendant_edges])
+        descendants_affected = get_reachable(changed_descendants, [direct_requires, old_edges])
 
-    
-def test():
-    for rpm_type in rpm_types:
+        if rpm_type == 'RPM':
+            requires_changed = update_transitive_closure(data['pkg_transitive_requires'], direct_requires, requires_affected)
+            requires_rpm_changed = requires_changed
+            state['rpm_requires_changed'] = requires_changed
+        else:
+            # A SRPM's transitive requires follow from the RPM ones, see
+            # calulate_srpm_transitive_requires()
+            requires_affected = set(dirty)
+            rpm_requires_changed = state['rpm_requires_changed']
+            for name in data['pkg_direct_requires_rpm']:
+                if not rpm_requires_changed.isdisjoint(data['pkg_direct_requires_rpm'][name]):
+                    requires_affected.add(name)
+            old_rpm_to_srpm = state['rpm_to_srpm']
+            rpm_to_srpm = self.get_rpm_to_srpm()
+            moved_rpms = set()
+            for r in set(old_rpm_to_srpm) | set(rpm_to_srpm):
+                if old_rpm_to_srpm.get(r) != rpm_to_srpm.get(r):
+                    moved_rpms.add(r)
+            if moved_rpms:
+                for name in data['pkg_transitive_requires_rpm']:
+                    if not moved_rpms.isdisjoint(data['pkg_transitive_requires_rpm'][name]):
+                        requires_affected.add(name)
+            requires_changed = set()
+            requires_rpm_changed = set()
+            for name in requires_affected:
+                old = data['pkg_transitive_requires'].pop(name, None)
+                old_rpm = data['pkg_transitive_requires_rpm'].pop(name, None)
+                if name in direct_requires:
+                    self.calulate_srpm_transitive_requires(name, rpm_to_srpm=rpm_to_srpm)
+                if not same_ids(old, data['pkg_transitive_requires'].get(name)):
+                    requires_changed.add(name)
+                if not same_ids(old_rpm, data['pkg_transitive_requires_rpm'].get(name)):
+                    requires_rpm_changed.add(name)
+
+        descendants_changed = update_transitive_closure(data['pkg_transitive_descendants'], direct_descendants, descendants_affected)
+        print("incremental: %d %s transitive requires and %d transitive descendants changed" % (len(requires_changed), rpm_type, len(descendants_changed)))
+
+        return { 'direct-requires': dirty,
+                 'direct-descendants': changed_descendants,
+                 'transitive-requires': requires_changed,
+                 'transitive-descendants': descendants_changed,
+                 'direct-requires-rpm': dirty,
+                 'transitive-requires-rpm': requires_rpm_changed }
+
+    # Iterate over (type, pkg, req, flags, evr, rpm) for every requirement of
+    # the packages of type 'rpm_type', rpm being the rpm it resolved to.
+    def iter_db_requires(self, rpm_type='RPM'):
+        resolved = self.pkg_data[rpm_type].get('resolved')
+        if resolved is None:
+            resolved = self.get_resolved_requirements(rpm_type=rpm_type)
+        for name in self.pkg_data[rpm_type]['requires']:
+            # the first requirement is the package itself
+            for (req, flags_evr) in list(self.iter_requirements(name, rpm_type=rpm_type))[1:]:
+                flags = None
+                evr = None
+                if flags_evr is not None:
+                    flags = flags_evr[0]
+                    evr = format_evr(flags_evr[1])
+                yield (rpm_type, name, req, flags, evr, resolved[requirement_key(req, flags_evr)][0])
+
+    # Save the packages, provides, requires and direct edges to the SQLite
+    # store 'db_path'.  Must be called after the cache files are written.
+    def save_db(self, db_path):
+        pkg_data = self.pkg_data
+        tables = { 'packages': [], 'provides': [], 'requires': [], 'edges': [] }
+        for rpm_type in rpm_types:
+            tables['packages'].append(iter_db_keys(pkg_data[rpm_type]['requires'], rpm_type=rpm_type))
+            tables['provides'].append(iter_db_items(pkg_data[rpm_type]['providers'], rpm_type=rpm_type))
+            tables['requires'].append(self.iter_db_requires(rpm_type=rpm_type))
+            tables['edges'].append(iter_db_pairs(pkg_data[rpm_type]['pkg_direct_requires'], prefix=(rpm_type,)))
+        for table in list(tables):
+            tables[table] = itertools.chain(*tables[table])
+        tables['requires_rpm'] = iter_db_pairs(pkg_data['SRPM']['pkg_direct_requires_rpm'])
+        tables['rpm_srpm'] = self.get_rpm_to_srpm().items()
+        dependancy_cache_db.write_db(db_path, self.strings.names, tables)
+        print("db: saved dependency graph to %s" % db_path)
+
+    # Read the primary data of every rpm type
+    def read_primary(self):
+        options = self.options
+        for rpm_type in rpm_types:
+            print("")
+            print("==== %s primary ====" % rpm_type)
+            print("")
+            with timed_phase(self.phase_report, 'primary', rpm_type=rpm_type) as counts:
+                nbytes = self.repodata_stats['bytes_decompressed']
+                rpm_repodata_primary_list = self.get_repo_primary_data_list(rpm_type=rpm_type, arch_list=default_arch_by_type[rpm_type])
+                self.read_data_from_repodata_primary_list(rpm_repodata_primary_list, rpm_type=rpm_type, arch_list=default_arch_by_type[rpm_type], jobs=options.jobs)
+                counts['files'] = len(rpm_repodata_primary_list)
+                counts['bytes_decompressed'] = self.repodata_stats['bytes_decompressed'] - nbytes
+                counts['packages'] = len(self.pkg_data[rpm_type]['requires'])
+                counts['provides'] = len(self.pkg_data[rpm_type]['providers'])
+
+    # Read the filelists data of every rpm type that needs it
+    def read_filelists(self):
+        options = self.options
+        for rpm_type in rpm_types:
+            # File requires are only ever resolved against RPM file owners
+            if options.lazy_filelists and rpm_type != 'RPM':
+                continue
+            with timed_phase(self.phase_report, 'filelists', rpm_type=rpm_type) as counts:
+                nbytes = self.repodata_stats['bytes_decompressed']
+                rpm_repodata_filelists_list = self.get_repo_filelists_data_list(rpm_type=rpm_type, arch_list=default_arch_by_type[rpm_type])
+                self.read_data_from_repodata_filelists_list(rpm_repodata_filelists_list, rpm_type=rpm_type, arch_list=default_arch_by_type[rpm_type], jobs=options.jobs)
+                counts['files'] = len(rpm_repodata_filelists_list)
+                counts['bytes_decompressed'] = self.repodata_stats['bytes_decompressed'] - nbytes
+                counts['file_owners'] = len(self.pkg_data[rpm_type]['file_owners'])
+
+    # Read the repodata into this cache.  With build types to do, the
+    # records parsed are kept in 'parsed_records' for their views, see
+    # make_build_type_view().
+    def read_repodata(self):
+        options = self.options
+        with timed_phase(self.phase_report, 'discovery') as counts:
+            (repodata_dirs, repodata_files, repomd) = self.discover_repodata()
+            counts['repodata_dirs'] = len(repodata_files)
+
+        # Read the primary data of all types before any filelists, so that with
+        # --lazy_filelists every required file name is known up front.
+        self.read_primary()
+
+        if options.lazy_filelists:
+            with timed_phase(self.phase_report, 'lazy_filelists') as counts:
+                wanted = self.get_required_file_names()
+                if self.parsed_records is not None:
+                    # A file name provided by name here may not be in a
+                    # view, so keep every file name the views could require
+                    wanted.update(get_required_paths(self.parsed_records))
+                self.set_filelists_wanted(wanted)
+                counts['wanted_files'] = len(self.filelists_wanted)
+            print("lazy filelists: keeping %d required file names" % len(self.filelists_wanted))
+
+        self.read_filelists()
+
+    # Return a DependancyCache of the repodata of the build type 'bt'
+    # alone, i.e. under its mirror roots in 'build_type_roots', read.  It
+    # shares the string table, the repodata found and the records parsed
+    # with this cache, once read_repodata() is done, so nothing is searched
+    # for or parsed again.  The records are only applied again, in the order
+    # of its own mirror roots.
+    def make_build_type_view(self, bt):
+        view = DependancyCache(self.build_type_roots[bt], self.options, strings=self.strings)
+        view.repodata_discovery = self.repodata_discovery
+        view.parsed_records = self.parsed_records
+        view.read_primary()
+        if self.options.lazy_filelists:
+            view.set_filelists_wanted(self.filelists_wanted)
+        view.read_filelists()
+        view.parsed_records = None
+        return view
+
+    # Drop the parsed records of the repodata files that are not under any
+    # of 'mirror_roots', a list of mirror_roots of views still to build
+    def release_parsed_records(self, mirror_roots):
+        roots = set()
+        for view_roots in mirror_roots:
+            for rpm_type in rpm_types:
+                roots.update([os.path.join(d, '') for d in view_roots[rpm_type]])
+        for key in list(self.parsed_records):
+            repodata_path = key[1]
+            if not [d for d in roots if repodata_path.startswith(d)]:
+                del self.parsed_records[key]
+
+    # Work out and write the cache of the build type view 'view' to
+    # <cache_dir>/<build_type>.  Its phases are added to the report of
+    # this cache.
+    def create_build_type_cache(self, cache_dir, bt, view):
         print("")
-        print("==== %s ====" % rpm_type)
+        print("==== build type %s ====" % bt)
         print("")
-        rpm_repodata_primary_list = get_repo_primary_data_list(rpm_type=rpm_type, arch_list=default_arch_by_type[rpm_type])
-        for arch in default_arch_by_type[rpm_type]:
-            read_data_from_repodata_primary_list(rpm_repodata_primary_list, rpm_type=rpm_type, arch=arch)
-        rpm_repodata_filelists_list = get_repo_filelists_data_list(rpm_type=rpm_type, arch_list=default_arch_by_type[rpm_type])
-        for arch in default_arch_by_type[rpm_type]:
-            read_data_from_repodata_filelists_list(rpm_repodata_filelists_list, rpm_type=rpm_type, arch=arch)
-        calulate_all_direct_requires_and_descendants(rpm_type=rpm_type)
-        calulate_all_transitive_requires(rpm_type=rpm_type)
-        calulate_all_transitive_descendants(rpm_type=rpm_type)
-
-        for name in pkg_data[rpm_type]['pkg_direct_requires']:
-            print("%s needs %s" % (name, pkg_data[rpm_type]['pkg_direct_requires'][name]))
-
-        for name in pkg_data[rpm_type]['pkg_direct_descendants']:
-            print("%s informs %s" % (name, pkg_data[rpm_type]['pkg_direct_descendants'][name]))
-
-        for name in pkg_data[rpm_type]['pkg_transitive_requires']:
-            print("%s needs %s" % (name, pkg_data[rpm_type]['pkg_transitive_requires'][name]))
+        bt_cache_dir = os.path.join(cache_dir, bt)
+        if not os.path.isdir(bt_cache_dir):
+            print("Creating directory: %s" % bt_cache_dir)
+            os.makedirs(bt_cache_dir, 0o755)
+        view.calculate()
+        view.diagnostics.print_counts()
+        if self.options.diagnostics:
+            view.diagnostics.write("%s.%s" % (self.options.diagnostics, bt))
+        elif not self.quiet:
+            view.diagnostics.write()
+        view.write_cache(bt_cache_dir)
+        for entry in view.phase_report:
+            entry['build_type'] = bt
+            self.phase_report.append(entry)
+
+    # Work out the direct and transitive requires and descendants of every
+    # package, from the repodata read, timing each phase.
+    #    state= from load_state(), to only update the maps saved in it
+    #    profiler= a cProfile.Profile, enabled for the closure phases only
+    # Returns map rpm_type -> map from update_dependencies(), empty without
+    # 'state'.
+    # The problems found are left in self.diagnostics.
+    def calculate(self, state=None, profiler=None):
+        changed = {}
+        self.diagnostics = Diagnostics(self.strings)
+        for rpm_type in rpm_types:
             print("")
-     
-        for name in pkg_data[rpm_type]['pkg_transitive_descendants']:
-            print("%s informs %s" % (name, pkg_data[rpm_type]['pkg_transitive_descendants'][name]))
+            print("==== %s ====" % rpm_type)
             print("")
+            changed[rpm_type] = {}
+            data = self.pkg_data[rpm_type]
+            if state is None:
+                with timed_phase(self.phase_report, 'direct', rpm_type=rpm_type) as counts:
+                    self.calulate_all_direct_requires_and_descendants(rpm_type=rpm_type)
+                    counts['requirements'] = len(data['resolved'])
+                    counts['edges'] = sum(len(v) for v in data['pkg_direct_requires'].values())
+                if profiler is not None:
+                    profiler.enable()
+                with timed_phase(self.phase_report, 'transitive_requires', rpm_type=rpm_type) as counts:
+                    self.calulate_all_transitive_requires(rpm_type=rpm_type)
+                    counts['packages'] = len(data['pkg_transitive_requires'])
+                with timed_phase(self.phase_report, 'transitive_descendants', rpm_type=rpm_type) as counts:
+                    self.calulate_all_transitive_descendants(rpm_type=rpm_type)
+                    counts['packages'] = len(data['pkg_transitive_descendants'])
+                if profiler is not None:
+                    profiler.disable()
+            else:
+                if profiler is not None:
+                    profiler.enable()
+                with timed_phase(self.phase_report, 'incremental', rpm_type=rpm_type) as counts:
+                    changed[rpm_type] = self.update_dependencies(state, rpm_type=rpm_type)
+                    counts['changed_lines'] = sum(len(v) for v in changed[rpm_type].values())
+                if profiler is not None:
+                    profiler.disable()
+
+        self.create_dest_rpm_data()
+        self.cache_maps = None
+        return changed
+
+    # Return the content of each cache file, as a list of the keyword
+    # arguments of write_cache_file(), less cache_dir and state.
+    #    changed= from calculate(), for an incremental update
+    def get_cache_maps(self, changed=None):
+        if changed is None:
+            changed = {}
+        cache_maps = []
+        for rpm_type in rpm_types:
+            data = self.pkg_data[rpm_type]
+            type_changed = changed.get(rpm_type, {})
+            # The RPM closures are shared by the members of a dependency cycle,
+            # and hold the package itself in that case.
+            cache_maps.append({ 'cache_name': "%s-direct-requires" % rpm_type,
+                                'id_map': data['pkg_direct_requires'],
+                                'verb': 'needs',
+                                'changed': type_changed.get('direct-requires') })
+            cache_maps.append({ 'cache_name': "%s-direct-descendants" % rpm_type,
+                                'id_map': data['pkg_direct_descendants'],
+                                'verb': 'informs',
+                                'changed': type_changed.get('direct-descendants') })
+            cache_maps.append({ 'cache_name': "%s-transitive-requires" % rpm_type,
+                                'id_map': data['pkg_transitive_requires'],
+                                'exclude_self': (rpm_type == 'RPM'),
+                                'shared': True,
+                                'changed': type_changed.get('transitive-requires') })
+            cache_maps.append({ 'cache_name': "%s-transitive-descendants" % rpm_type,
+                                'id_map': data['pkg_transitive_descendants'],
+                                'exclude_self': True,
+                                'shared': True,
+                                'changed': type_changed.get('transitive-descendants') })
+
+            if rpm_type != 'RPM':
+                cache_maps.append({ 'cache_name': "%s-direct-requires-rpm" % rpm_type,
+                                    'id_map': data['pkg_direct_requires_rpm'],
+                                    'verb': 'needs rpm',
+                                    'changed': type_changed.get('direct-requires-rpm') })
+                cache_maps.append({ 'cache_name': "%s-transitive-requires-rpm" % rpm_type,
+                                    'id_map': data['pkg_transitive_requires_rpm'],
+                                    'changed': type_changed.get('transitive-requires-rpm') })
+
+        cache_maps.append({ 'cache_name': "rpm-to-srpm",
+                            'id_map': self.get_rpm_to_srpm_lists() })
+        cache_maps.append({ 'cache_name': "srpm-to-rpm",
+                            'id_map': self.pkg_data['SRPM']['binrpm'] })
+        return cache_maps
+
+    # Write all cache files to 'cache_dir'
+    #    state, changed= from load_state() and calculate(), for an
+    #                    incremental update
+    def write_cache(self, cache_dir, state=None, changed=None):
+        write_list = self.get_cache_maps(changed)
+        for kwargs in write_list:
+            kwargs['cache_dir'] = cache_dir
+            kwargs['state'] = state
+        with timed_phase(self.phase_report, 'write') as counts:
+            results = self.write_cache_files(write_list, jobs=self.options.write_jobs)
+            counts['files'] = len(write_list)
+            counts['changed'] = len([r for r in results if r[0]])
+            if self.options.manifest:
+                sha256s = {}
+                for (file_changed, file_sha256s) in results:
+                    sha256s.update(file_sha256s)
+                manifest_path = write_manifest(cache_dir, sha256s)
+                print("Created manifest: %s" % manifest_path)
+        print("write: %d of %d cache files changed" % (counts['changed'], counts['files']))
+
+    # Read the repodata and work out the dependency graph, in memory only.
+    # See query() to use it.
+    def build(self):
+        self.read_repodata()
+        self.calculate()
+
+    # Return the sorted names the cache file 'cache_name', e.g.
+    # 'RPM-transitive-requires', lists for the package 'name', or None if
+    # the file has no line for it.  Only valid after build() or
+    # create_cache().  Raises ValueError for an unknown cache file.
+    def query(self, cache_name, name):
+        if self.cache_maps is None:
+            self.cache_maps = dict([(m['cache_name'], m) for m in self.get_cache_maps()])
+        cache_map = self.cache_maps.get(cache_name)
+        if cache_map is None:
+            raise ValueError("unknown cache file '%s'" % cache_name)
+        i = self.strings.lookup(name)
+        if i is None or i not in cache_map['id_map']:
+            return None
+        values = self.sorted_names(cache_map['id_map'][i])
+        if cache_map.get('exclude_self'):
+            values = [v for v in values if v != name]
+        return values
+
+    # Build the cache files in 'cache_dir', and whatever else the options ask
+    # for: an incremental update, the --state_file, the --db store and the
+    # --profile stats.
+    def create_cache(self, cache_dir):
+        options = self.options
+        state = None
+        if options.incremental:
+            with timed_phase(self.phase_report, 'load_state'):
+                state = self.load_state(options.state_file)
+            if state is None:
+                print("incremental: no usable state, doing a full update")
+
+        self.read_repodata()
+
+        profiler = None
+        if options.profile:
+            profiler = cProfile.Profile()
+
+        changed = self.calculate(state=state, profiler=profiler)
+        self.diagnostics.print_counts()
+        if options.diagnostics or not self.quiet:
+            self.diagnostics.write(options.diagnostics, partial=state is not None)
+        self.write_cache(cache_dir, state=state, changed=changed)
+
+        if options.state_file:
+            with timed_phase(self.phase_report, 'save_state'):
+                self.save_state(options.state_file, cache_dir)
+
+        if options.db:
+            with timed_phase(self.phase_report, 'db'):
+                self.save_db(options.db)
+
+        # One view at a time, so only one is ever held next to this cache
+        todo = [bt for bt in build_types if bt in self.build_type_roots]
+        for (i, bt) in enumerate(todo):
+            view = self.make_build_type_view(bt)
+            self.release_parsed_records([self.build_type_roots[later] for later in todo[i + 1:]])
+            self.create_build_type_cache(cache_dir, bt, view)
+        self.parsed_records = None
+
+        if profiler is not None:
+            profiler.dump_stats(options.profile)
+            print("profile: closure phase stats written to %s" % options.profile)
+
+        if self.repodata_cache_dir:
+            print("repodata: parsed %d files, %d bytes decompressed, %d files reused from %s" % (self.repodata_stats['files'], self.repodata_stats['bytes_decompressed'], self.repodata_stats['cached'], self.repodata_cache_dir))
+        else:
+            print("repodata: parsed %d files, %d bytes decompressed" % (self.repodata_stats['files'], self.repodata_stats['bytes_decompressed']))
 
-
-if os.path.isdir(publish_cache_dir):
-   create_cache(publish_cache_dir)
-else:
-   print("ERROR: Directory not found '%s" % publish_cache_dir)
+    def test(self):
+        pkg_data = self.pkg_data
+        names = self.strings.names
+        for rpm_type in rpm_types:
+            print("")
+            print("==== %s ====" % rpm_type)
+            print("")
+            rpm_repodata_primary_list = self.get_repo_primary_data_list(rpm_type=rpm_type, arch_list=default_arch_by_type[rpm_type])
+            self.read_data_from_repodata_primary_list(rpm_repodata_primary_list, rpm_type=rpm_type, arch_list=default_arch_by_type[rpm_type])
+            rpm_repodata_filelists_list = self.get_repo_filelists_data_list(rpm_type=rpm_type, arch_list=default_arch_by_type[rpm_type])
+            self.read_data_from_repodata_filelists_list(rpm_repodata_filelists_list, rpm_type=rpm_type, arch_list=default_arch_by_type[rpm_type])
+            self.calulate_all_direct_requires_and_descendants(rpm_type=rpm_type)
+            self.calulate_all_transitive_requires(rpm_type=rpm_type)
+            self.calulate_all_transitive_descendants(rpm_type=rpm_type)
+
+            for name in pkg_data[rpm_type]['pkg_direct_requires']:
+                print("%s needs %s" % (names[name], self.sorted_names(pkg_data[rpm_type]['pkg_direct_requires'][name])))
+
+            for name in pkg_data[rpm_type]['pkg_direct_descendants']:
+                print("%s informs %s" % (names[name], self.sorted_names(pkg_data[rpm_type]['pkg_direct_descendants'][name])))
+
+            for name in pkg_data[rpm_type]['pkg_transitive_requires']:
+                print("%s needs %s" % (names[name], self.sorted_names(pkg_data[rpm_type]['pkg_transitive_requires'][name])))
+                print("")
+
+            for name in pkg_data[rpm_type]['pkg_transitive_descendants']:
+                print("%s informs %s" % (names[name], self.sorted_names(pkg_data[rpm_type]['pkg_transitive_descendants'][name])))
+                print("")
+
+
+def main(argv):
+    parser = make_option_parser()
+    (options, args) = parser.parse_args(argv)
+    try:
+        validate_options(options)
+    except ValueError as e:
+        print("ERROR: %s" % e)
+        return 1
+
+    if not [d for d in mirror_dirs if os.path.isdir(d)]:
+        print("ERROR: directory not found %s" % mirror_dirs[-1])
+        return 1
+
+    for var in [ 'MY_REPO', 'MY_WORKSPACE' ]:
+        if var not in os.environ:
+            print("ERROR: environment variable %s is not set" % var)
+            return 1
+    my_repo = os.environ['MY_REPO']
+    my_workspace = os.environ['MY_WORKSPACE']
+
+    if not os.path.isdir(my_repo):
+        print("ERROR: directory not found MY_REPO=%s" % my_repo)
+        return 1
+
+    centos_repo_dir = get_centos_repo_dir(my_repo)
+    if not os.path.isdir(centos_repo_dir):
+        print("ERROR: directory not found %s" % centos_repo_dir)
+        return 1
+
+    if options.third_party_repo_dir and not os.path.isdir(options.third_party_repo_dir):
+        print("ERROR: directory not found %s" % options.third_party_repo_dir)
+        return 1
+
+    publish_cache_dir = options.cache_dir or get_default_cache_dir(my_repo)
+
+    # Create directory if required
+    if not os.path.isdir(publish_cache_dir):
+        print("Creating directory: %s" % publish_cache_dir)
+        os.makedirs(publish_cache_dir, 0o755)
+
+    if options.repodata_cache_dir and not os.path.isdir(options.repodata_cache_dir):
+        print("Creating directory: %s" % options.repodata_cache_dir)
+        os.makedirs(options.repodata_cache_dir, 0o755)
+
+    build_type_roots = {}
+    for bt in get_option_build_types(options):
+        build_type_roots[bt] = make_mirror_roots(my_repo, my_workspace, options.third_party_repo_dir, build_types=[bt])
+    cache = DependancyCache(make_mirror_roots(my_repo, my_workspace, options.third_party_repo_dir), options,
+                            build_type_roots=build_type_roots)
+    with timed_phase(cache.phase_report, 'create_cache'):
+        cache.create_cache(publish_cache_dir)
+    if options.timing_report:
+        write_timing_report(options.timing_report, cache.phase_report, options)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
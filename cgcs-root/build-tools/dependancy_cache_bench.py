@@ -0,0 +1,262 @@
+#!/usr/bin/python3
+
+#
+# Copyright (c) 2018 Wind River Systems, Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+#
+
+#
+# Benchmark create_dependancy_cache.py on synthetic trees written by
+# dependancy_cache_synth.py, so that a change in its complexity shows up
+# without a real mirror.
+#
+# For each size, a tree is generated once, then a DependancyCache of
+# create_dependancy_cache.py is run on it in this process, --repeat times,
+# with the tree as its only mirror roots.  No mirror under /import/mirrors
+# or /export/jenkins/mirrors is needed.  The best wall time of each stage
+# is reported:
+#   parse     discovery, primary and filelists
+#   direct    direct requires resolution
+#   closure   transitive requires and descendants
+#   write     writing the cache files
+#   total     the whole run
+# along with the growth exponent of each stage between consecutive sizes,
+# log(t2/t1) / log(n2/n1), about 1 for a stage that is linear in the
+# number of packages.
+#
+# Usage:
+#   dependancy_cache_bench.py [options] [-- create_dependancy_cache.py options]
+#
+# With --json the results are saved, and with --baseline a previous --json
+# file is compared against; the exit status is 1 if a stage got slower than
+# --threshold times its baseline time.
+#
+# The same trees and stages are benchmarked by test_dependancy_cache_bench.py
+# with pytest-benchmark, see test-requirements.txt.
+#
+
+from optparse import OptionParser
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+
+import create_dependancy_cache
+import dependancy_cache_synth
+
+STAGES = [ ('parse', ['discovery', 'primary', 'lazy_filelists', 'filelists']),
+           ('direct', ['direct']),
+           ('closure', ['transitive_requires', 'transitive_descendants']),
+           ('write', ['write']),
+           ('total', ['create_cache']) ]
+
+# Don't flag stages this short, their times are mostly noise
+MIN_COMPARE_S = 0.05
+
+
+# Return map stage -> wall time in seconds, from the phases of a run, as
+# timed by create_dependancy_cache.timed_phase()
+def get_stage_times(phases):
+    times = dict([(stage, 0.0) for (stage, phases) in STAGES])
+    for entry in phases:
+        for (stage, stage_phases) in STAGES:
+            if entry['phase'] in stage_phases:
+                times[stage] += entry['wall_s']
+    return times
+
+# Build the cache of the tree under 'root' into 'cache_dir' once, with the
+# create_dependancy_cache.py options 'options', as its main() does.  The
+# output of the run goes to 'log'.  Returns the phases of the run.
+def build_cache(root, cache_dir, options, log=None):
+    my_repo = os.path.join(root, 'repo')
+    my_workspace = os.path.join(root, 'workspace')
+    build_type_roots = {}
+    for bt in create_dependancy_cache.get_option_build_types(options):
+        build_type_roots[bt] = create_dependancy_cache.make_mirror_roots(my_repo, my_workspace, build_types=[bt])
+    cache = create_dependancy_cache.DependancyCache(create_dependancy_cache.make_mirror_roots(my_repo, my_workspace),
+                                                    options, build_type_roots=build_type_roots)
+    if os.path.exists(cache_dir):
+        shutil.rmtree(cache_dir)
+    os.makedirs(cache_dir)
+    stdout = sys.stdout
+    if log is not None:
+        sys.stdout = log
+    try:
+        with create_dependancy_cache.timed_phase(cache.phase_report, 'create_cache'):
+            cache.create_cache(cache_dir)
+    finally:
+        sys.stdout = stdout
+    return cache.phase_report
+
+# Build the cache of the tree under 'root' 'repeat' times, with the
+# create_dependancy_cache.py options 'options'.
+# Returns map stage -> best wall time in seconds.
+def run_cache(root, repeat, options):
+    cache_dir = os.path.join(root, 'cache')
+    log_path = os.path.join(root, 'run.log')
+    best = None
+    for i in range(repeat):
+        with open(log_path, 'w') as log:
+            try:
+                phases = build_cache(root, cache_dir, options, log=log)
+            except Exception as e:
+                traceback.print_exc(file=log)
+                raise RuntimeError("create_cache of %s failed: %s, see %s" % (root, e, log_path))
+        times = get_stage_times(phases)
+        if best is None:
+            best = times
+        else:
+            for stage in best:
+                best[stage] = min(best[stage], times[stage])
+    return best
+
+# Return the growth exponent between (n1, t1) and (n2, t2), or None when
+# a time is too small to tell
+def growth(n1, t1, n2, t2):
+    if n1 == n2 or t1 < MIN_COMPARE_S or t2 < MIN_COMPARE_S:
+        return None
+    return math.log(t2 / t1) / math.log(float(n2) / n1)
+
+def print_results(results):
+    stages = [stage for (stage, phases) in STAGES]
+    print("%10s %10s " % ('packages', 'generate') + ' '.join(['%16s' % s for s in stages]))
+    prev = None
+    for result in results:
+        cols = []
+        for stage in stages:
+            t = result['times'][stage]
+            g = None
+            if prev is not None:
+                g = growth(prev['packages'], prev['times'][stage], result['packages'], t)
+            if g is None:
+                cols.append('%16s' % ('%.3f' % t))
+            else:
+                cols.append('%16s' % ('%.3f (n^%.2f)' % (t, g)))
+        print("%10d %10.3f " % (result['packages'], result['generate_s']) + ' '.join(cols))
+        prev = result
+
+# Compare 'results' to 'baseline', both lists as saved by --json.
+# Returns the list of regressions found, as printable strings.
+def compare(results, baseline, threshold):
+    base_times = dict([(b['packages'], b['times']) for b in baseline])
+    regressions = []
+    for result in results:
+        base = base_times.get(result['packages'])
+        if base is None:
+            continue
+        for (stage, phases) in STAGES:
+            t = result['times'][stage]
+            b = base.get(stage)
+            if b is None or max(t, b) < MIN_COMPARE_S:
+                continue
+            if t > b * threshold:
+                regressions.append("%d packages, %s: %.3fs, baseline %.3fs" % (result['packages'], stage, t, b))
+    return regressions
+
+
+def main(argv):
+    parser = OptionParser('%prog [options] [-- create_dependancy_cache.py options]')
+    parser.add_option('-n', '--sizes', action='store', type='string',
+        dest='sizes', default='1000,10000,100000',
+        help='comma seperated list of numbers of rpms')
+    parser.add_option('-f', '--fanout', action='store', type='int',
+        dest='fanout', default=4,
+        help='most requires of an rpm')
+    parser.add_option('-c', '--cycles', action='store', type='int',
+        dest='cycles', default=10,
+        help='number of extra dependency cycles')
+    parser.add_option('-F', '--file_requires', action='store', type='float',
+        dest='file_requires', default=0.1,
+        help='fraction of requires that are on a file')
+    parser.add_option('-s', '--seed', action='store', type='int',
+        dest='seed', default=0,
+        help='random seed')
+    parser.add_option('-r', '--repeat', action='store', type='int',
+        dest='repeat', default=3,
+        help='runs per size, the best time of each stage is kept')
+    parser.add_option('-w', '--work_dir', action='store', type='string',
+        dest='work_dir',
+        help='generate the trees here, default a temporary directory')
+    parser.add_option('-k', '--keep', action='store_true',
+        dest='keep', default=False,
+        help='keep the generated trees')
+    parser.add_option('-j', '--json', action='store', type='string',
+        dest='json',
+        help='save the results to this file')
+    parser.add_option('-b', '--baseline', action='store', type='string',
+        dest='baseline',
+        help='compare to the results saved by an earlier --json')
+    parser.add_option('-t', '--threshold', action='store', type='float',
+        dest='threshold', default=1.5,
+        help='with --baseline, fail if a stage takes more than this times its baseline')
+    (options, args) = parser.parse_args(argv)
+
+    try:
+        sizes = [int(n) for n in options.sizes.split(',')]
+    except ValueError:
+        print("ERROR: bad --sizes '%s'" % options.sizes)
+        return 1
+    if min(sizes) < 4:
+        print("ERROR: at least 4 packages are needed")
+        return 1
+
+    (cache_options, cache_args) = create_dependancy_cache.make_option_parser().parse_args(args)
+    cache_options.quiet = True
+    try:
+        create_dependancy_cache.validate_options(cache_options)
+    except ValueError as e:
+        print("ERROR: %s" % e)
+        return 1
+
+    work_dir = options.work_dir
+    if work_dir is None:
+        work_dir = tempfile.mkdtemp(prefix='dependancy_cache_bench.')
+    elif not os.path.isdir(work_dir):
+        os.makedirs(work_dir)
+
+    results = []
+    try:
+        for n in sizes:
+            root = os.path.join(work_dir, 'tree-%d' % n)
+            start = time.time()
+            dependancy_cache_synth.write_tree(root, n, fanout=options.fanout, cycles=options.cycles,
+                                              file_requires=options.file_requires, seed=options.seed)
+            generate_s = time.time() - start
+            times = run_cache(root, options.repeat, cache_options)
+            results.append({ 'packages': n, 'generate_s': round(generate_s, 3),
+                             'times': dict([(k, round(v, 3)) for (k, v) in times.items()]) })
+    except RuntimeError as e:
+        # keep the tree and run.log to look at
+        options.keep = True
+        print("ERROR: %s" % e)
+        return 1
+    finally:
+        if not options.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_results(results)
+
+    if options.json:
+        with open(options.json, 'w') as f:
+            json.dump(results, f, indent=2, separators=(',', ': '), sort_keys=True)
+            f.write("\n")
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, options.threshold)
+        if regressions:
+            print("Regressions, more than %.2f times the baseline:" % options.threshold)
+            for r in regressions:
+                print("   %s" % r)
+            return 1
+        print("No regressions against %s" % options.baseline)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,251 @@
+#!/usr/bin/python3
+
+#
+# Copyright (c) 2018 Wind River Systems, Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+#
+
+#
+# SQLite store of the dependency graph computed by create_dependancy_cache.py,
+# written with its --db option.  Unlike the flat cache files, the store keeps
+# the graph itself, so any closure can be asked for later, with a recursive
+# query, without building the graph again.
+#
+# Tables, all names are ids into 'names':
+#   names          id, name
+#   packages       type ('RPM' or 'SRPM'), pkg
+#   provides       type, cap, pkg          the package a capability resolves to
+#   requires       type, pkg, req, flags, evr, rpm
+#                                          each requirement of a package, and
+#                                          the rpm it resolved to, if any
+#   edges          type, pkg, dep          direct requires, as in
+#                                          <type>-direct-requires
+#   requires_rpm   srpm, rpm               as in SRPM-direct-requires-rpm
+#   rpm_srpm       rpm, srpm               as in rpm-to-srpm
+#
+# Usage:
+#   dependancy_cache_db.py requires <db> <name> [RPM|SRPM]
+#       transitive requires of <name>
+#   dependancy_cache_db.py descendants <db> <name> [RPM|SRPM]
+#       packages that transitively require <name>
+#   dependancy_cache_db.py rebuild <db> <name>
+#       SRPMs to rebuild if the SRPM or RPM <name> changes, as
+#       dependancy_cache_planner.py plans them
+#   dependancy_cache_db.py provides <db> <capability> [RPM|SRPM]
+#       the package a capability resolves to
+#
+
+import os
+import sqlite3
+import sys
+
+DB_VERSION=2
+
+SCHEMA = """
+CREATE TABLE info (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE names (id INTEGER PRIMARY KEY, name TEXT NOT NULL);
+CREATE TABLE packages (type TEXT NOT NULL, pkg INTEGER NOT NULL);
+CREATE TABLE provides (type TEXT NOT NULL, cap INTEGER NOT NULL, pkg INTEGER NOT NULL);
+CREATE TABLE requires (type TEXT NOT NULL, pkg INTEGER NOT NULL, req INTEGER NOT NULL,
+                       flags TEXT, evr TEXT, rpm INTEGER);
+CREATE TABLE edges (type TEXT NOT NULL, pkg INTEGER NOT NULL, dep INTEGER NOT NULL);
+CREATE TABLE requires_rpm (srpm INTEGER NOT NULL, rpm INTEGER NOT NULL);
+CREATE TABLE rpm_srpm (rpm INTEGER NOT NULL, srpm INTEGER NOT NULL);
+"""
+
+# Created after the bulk insert, which is faster than maintaining them
+INDEXES = """
+CREATE UNIQUE INDEX names_name ON names (name);
+CREATE UNIQUE INDEX packages_pkg ON packages (type, pkg);
+CREATE INDEX provides_cap ON provides (type, cap);
+CREATE INDEX requires_pkg ON requires (type, pkg);
+CREATE INDEX requires_req ON requires (type, req);
+CREATE INDEX edges_pkg ON edges (type, pkg);
+CREATE INDEX edges_dep ON edges (type, dep);
+CREATE INDEX requires_rpm_srpm ON requires_rpm (srpm);
+CREATE INDEX requires_rpm_rpm ON requires_rpm (rpm);
+CREATE INDEX rpm_srpm_rpm ON rpm_srpm (rpm);
+CREATE INDEX rpm_srpm_srpm ON rpm_srpm (srpm);
+"""
+
+TABLE_COLUMNS = { 'packages': 2, 'provides': 3, 'requires': 6, 'edges': 3,
+                  'requires_rpm': 2, 'rpm_srpm': 2 }
+
+
+# Write a new store to 'db_path', replacing any old one.
+#    names= list of names, a name's id is its position in the list
+#    tables= map table name -> iterable of rows, for each of TABLE_COLUMNS
+# The store is built in a temporary file and renamed into place, so
+# readers see either the old store or the complete new one.
+def write_db(db_path, names, tables):
+    tmp_path = "%s.%d.tmp" % (db_path, os.getpid())
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.execute("PRAGMA journal_mode=OFF")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.executescript(SCHEMA)
+            conn.execute("INSERT INTO info VALUES ('version', ?)", (str(DB_VERSION),))
+            conn.executemany("INSERT INTO names VALUES (?, ?)",
+                             ((i, name) for (i, name) in enumerate(names) if name is not None))
+            for (table, n_columns) in sorted(TABLE_COLUMNS.items()):
+                conn.executemany("INSERT INTO %s VALUES (%s)" % (table, ','.join('?' * n_columns)),
+                                 tables.get(table, ()))
+            conn.executescript(INDEXES)
+            conn.commit()
+            # WAL, so readers never block on, or get blocked by, a writer
+            conn.execute("PRAGMA journal_mode=WAL")
+        finally:
+            conn.close()
+        os.rename(tmp_path, db_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return db_path
+
+
+# Read only access to a store written by write_db()
+class CacheDb(object):
+    def __init__(self, path):
+        if not os.path.isfile(path):
+            raise ValueError("%s: no such dependancy cache db" % path)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        try:
+            version = self.conn.execute("SELECT value FROM info WHERE key = 'version'").fetchone()
+        except sqlite3.DatabaseError:
+            version = None
+        if version is None or version[0] != str(DB_VERSION):
+            self.close()
+            raise ValueError("%s: not a dependancy cache db, or unsupported version" % path)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Return the id of 'name', or None if it is not known
+    def lookup(self, name):
+        row = self.conn.execute("SELECT id FROM names WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def _names(self, query, args):
+        return sorted(row[0] for row in self.conn.execute(query, args))
+
+    # Return the sorted names of the packages 'name' transitively requires.
+    # For a SRPM, as in SRPM-transitive-requires, these are the SRPMs of the
+    # rpms that satisfy its BuildRequires, and of what those rpms require.
+    # An rpm of the same name as the SRPM is left out, as there.
+    def transitive_requires(self, name, rpm_type='RPM'):
+        pkg = self.lookup(name)
+        if rpm_type == 'RPM':
+            return self._names("""
+                WITH RECURSIVE closure(id) AS (
+                    SELECT dep FROM edges WHERE type = 'RPM' AND pkg = ?
+                    UNION
+                    SELECT e.dep FROM edges e JOIN closure c ON e.pkg = c.id WHERE e.type = 'RPM')
+                SELECT n.name FROM closure c JOIN names n ON n.id = c.id WHERE c.id != ?""", (pkg, pkg))
+        return self._names("""
+            WITH RECURSIVE closure(id) AS (
+                SELECT rpm FROM requires_rpm WHERE srpm = ? AND rpm != ?
+                UNION
+                SELECT e.dep FROM edges e JOIN closure c ON e.pkg = c.id WHERE e.type = 'RPM')
+            SELECT DISTINCT n.name FROM closure c
+                JOIN rpm_srpm s ON s.rpm = c.id
+                JOIN names n ON n.id = s.srpm
+                WHERE c.id != ?""", (pkg, pkg, pkg))
+
+    # Return the sorted names of the packages that transitively require
+    # 'name', as in <rpm_type>-transitive-descendants
+    def transitive_descendants(self, name, rpm_type='RPM'):
+        pkg = self.lookup(name)
+        return self._names("""
+            WITH RECURSIVE closure(id) AS (
+                SELECT pkg FROM edges WHERE type = ? AND dep = ?
+                UNION
+                SELECT e.pkg FROM edges e JOIN closure c ON e.dep = c.id WHERE e.type = ?)
+            SELECT n.name FROM closure c JOIN names n ON n.id = c.id WHERE c.id != ?""",
+            (rpm_type, pkg, rpm_type, pkg))
+
+    # Return the sorted names of the SRPMs to rebuild if the SRPM or rpm
+    # 'name' changes, the same set dependancy_cache_planner.get_rebuild_set()
+    # gives: the SRPM, or the SRPMs of the rpm, and their transitive
+    # descendants, as in SRPM-transitive-descendants.
+    def rebuild(self, name):
+        pkg = self.lookup(name)
+        return self._names("""
+            WITH RECURSIVE changed(id) AS (
+                SELECT pkg FROM packages WHERE type = 'SRPM' AND pkg = ?
+                UNION
+                SELECT srpm FROM rpm_srpm WHERE rpm = ? AND NOT EXISTS (
+                    SELECT 1 FROM packages WHERE type = 'SRPM' AND pkg = ?)),
+            rebuild(id) AS (
+                SELECT id FROM changed
+                UNION
+                SELECT e.pkg FROM edges e JOIN rebuild r ON e.dep = r.id WHERE e.type = 'SRPM')
+            SELECT n.name FROM rebuild r JOIN names n ON n.id = r.id""", (pkg, pkg, pkg))
+
+    # Return the name of the package 'cap' resolves to, or None
+    def provider(self, cap, rpm_type='RPM'):
+        row = self.conn.execute("""
+            SELECT n.name FROM provides p JOIN names n ON n.id = p.pkg
+                WHERE p.type = ? AND p.cap = ?""", (rpm_type, self.lookup(cap))).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+
+def usage():
+    prog = os.path.basename(sys.argv[0])
+    print("usage: %s requires <db> <name> [RPM|SRPM]" % prog)
+    print("       %s descendants <db> <name> [RPM|SRPM]" % prog)
+    print("       %s rebuild <db> <name>" % prog)
+    print("       %s provides <db> <capability> [RPM|SRPM]" % prog)
+
+def main(argv):
+    if len(argv) < 3 or len(argv) > 4:
+        usage()
+        return 1
+    (command, db_path, name) = argv[:3]
+    rpm_type = 'RPM'
+    if len(argv) == 4:
+        rpm_type = argv[3]
+    if rpm_type not in ('RPM', 'SRPM'):
+        usage()
+        return 1
+
+    with CacheDb(db_path) as db:
+        if db.lookup(name) is None:
+            print("ERROR: '%s' not found in %s" % (name, db_path))
+            return 1
+        if command == 'requires':
+            values = db.transitive_requires(name, rpm_type=rpm_type)
+        elif command == 'descendants':
+            values = db.transitive_descendants(name, rpm_type=rpm_type)
+        elif command == 'rebuild' and len(argv) == 3:
+            values = db.rebuild(name)
+        elif command == 'provides':
+            provider = db.provider(name, rpm_type=rpm_type)
+            if provider is None:
+                print("ERROR: nothing provides '%s'" % name)
+                return 1
+            values = [provider]
+        else:
+            usage()
+            return 1
+    print("%s;%s" % (name, ','.join(values)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,186 @@
+#!/usr/bin/python3
+
+#
+# Copyright (c) 2018 Wind River Systems, Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+#
+
+#
+# Compare two generations of the dependency cache written by
+# create_dependancy_cache.py, e.g. before and after a mirror refresh, and
+# report the edges added and removed for each package.
+#
+# The lines of a cache file are sorted by name, so the two generations of
+# a file are read side by side, in one pass, by a merge-join on the names.
+# Only the current line of each is held in memory, and a line is only split
+# into names when it differs, so the memory used grows with the size of
+# the change, not the size of the graph.
+#
+# Usage:
+#   dependancy_cache_diff.py [options] <old_cache_dir> <new_cache_dir>
+#
+# For each cache file compared, prints
+#   ==== <cache-file> ====
+#   +<name>;<names>               a package only in the new cache
+#   -<name>;<names>               a package only in the old cache
+#   <name>;+<names>;-<names>      the names added to and removed from the
+#                                 list of a package
+# and a summary line.  The exit status is 0 if the caches are the same,
+# 1 if they differ, and 2 on error, as for diff.
+#
+
+from optparse import OptionParser
+import os
+import sys
+
+import dependancy_cache_index
+
+# The files compared by default, the direct and transitive requires
+default_cache_names = [ 'RPM-direct-requires', 'RPM-transitive-requires',
+                        'SRPM-direct-requires', 'SRPM-transitive-requires' ]
+
+# Status of a package in the output of diff_cache_files()
+ADDED = '+'
+REMOVED = '-'
+CHANGED = ''
+
+
+# Iterate over the lines of a cache file, as (name, values), with values
+# the comma seperated list of names, not split.  A missing file has no
+# lines.  Raises ValueError if the names are not sorted, as a merge-join
+# on them would give wrong results.
+def iter_cache_lines(path):
+    if not os.path.exists(path):
+        return
+    previous = None
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if line == "":
+                continue
+            i = line.find(';')
+            if i < 0:
+                raise ValueError("%s: not a cache file line '%s'" % (path, line))
+            name = line[:i]
+            if previous is not None and name <= previous:
+                raise ValueError("%s: '%s' is out of order, after '%s'" % (path, name, previous))
+            previous = name
+            yield (name, line[i+1:])
+
+def split_values(values):
+    if values == "":
+        return []
+    return values.split(',')
+
+# Compare two generations of a cache file, in one pass over both.
+# Iterates over (name, status, added, removed) for each package whose line
+# differs, in name order.  status is ADDED for a package only in the new
+# file, REMOVED for one only in the old file, CHANGED otherwise.  added
+# and removed are the names added to and removed from its list.
+def diff_cache_files(old_path, new_path):
+    old_lines = iter_cache_lines(old_path)
+    new_lines = iter_cache_lines(new_path)
+    old = next(old_lines, None)
+    new = next(new_lines, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            yield (old[0], REMOVED, [], split_values(old[1]))
+            old = next(old_lines, None)
+        elif old is None or new[0] < old[0]:
+            yield (new[0], ADDED, split_values(new[1]), [])
+            new = next(new_lines, None)
+        else:
+            if old[1] != new[1]:
+                old_values = split_values(old[1])
+                new_values = split_values(new[1])
+                old_set = set(old_values)
+                new_set = set(new_values)
+                added = [v for v in new_values if v not in old_set]
+                removed = [v for v in old_values if v not in new_set]
+                if added or removed:
+                    yield (new[0], CHANGED, added, removed)
+            old = next(old_lines, None)
+            new = next(new_lines, None)
+
+# Return the names of the cache files in either of 'cache_dirs'
+def list_cache_names(cache_dirs):
+    cache_names = set()
+    for cache_dir in cache_dirs:
+        for fn in os.listdir(cache_dir):
+            if not dependancy_cache_index.is_cache_text_name(fn):
+                continue
+            if os.path.isfile(os.path.join(cache_dir, fn)):
+                cache_names.add(fn)
+    return sorted(cache_names)
+
+# Print the differences of one cache file, see the usage above.
+# Returns the counts (added packages, removed packages, changed packages,
+# added edges, removed edges).
+def print_cache_diff(old_dir, new_dir, cache_name, summary_only=False):
+    counts = { ADDED: 0, REMOVED: 0, CHANGED: 0 }
+    added_edges = 0
+    removed_edges = 0
+    if not summary_only:
+        print("==== %s ====" % cache_name)
+    for (name, status, added, removed) in diff_cache_files(os.path.join(old_dir, cache_name),
+                                                           os.path.join(new_dir, cache_name)):
+        counts[status] += 1
+        added_edges += len(added)
+        removed_edges += len(removed)
+        if summary_only:
+            continue
+        if status == ADDED:
+            print("+%s;%s" % (name, ','.join(added)))
+        elif status == REMOVED:
+            print("-%s;%s" % (name, ','.join(removed)))
+        else:
+            print("%s;+%s;-%s" % (name, ','.join(added), ','.join(removed)))
+    print("%s: %d packages added, %d removed, %d changed; %d edges added, %d removed" %
+          (cache_name, counts[ADDED], counts[REMOVED], counts[CHANGED], added_edges, removed_edges))
+    return (counts[ADDED], counts[REMOVED], counts[CHANGED], added_edges, removed_edges)
+
+
+def main(argv):
+    parser = OptionParser('%prog [options] <old_cache_dir> <new_cache_dir>')
+    parser.add_option('-f', '--file', action='append',
+        dest='cache_names', default=[],
+        help='compare this cache file, may be repeated, default %s' % ','.join(default_cache_names))
+    parser.add_option('-a', '--all', action='store_true',
+        dest='all', default=False,
+        help='compare every cache file')
+    parser.add_option('-s', '--summary', action='store_true',
+        dest='summary', default=False,
+        help='only print the summary line of each cache file')
+    (options, args) = parser.parse_args(argv)
+    if len(args) != 2:
+        parser.print_usage()
+        return 2
+    (old_dir, new_dir) = args
+    for d in args:
+        if not os.path.isdir(d):
+            print("ERROR: directory not found %s" % d)
+            return 2
+
+    if options.all:
+        cache_names = list_cache_names(args)
+    else:
+        cache_names = options.cache_names or default_cache_names
+
+    differ = False
+    for cache_name in cache_names:
+        for d in args:
+            if not os.path.isfile(os.path.join(d, cache_name)):
+                print("WARNING: %s not found in %s, taken as empty" % (cache_name, d))
+        try:
+            if any(print_cache_diff(old_dir, new_dir, cache_name, summary_only=options.summary)):
+                differ = True
+        except (IOError, OSError, ValueError) as e:
+            print("ERROR: %s" % e)
+            return 2
+    if differ:
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
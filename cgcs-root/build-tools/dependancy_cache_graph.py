@@ -0,0 +1,60 @@
+#!/usr/bin/python3
+
+#
+# Copyright (c) 2018 Wind River Systems, Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+#
+
+#
+# Graph algorithms shared by create_dependancy_cache.py and the tools that
+# read its cache, e.g. dependancy_cache_planner.py.  Graphs are maps
+# node -> list of successor nodes, of any hashable node type.
+#
+
+
+# Return the strongly connected components of a directed graph, using an
+# iterative form of Tarjan's algorithm.
+#    graph= map node -> list of successor nodes.  Successors need not be keys.
+# Components are returned in reverse topological order, i.e. a component is
+# listed after every component it can reach.
+def strongly_connected_components(graph):
+    index = {}
+    lowlink = {}
+    on_stack = set()
+    stack = []
+    components = []
+    for root in graph:
+        if root in index:
+            continue
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(graph[root]))]
+        while work:
+            node, successors = work[-1]
+            for succ in successors:
+                if succ not in index:
+                    index[succ] = lowlink[succ] = len(index)
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    work.append((succ, iter(graph.get(succ, ()))))
+                    break
+                elif succ in on_stack and index[succ] < lowlink[node]:
+                    lowlink[node] = index[succ]
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    if lowlink[node] < lowlink[parent]:
+                        lowlink[parent] = lowlink[node]
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        n = stack.pop()
+                        on_stack.discard(n)
+                        component.append(n)
+                        if n == node:
+                            break
+                    components.append(component)
+    return components
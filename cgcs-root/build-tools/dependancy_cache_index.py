@@ -0,0 +1,314 @@
+#!/usr/bin/python3
+
+#
+# Copyright (c) 2018 Wind River Systems, Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+#
+
+#
+# Binary index for the files of the dependency cache written by
+# create_dependancy_cache.py.
+#
+# A cache file such as RPM-transitive-descendants has format
+#   <rpm-name>;<comma-seperated-list-of-rpm-names>
+# The matching index file, e.g. RPM-transitive-descendants.idx, holds the
+# same data in a form that can be memory mapped, and searched without
+# reading the whole file.  All integers are little endian.
+#
+#   header         see HEADER_FORMAT
+#   name_offsets   (n_names + 1) x uint32, offset of each name in name_blob
+#   name_blob      all names, utf-8, sorted, no separators
+#   adjacency      n_edges x uint32, name numbers, row after row
+#   keys           n_keys x uint32, name number of each row, ascending
+#   row_offsets    (n_keys + 1) x uint32, first edge of each row
+#
+# A name number is the position of the name in the sorted name table, so
+# both the names and the keys can be binary searched.
+#
+# Usage:
+#   dependancy_cache_index.py build <cache_file_or_dir> ...
+#   dependancy_cache_index.py query <index_file> <name> ...
+#
+
+from array import array
+import mmap
+import os
+import struct
+import sys
+
+INDEX_MAGIC=b'DCIX'
+INDEX_VERSION=1
+INDEX_SUFFIX='.idx'
+
+# Files in a cache directory that are not cache text files: the indexes,
+# temporary files, and the compressed copies and manifest written by
+# create_dependancy_cache.py --compress and --manifest
+NOT_CACHE_TEXT_SUFFIXES=(INDEX_SUFFIX, '.tmp', '.zst')
+NOT_CACHE_TEXT_NAMES=('MANIFEST.sha256',)
+
+#   magic, version, n_names, n_keys, n_edges,
+#   offsets of name_offsets, name_blob, adjacency, keys, row_offsets
+HEADER_FORMAT='<4sIIIIQQQQQ'
+HEADER_SIZE=struct.calcsize(HEADER_FORMAT)
+
+
+# Write the uint32 values 'a', an array('I'), to 'f' in little endian order
+def write_uint32_array(f, a):
+    if sys.byteorder != 'little':
+        a = array('I', a)
+        a.byteswap()
+    a.tofile(f)
+
+# Iterate over the rows of a text cache file, as (name, [ names ])
+def iter_cache_text(path):
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if line == "":
+                continue
+            (name, values) = line.split(';', 1)
+            if values == "":
+                yield (name, [])
+            else:
+                yield (name, values.split(','))
+
+# Return the content of a text cache file as a dict of name -> [ names ]
+def read_cache_text(path):
+    data = {}
+    for (name, values) in iter_cache_text(path):
+        data[name] = values
+    return data
+
+# Return True if the file 'fn' of a cache directory is a cache text file
+def is_cache_text_name(fn):
+    if fn.startswith('.') or fn in NOT_CACHE_TEXT_NAMES:
+        return False
+    return not fn.endswith(NOT_CACHE_TEXT_SUFFIXES)
+
+# Write the binary index of the text cache file 'text_path' to 'index_path',
+# by default the same path with INDEX_SUFFIX added.  The text file is read
+# twice, once for the names and once for the rows, so only the name table
+# is ever held in memory.  The index is written to a temporary file first,
+# so readers never see a partial index.
+def write_index_from_text(text_path, index_path=None):
+    if index_path is None:
+        index_path = text_path + INDEX_SUFFIX
+
+    name_set = set()
+    for (name, values) in iter_cache_text(text_path):
+        name_set.add(name.encode('utf-8'))
+        name_set.update(v.encode('utf-8') for v in values)
+    name_list = sorted(name_set)
+    name_set = None
+    number = {}
+    for (i, name) in enumerate(name_list):
+        number[name] = i
+
+    tmp_path = "%s.%d.tmp" % (index_path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(b'\0' * HEADER_SIZE)
+
+            name_offsets_pos = f.tell()
+            name_offsets = array('I', [0])
+            for name in name_list:
+                name_offsets.append(name_offsets[-1] + len(name))
+            write_uint32_array(f, name_offsets)
+            name_offsets = None
+
+            name_blob_pos = f.tell()
+            f.write(b''.join(name_list))
+            name_list = None
+
+            adjacency_pos = f.tell()
+            keys = array('I')
+            row_offsets = array('I', [0])
+            for (name, values) in iter_cache_text(text_path):
+                row = array('I', [number[v.encode('utf-8')] for v in values])
+                write_uint32_array(f, row)
+                keys.append(number[name.encode('utf-8')])
+                row_offsets.append(row_offsets[-1] + len(row))
+
+            # Rows of a text cache file are sorted by name, but do not
+            # rely on it, the keys must be ascending for the binary search.
+            if any(keys[i] >= keys[i + 1] for i in range(len(keys) - 1)):
+                raise ValueError("%s: rows are not sorted by name" % text_path)
+
+            keys_pos = f.tell()
+            write_uint32_array(f, keys)
+            row_offsets_pos = f.tell()
+            write_uint32_array(f, row_offsets)
+
+            f.seek(0)
+            f.write(struct.pack(HEADER_FORMAT, INDEX_MAGIC, INDEX_VERSION,
+                                len(number), len(keys), row_offsets[-1],
+                                name_offsets_pos, name_blob_pos, adjacency_pos,
+                                keys_pos, row_offsets_pos))
+        os.rename(tmp_path, index_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return index_path
+
+
+# Read only access to a binary index file.  Behaves like a read only dict
+# of name -> [ names ].  Each lookup is a binary search of the mapped file.
+class CacheIndex(object):
+    def __init__(self, path):
+        self.path = path
+        # The map keeps the file open on its own, so only the map is kept
+        with open(path, 'rb') as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, EnvironmentError):
+                raise ValueError("%s: not a dependancy cache index" % path)
+        if len(self._map) < HEADER_SIZE:
+            self.close()
+            raise ValueError("%s: not a dependancy cache index" % path)
+        (magic, version, self.n_names, self.n_keys, self.n_edges,
+         self._name_offsets_pos, self._name_blob_pos, self._adjacency_pos,
+         self._keys_pos, self._row_offsets_pos) = struct.unpack_from(HEADER_FORMAT, self._map, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            self.close()
+            raise ValueError("%s: not a dependancy cache index, or unsupported version" % path)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _uint32(self, pos, i):
+        return struct.unpack_from('<I', self._map, pos + 4 * i)[0]
+
+    def _name_bytes(self, i):
+        (start, end) = struct.unpack_from('<II', self._map, self._name_offsets_pos + 4 * i)
+        return self._map[self._name_blob_pos + start:self._name_blob_pos + end]
+
+    def _name(self, i):
+        return self._name_bytes(i).decode('utf-8')
+
+    # Return the number of 'name', or None if it is not in the name table
+    def _find_name(self, name):
+        name = name.encode('utf-8')
+        lo = 0
+        hi = self.n_names
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._name_bytes(mid) < name:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_names and self._name_bytes(lo) == name:
+            return lo
+        return None
+
+    # Return the row of name number 'i', or None if 'i' has no row
+    def _find_row(self, i):
+        lo = 0
+        hi = self.n_keys
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._uint32(self._keys_pos, mid) < i:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_keys and self._uint32(self._keys_pos, lo) == i:
+            return lo
+        return None
+
+    def _row_values(self, row):
+        (start, end) = struct.unpack_from('<II', self._map, self._row_offsets_pos + 4 * row)
+        numbers = struct.unpack_from('<%dI' % (end - start), self._map, self._adjacency_pos + 4 * start)
+        return [self._name(n) for n in numbers]
+
+    # Return the list of names for 'name', or 'default' if 'name' has no row
+    def get(self, name, default=None):
+        i = self._find_name(name)
+        if i is None:
+            return default
+        row = self._find_row(i)
+        if row is None:
+            return default
+        return self._row_values(row)
+
+    def __getitem__(self, name):
+        values = self.get(name)
+        if values is None:
+            raise KeyError(name)
+        return values
+
+    def __contains__(self, name):
+        i = self._find_name(name)
+        return i is not None and self._find_row(i) is not None
+
+    def __len__(self):
+        return self.n_keys
+
+    def __iter__(self):
+        return self.keys()
+
+    def keys(self):
+        for row in range(self.n_keys):
+            yield self._name(self._uint32(self._keys_pos, row))
+
+    def items(self):
+        for row in range(self.n_keys):
+            yield (self._name(self._uint32(self._keys_pos, row)), self._row_values(row))
+
+
+# Open the cache file 'cache_name' in 'cache_dir'.  Returns a CacheIndex if
+# an up to date index exists, else the parsed text file as a dict.
+def open_cache(cache_dir, cache_name):
+    text_path = os.path.join(cache_dir, cache_name)
+    index_path = text_path + INDEX_SUFFIX
+    if os.path.exists(index_path):
+        if not os.path.exists(text_path) or os.path.getmtime(index_path) >= os.path.getmtime(text_path):
+            return CacheIndex(index_path)
+    return read_cache_text(text_path)
+
+
+def usage():
+    print("usage: %s build <cache_file_or_dir> ..." % os.path.basename(sys.argv[0]))
+    print("       %s query <index_file> <name> ..." % os.path.basename(sys.argv[0]))
+
+def main(argv):
+    if len(argv) < 2:
+        usage()
+        return 1
+
+    if argv[0] == 'build':
+        for path in argv[1:]:
+            if os.path.isdir(path):
+                text_paths = [os.path.join(path, fn) for fn in sorted(os.listdir(path))
+                              if is_cache_text_name(fn)]
+            else:
+                text_paths = [path]
+            for text_path in text_paths:
+                if os.path.isfile(text_path):
+                    print(write_index_from_text(text_path))
+        return 0
+
+    if argv[0] == 'query' and len(argv) >= 3:
+        rc = 0
+        with CacheIndex(argv[1]) as index:
+            for name in argv[2:]:
+                values = index.get(name)
+                if values is None:
+                    print("ERROR: '%s' not found in %s" % (name, argv[1]))
+                    rc = 1
+                else:
+                    print("%s;%s" % (name, ','.join(values)))
+        return rc
+
+    usage()
+    return 1
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+
+#
+# Copyright (c) 2018 Wind River Systems, Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+#
+
+#
+# Rebuild planner for the dependency cache written by
+# create_dependancy_cache.py.
+#
+# Given the SRPMs that changed, work out every SRPM that must be rebuilt,
+# i.e. the changed ones and their SRPM-transitive-descendants, and order
+# them into waves.  Every SRPM of a wave only build requires SRPMs of
+# earlier waves, so all SRPMs of a wave can be built in parallel.
+#
+# SRPMs that build require each other, directly or not, can't be ordered.
+# Such a cycle, a strongly connected component of SRPM-direct-requires,
+# is placed in a single wave, as one group.
+#
+# Usage:
+#   dependancy_cache_planner.py <cache_dir> <srpm_or_rpm> ...
+#
+# prints one line per wave,
+#   <wave-number>;<comma-seperated-list-of-srpm-names>
+# with the members of a cycle joined by '+'.
+#
+
+import os
+import sys
+
+import dependancy_cache_index
+from dependancy_cache_graph import strongly_connected_components
+
+
+# Return the set of SRPMs to rebuild when the SRPMs 'changed' change:
+# those and all of their transitive descendants.
+#    descendants= map srpm -> list of transitive descendant srpms, as
+#                 SRPM-transitive-descendants
+def get_rebuild_set(changed, descendants):
+    rebuild = set(changed)
+    for name in changed:
+        rebuild.update(descendants.get(name, ()))
+    return rebuild
+
+# Order the SRPMs of 'rebuild' into waves.  Returns a list of waves, each a
+# sorted list of groups, each a sorted list of SRPM names.  A group has one
+# SRPM, or all the SRPMs of a build requires cycle.  A group is in the
+# earliest wave after the waves of every group it build requires, so the
+# number of waves is the length of the longest chain of build requires.
+#    direct_requires= map srpm -> list of srpms it directly build requires,
+#                     as SRPM-direct-requires.  Only SRPMs of 'rebuild' are
+#                     considered.
+def plan_waves(rebuild, direct_requires):
+    graph = {}
+    for name in rebuild:
+        graph[name] = [r for r in direct_requires.get(name, ()) if r in rebuild and r != name]
+
+    wave_of = {}
+    waves = []
+    # components come after every component they require, i.e. in build order
+    for component in strongly_connected_components(graph):
+        members = set(component)
+        wave = 0
+        for name in component:
+            for r in graph[name]:
+                if r not in members:
+                    wave = max(wave, wave_of[r] + 1)
+        for name in component:
+            wave_of[name] = wave
+        while len(waves) <= wave:
+            waves.append([])
+        waves[wave].append(sorted(component))
+    for groups in waves:
+        groups.sort()
+    return waves
+
+# Every RPM has a line in RPM-direct-requires, as it provides its own name,
+# while rpm-to-srpm lacks the RPMs without a sourcerpm.
+def is_known_rpm(cache_dir, name):
+    return name in dependancy_cache_index.open_cache(cache_dir, 'RPM-direct-requires')
+
+# Raised by plan_rebuild() for a known RPM that no known SRPM builds, so
+# there is no SRPM to rebuild for it.
+class NoSourceRpmError(Exception):
+    pass
+
+# Return the waves to rebuild 'changed', a list of SRPM or RPM names, using
+# the cache files in 'cache_dir'.  An RPM stands for the SRPM that builds
+# it.  See plan_waves() for the result.
+# Raises KeyError for a name that is neither a known SRPM nor RPM, and
+# NoSourceRpmError for an RPM without a source rpm.
+def plan_rebuild(cache_dir, changed):
+    rpm_to_srpm = dependancy_cache_index.open_cache(cache_dir, 'rpm-to-srpm')
+    srpm_to_rpm = dependancy_cache_index.open_cache(cache_dir, 'srpm-to-rpm')
+    descendants = dependancy_cache_index.open_cache(cache_dir, 'SRPM-transitive-descendants')
+    direct_requires = dependancy_cache_index.open_cache(cache_dir, 'SRPM-direct-requires')
+
+    changed_srpms = set()
+    for name in changed:
+        if name in srpm_to_rpm or name in direct_requires or name in descendants:
+            changed_srpms.add(name)
+        elif rpm_to_srpm.get(name):
+            changed_srpms.update(rpm_to_srpm[name])
+        elif name in rpm_to_srpm or is_known_rpm(cache_dir, name):
+            raise NoSourceRpmError(name)
+        else:
+            raise KeyError(name)
+
+    return plan_waves(get_rebuild_set(changed_srpms, descendants), direct_requires)
+
+
+def usage():
+    print("usage: %s <cache_dir> <srpm_or_rpm> ..." % os.path.basename(sys.argv[0]))
+
+def main(argv):
+    if len(argv) < 2:
+        usage()
+        return 1
+    try:
+        waves = plan_rebuild(argv[0], argv[1:])
+    except NoSourceRpmError as e:
+        print("ERROR: rpm '%s' has no source rpm" % e.args[0])
+        return 1
+    except KeyError as e:
+        print("ERROR: '%s' is not a known srpm or rpm" % e.args[0])
+        return 1
+    for (i, groups) in enumerate(waves):
+        print("%d;%s" % (i + 1, ','.join(['+'.join(group) for group in groups])))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,328 @@
+#!/usr/bin/python3
+
+#
+# Copyright (c) 2018 Wind River Systems, Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+#
+
+#
+# Query server for the dependency cache written by create_dependancy_cache.py.
+#
+# Looking up a package with
+#   grep "^<name>;" <cache_dir>/RPM-transitive-descendants
+# scans the whole cache file on every call.  The server loads the cache
+# files once, keeps them in memory indexed by name, and answers lookups
+# over a Unix socket.  Before answering, it checks, at most every
+# CHECK_INTERVAL seconds, whether a cache file was replaced, and if so
+# reloads it, so a running server follows the cache as it is rebuilt.
+#
+# The query client prints exactly what the grep above would, one line
+#   <name>;<comma-seperated-list-of-names>
+# per name found, and exits 0 if any name was found, 1 if none was, and 2
+# on error, so it can replace a grep pipeline as is.  With --values only
+# the list after the ';' is printed.  Names are read from stdin if the
+# only name given is '-', so many lookups can be sent as one batch.
+#
+# Usage:
+#   dependancy_cache_server.py serve -c <cache_dir> [-s <socket>]
+#   dependancy_cache_server.py query [-s <socket>] [-c <cache_dir>] [--values] <cache_file> <name> ...
+#
+# The socket is $MY_WORKSPACE/dependancy-cache.sock by default.  If the
+# query client can't connect to a server and -c is given, it reads the
+# cache file itself.
+#
+# Protocol: the client sends one request per line
+#   <cache_file> <name>
+# and closes its side of the connection.  The server then answers each
+# request, in order, with one line
+#   +<name>;<names>     the line of <name> in <cache_file>
+#   -                   <cache_file> has no line for <name>
+#   !<message>          the request failed, e.g. unknown cache file
+#
+
+from optparse import OptionParser
+import errno
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+import socketserver
+
+import dependancy_cache_index
+
+# Seconds between two checks of a cache file for changes
+CHECK_INTERVAL=1.0
+
+# Name of the default socket, under $MY_WORKSPACE
+SOCKET_NAME='dependancy-cache.sock'
+
+# First character of each answer line, see the protocol above
+FOUND = '+'
+NOT_FOUND = '-'
+FAILED = '!'
+
+
+# Return the default socket path, or None if $MY_WORKSPACE is not set
+def get_default_socket_path():
+    my_workspace = os.environ.get('MY_WORKSPACE')
+    if my_workspace is None:
+        return None
+    return os.path.join(my_workspace, SOCKET_NAME)
+
+# Return map name -> line, without the newline, of the open cache file 'f'
+def read_cache_lines(f):
+    lines = {}
+    for line in f:
+        line = line.rstrip('\n')
+        i = line.find(';')
+        if i < 0:
+            continue
+        lines[line[:i]] = line
+    return lines
+
+
+# The cache files of 'cache_dir', each loaded on first use and reloaded
+# when it is replaced.  Safe to use from several threads.
+class CacheFiles(object):
+    def __init__(self, cache_dir, check_interval=CHECK_INTERVAL, quiet=False):
+        self.cache_dir = cache_dir
+        self.check_interval = check_interval
+        self.quiet = quiet
+        # cache_name -> [ stamp, map name -> line, time of last check ]
+        self.files = {}
+        self.lock = threading.Lock()
+
+    def list_cache_names(self):
+        return sorted([fn for fn in os.listdir(self.cache_dir)
+                       if dependancy_cache_index.is_cache_text_name(fn)
+                          and os.path.isfile(os.path.join(self.cache_dir, fn))])
+
+    # Load every cache file now, rather than on first use
+    def load_all(self):
+        for cache_name in self.list_cache_names():
+            self.get_lines(cache_name)
+
+    # Return a value that changes whenever the cache file is replaced.
+    # The inode is part of it, as the cache files are replaced by rename.
+    def _stamp(self, st):
+        return (st.st_ino, st.st_size, st.st_mtime)
+
+    def _load(self, cache_name, path):
+        with open(path, 'r') as f:
+            # The stamp of the file actually read, even if it is replaced
+            # while being read
+            stamp = self._stamp(os.fstat(f.fileno()))
+            lines = read_cache_lines(f)
+        if not self.quiet:
+            print("loaded %s: %d lines" % (path, len(lines)))
+            sys.stdout.flush()
+        return [stamp, lines, time.time()]
+
+    # Return map name -> line of the cache file 'cache_name'.  Raises
+    # ValueError if there is no such cache file.
+    def get_lines(self, cache_name):
+        if os.sep in cache_name or not dependancy_cache_index.is_cache_text_name(cache_name):
+            raise ValueError("not a cache file '%s'" % cache_name)
+        path = os.path.join(self.cache_dir, cache_name)
+        with self.lock:
+            entry = self.files.get(cache_name)
+            now = time.time()
+            if entry is not None and now - entry[2] < self.check_interval:
+                return entry[1]
+            try:
+                stamp = self._stamp(os.stat(path))
+            except OSError:
+                self.files.pop(cache_name, None)
+                raise ValueError("no cache file '%s' in %s" % (cache_name, self.cache_dir))
+            if entry is not None and entry[0] == stamp:
+                entry[2] = now
+                return entry[1]
+            try:
+                entry = self._load(cache_name, path)
+            except (IOError, OSError) as e:
+                raise ValueError("can't read %s: %s" % (path, e))
+            self.files[cache_name] = entry
+            return entry[1]
+
+    # Return the line of 'name' in the cache file 'cache_name', or None
+    def lookup(self, cache_name, name):
+        return self.get_lines(cache_name).get(name)
+
+    # Return the answer line to the request line 'request', see the
+    # protocol above
+    def answer(self, request):
+        fields = request.split()
+        if len(fields) != 2:
+            return "%sbad request '%s'" % (FAILED, request)
+        try:
+            line = self.lookup(fields[0], fields[1])
+        except ValueError as e:
+            return "%s%s" % (FAILED, e)
+        if line is None:
+            return NOT_FOUND
+        return FOUND + line
+
+
+class QueryHandler(socketserver.StreamRequestHandler):
+    # All requests are read before any is answered, so a client sending a
+    # large batch can't block on a server blocked writing to it
+    def handle(self):
+        requests = [line.decode('utf-8').rstrip('\n') for line in self.rfile]
+        answers = [self.server.cache_files.answer(r) for r in requests if r != ""]
+        for answer in answers:
+            self.wfile.write((answer + "\n").encode('utf-8'))
+
+
+class QueryServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, cache_files):
+        self.cache_files = cache_files
+        socketserver.UnixStreamServer.__init__(self, socket_path, QueryHandler)
+
+
+# Remove 'socket_path' if it is left over from a server no longer running.
+# Returns False if a server is listening on it.
+def remove_stale_socket(socket_path):
+    if not os.path.exists(socket_path):
+        return True
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(socket_path)
+        return False
+    except socket.error as e:
+        if e.errno not in (errno.ECONNREFUSED, errno.ENOENT):
+            raise
+    finally:
+        s.close()
+    os.remove(socket_path)
+    return True
+
+def handle_sigterm(signum, frame):
+    raise SystemExit(0)
+
+# Serve the cache files of 'cache_dir' on 'socket_path' until terminated
+def serve(cache_dir, socket_path, quiet=False):
+    if not remove_stale_socket(socket_path):
+        print("ERROR: a server is already listening on %s" % socket_path)
+        return 1
+    cache_files = CacheFiles(cache_dir, quiet=quiet)
+    cache_files.load_all()
+    server = QueryServer(socket_path, cache_files)
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    print("serving %s on %s" % (cache_dir, socket_path))
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+    return 0
+
+# Send the requests (cache_name, name) to the server on 'socket_path'.
+# Returns the list of answer lines, in the same order.  Raises
+# socket.error if the server can't be reached.
+def send_queries(socket_path, requests):
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(socket_path)
+        s.sendall("".join(["%s %s\n" % r for r in requests]).encode('utf-8'))
+        s.shutdown(socket.SHUT_WR)
+        f = s.makefile('rb')
+        answers = [line.decode('utf-8').rstrip('\n') for line in f]
+        f.close()
+    finally:
+        s.close()
+    if len(answers) != len(requests):
+        raise socket.error("%d answers to %d requests from %s" % (len(answers), len(requests), socket_path))
+    return answers
+
+# Look up 'names' in the cache file 'cache_name' and print the lines found,
+# see the usage above.  Asks the server on 'socket_path', or if there is
+# none and 'cache_dir' is given, reads the cache file directly.
+# Returns the exit status, as for grep.
+def query(socket_path, cache_dir, cache_name, names, values_only=False):
+    requests = [(cache_name, name) for name in names]
+    answers = None
+    if socket_path is not None:
+        try:
+            answers = send_queries(socket_path, requests)
+        except socket.error as e:
+            if cache_dir is None:
+                sys.stderr.write("ERROR: can't query server on %s: %s\n" % (socket_path, e))
+                return 2
+    if answers is None:
+        if cache_dir is None:
+            sys.stderr.write("ERROR: no socket and no cache directory given\n")
+            return 2
+        cache_files = CacheFiles(cache_dir, quiet=True)
+        answers = [cache_files.answer("%s %s" % r) for r in requests]
+
+    rc = 1
+    for answer in answers:
+        if answer.startswith(FAILED):
+            sys.stderr.write("ERROR: %s\n" % answer[1:])
+            return 2
+        if answer.startswith(FOUND):
+            line = answer[1:]
+            if values_only:
+                line = line[line.find(';')+1:]
+            print(line)
+            rc = 0
+    return rc
+
+
+def usage():
+    print("usage: %s serve -c <cache_dir> [-s <socket>]" % os.path.basename(sys.argv[0]))
+    print("       %s query [-s <socket>] [-c <cache_dir>] [--values] <cache_file> <name> ..." % os.path.basename(sys.argv[0]))
+
+def main(argv):
+    if len(argv) < 1 or argv[0] not in ('serve', 'query'):
+        usage()
+        return 2
+    command = argv[0]
+
+    parser = OptionParser(add_help_option=False)
+    parser.add_option('-h', '--help', action='store_true', dest='help', default=False)
+    parser.add_option('-c', '--cache_dir', dest='cache_dir', default=None,
+        help='the dependency cache directory')
+    parser.add_option('-s', '--socket', dest='socket_path', default=get_default_socket_path(),
+        help='the server socket, default $MY_WORKSPACE/%s' % SOCKET_NAME)
+    parser.add_option('-v', '--values', action='store_true', dest='values', default=False,
+        help='only print the list of names of each line found')
+    parser.add_option('-q', '--quiet', action='store_true', dest='quiet', default=False,
+        help='do not log each cache file loaded')
+    (options, args) = parser.parse_args(argv[1:])
+    if options.help:
+        usage()
+        parser.print_help()
+        return 0
+
+    if command == 'serve':
+        if args or options.cache_dir is None or options.socket_path is None:
+            usage()
+            return 2
+        if not os.path.isdir(options.cache_dir):
+            print("ERROR: directory not found %s" % options.cache_dir)
+            return 1
+        return serve(options.cache_dir, options.socket_path, quiet=options.quiet)
+
+    if len(args) < 2:
+        usage()
+        return 2
+    cache_name = args[0]
+    names = args[1:]
+    if names == ['-']:
+        names = [line.strip() for line in sys.stdin]
+        names = [name for name in names if name != ""]
+    return query(options.socket_path, options.cache_dir, cache_name, names, values_only=options.values)
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
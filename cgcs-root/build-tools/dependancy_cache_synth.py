@@ -0,0 +1,270 @@
+#!/usr/bin/python3
+
+#
+# Copyright (c) 2018 Wind River Systems, Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+#
+
+#
+# Write synthetic repodata, for testing and benchmarking
+# create_dependancy_cache.py without a real mirror.
+#
+# The tree written under <root> has the layout create_dependancy_cache.py
+# expects, with MY_REPO=<root>/repo and MY_WORKSPACE=<root>/workspace:
+#   repo/cgcs-centos-repo/Binary/repodata     most of the rpms
+#   repo/cgcs-centos-repo/Source/repodata     most of the srpms
+#   workspace/std/rpmbuild/RPMS/repodata      the rest, as if built locally
+#   workspace/std/rpmbuild/SRPMS/repodata
+#   workspace/rt/rpmbuild/RPMS/repodata       a few kernel-rt* packages
+#   workspace/rt/rpmbuild/SRPMS/repodata
+#   repo/cgcs-tis-repo                        where the cache goes
+# Each repodata directory gets a repomd.xml, a primary.xml.gz and a
+# filelists.xml.gz.
+#
+# Every rpm requires up to --fanout packages, capabilities or files.  Some
+# package requires are versioned.  --cycles dependency cycles of
+# --cycle_length rpms are added on top.  Otherwise rpms only require rpms
+# below them, mostly those near the bottom.  File requires name files that
+# are only listed in filelists.xml, so they resolve through the file
+# owners.  The same --seed always gives the same tree.
+#
+# Usage:
+#   dependancy_cache_synth.py [options] <root>
+#
+
+from optparse import OptionParser
+import gzip
+import hashlib
+import os
+import random
+import shutil
+import sys
+
+COMMON_NS = 'http://linux.duke.edu/metadata/common'
+RPM_NS = 'http://linux.duke.edu/metadata/rpm'
+FILELISTS_NS = 'http://linux.duke.edu/metadata/filelists'
+REPO_NS = 'http://linux.duke.edu/metadata/repo'
+
+
+def xml_escape(s):
+    return s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+
+# Return an <rpm:entry> for (name, flags, version), flags None if unversioned
+def format_entry(entry):
+    (name, flags, version) = entry
+    if flags is None:
+        return '<rpm:entry name="%s"/>' % xml_escape(name)
+    return '<rpm:entry name="%s" flags="%s" epoch="0" ver="%s" rel="1"/>' % (xml_escape(name), flags, version)
+
+# Write one repo to 'repo_dir'/repodata.  'packages' is a list of dicts
+# with name, arch, version, sourcerpm, provides, requires, files, as made
+# by make_tree().  Each <package> of primary.xml has every element that
+# createrepo writes, e.g. <url> and <rpm:license>, so any version of
+# create_dependancy_cache.py can read the tree.  Only the files under /etc
+# and */bin/ are listed in primary.xml, as createrepo does; all of them are
+# in filelists.xml.
+def write_repo(repo_dir, packages):
+    repodata_dir = os.path.join(repo_dir, 'repodata')
+    if not os.path.isdir(repodata_dir):
+        os.makedirs(repodata_dir)
+
+    primary_name = 'primary.xml.gz'
+    filelists_name = 'filelists.xml.gz'
+    with gzip.open(os.path.join(repodata_dir, primary_name), 'wb') as f:
+        f.write(('<?xml version="1.0" encoding="UTF-8"?>\n'
+                 '<metadata xmlns="%s" xmlns:rpm="%s" packages="%d">\n' % (COMMON_NS, RPM_NS, len(packages))).encode('utf-8'))
+        for pkg in packages:
+            nevra = '%s-%s-1.%s' % (pkg['name'], pkg['version'], pkg['arch'])
+            if pkg['sourcerpm']:
+                sourcerpm = '<rpm:sourcerpm>%s</rpm:sourcerpm>' % pkg['sourcerpm']
+            else:
+                sourcerpm = '<rpm:sourcerpm/>'
+            lines = [ '<package type="rpm"><name>%s</name><arch>%s</arch>' % (pkg['name'], pkg['arch']),
+                      '<version epoch="0" ver="%s" rel="1"/>' % pkg['version'],
+                      '<checksum type="sha256" pkgid="YES">%s</checksum>' % hashlib.sha256(nevra.encode('utf-8')).hexdigest(),
+                      '<summary>Synthetic package %s</summary>' % pkg['name'],
+                      '<description>Synthetic package %s, written by dependancy_cache_synth.py.</description>' % pkg['name'],
+                      '<packager>StarlingX</packager>',
+                      '<url>http://www.starlingx.io/%s</url>' % pkg['name'],
+                      '<time file="1530000000" build="1530000000"/>',
+                      '<size package="10240" installed="40960" archive="41472"/>',
+                      '<location href="Packages/%s.rpm"/>' % nevra,
+                      '<format><rpm:license>Apache-2.0</rpm:license>',
+                      '<rpm:vendor>StarlingX</rpm:vendor>',
+                      '<rpm:group>Unspecified</rpm:group>',
+                      '<rpm:buildhost>build.starlingx.io</rpm:buildhost>',
+                      sourcerpm,
+                      '<rpm:header-range start="4504" end="9384"/>',
+                      '<rpm:provides>' ]
+            lines.extend([format_entry(e) for e in pkg['provides']])
+            lines.append('</rpm:provides>')
+            if pkg['requires']:
+                lines.append('<rpm:requires>')
+                lines.extend([format_entry(e) for e in pkg['requires']])
+                lines.append('</rpm:requires>')
+            for fn in pkg['files']:
+                if fn.startswith('/etc/') or '/bin/' in fn:
+                    lines.append('<file>%s</file>' % xml_escape(fn))
+            lines.append('</format></package>\n')
+            f.write('\n'.join(lines).encode('utf-8'))
+        f.write(b'</metadata>\n')
+
+    with gzip.open(os.path.join(repodata_dir, filelists_name), 'wb') as f:
+        f.write(('<?xml version="1.0" encoding="UTF-8"?>\n'
+                 '<filelists xmlns="%s" packages="%d">\n' % (FILELISTS_NS, len(packages))).encode('utf-8'))
+        for pkg in packages:
+            lines = [ '<package pkgid="%s" name="%s" arch="%s">' % (pkg['name'], pkg['name'], pkg['arch']),
+                      '<version epoch="0" ver="%s" rel="1"/>' % pkg['version'] ]
+            lines.extend(['<file>%s</file>' % xml_escape(fn) for fn in pkg['files']])
+            lines.append('</package>\n')
+            f.write('\n'.join(lines).encode('utf-8'))
+        f.write(b'</filelists>\n')
+
+    with open(os.path.join(repodata_dir, 'repomd.xml'), 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<repomd xmlns="%s">\n' % REPO_NS)
+        for (data_type, name) in [('primary', primary_name), ('filelists', filelists_name)]:
+            f.write('<data type="%s"><location href="repodata/%s"/></data>\n' % (data_type, name))
+        f.write('</repomd>\n')
+
+# Return the rpms and srpms of a synthetic tree, as two lists of package
+# dicts, see write_repo().  Each package also has a 'repo' key, the repo
+# it goes to: 'centos', 'std' or 'rt'.
+def make_tree(n_packages, fanout=4, cycles=0, cycle_length=3, file_requires=0.1,
+              rpms_per_srpm=3, seed=0):
+    rnd = random.Random(seed)
+    n_caps = max(1, n_packages // 2)
+    n_srpms = (n_packages + rpms_per_srpm - 1) // rpms_per_srpm
+
+    rpms = []
+    for i in range(n_packages):
+        name = 'pkg%d' % i
+        srpm = 'src%d' % (i // rpms_per_srpm)
+        if i < 4:
+            # a few kernel packages, kernel-rt* are built in the rt workspace
+            name = ['kernel', 'kernel-devel', 'kernel-rt', 'kernel-rt-devel'][i]
+            srpm = ['kernel', 'kernel', 'kernel-rt', 'kernel-rt'][i]
+        version = '1.%d' % rnd.randint(0, 9)
+        provides = [(name, 'EQ', version)]
+        for j in range(rnd.randint(0, 2)):
+            provides.append(('cap%d' % rnd.randint(0, n_caps - 1), None, None))
+        files = [ '/usr/bin/%s' % name,
+                  '/etc/%s.conf' % name,
+                  '/usr/lib64/%s/lib%s.so' % (name, name),
+                  '/usr/share/doc/%s/README' % name ]
+        if name.startswith('kernel'):
+            repo = 'rt' if name.startswith('kernel-rt') else 'std'
+        else:
+            repo = 'std' if rnd.random() < 0.15 else 'centos'
+        rpms.append({ 'name': name, 'arch': rnd.choice(['x86_64', 'x86_64', 'noarch']),
+                      'version': version, 'sourcerpm': '%s-1.0-1.src.rpm' % srpm,
+                      'provides': provides, 'requires': [], 'files': files, 'repo': repo })
+
+    # As in a distro, packages require packages below them, mostly the few
+    # at the bottom, like glibc, so the graph is layered, not one big cycle
+    for (i, pkg) in enumerate(rpms):
+        if i == 0:
+            continue
+        for j in range(rnd.randint(0, fanout)):
+            other = rpms[int(i * rnd.random() ** 3)]
+            t = rnd.random()
+            if t < file_requires:
+                pkg['requires'].append((other['files'][2], None, None))
+            elif t < 0.3 and len(other['provides']) > 1:
+                pkg['requires'].append(rnd.choice(other['provides'][1:]))
+            elif t < 0.45:
+                pkg['requires'].append((other['name'], 'GE', '1.0'))
+            else:
+                pkg['requires'].append((other['name'], None, None))
+
+    for c in range(cycles):
+        members = rnd.sample(rpms, min(cycle_length, n_packages))
+        for (j, pkg) in enumerate(members):
+            pkg['requires'].append((members[(j + 1) % len(members)]['name'], None, None))
+
+    srpm_names = sorted(set([pkg['sourcerpm'][:-len('-1.0-1.src.rpm')] for pkg in rpms]))
+    srpms = []
+    for name in srpm_names:
+        requires = []
+        for j in range(rnd.randint(0, fanout + 2)):
+            other = rpms[rnd.randint(0, n_packages - 1)]
+            if rnd.random() < file_requires:
+                requires.append((other['files'][0], None, None))
+            else:
+                requires.append((other['name'], None, None))
+        if name == 'kernel-rt':
+            repo = 'rt'
+        elif name == 'kernel' or rnd.random() < 0.15:
+            repo = 'std'
+        else:
+            repo = 'centos'
+        srpms.append({ 'name': name, 'arch': 'src', 'version': '1.0', 'sourcerpm': '',
+                       'provides': [(name, 'EQ', '1.0')], 'requires': requires,
+                       'files': ['%s.spec' % name, '%s-1.0.tar.gz' % name], 'repo': repo })
+    return (rpms, srpms)
+
+# Write a synthetic tree under 'root', replacing anything there.
+# See make_tree() for the arguments.
+def write_tree(root, n_packages, **kwargs):
+    (rpms, srpms) = make_tree(n_packages, **kwargs)
+    return write_packages(root, rpms, srpms)
+
+# Write the rpms and srpms 'rpms' and 'srpms', as made by make_tree(), and
+# maybe changed since, as a tree under 'root', replacing anything there
+def write_packages(root, rpms, srpms):
+    if os.path.exists(root):
+        shutil.rmtree(root)
+    repo_dirs = { 'RPM': { 'centos': 'repo/cgcs-centos-repo/Binary',
+                           'std': 'workspace/std/rpmbuild/RPMS',
+                           'rt': 'workspace/rt/rpmbuild/RPMS' },
+                  'SRPM': { 'centos': 'repo/cgcs-centos-repo/Source',
+                            'std': 'workspace/std/rpmbuild/SRPMS',
+                            'rt': 'workspace/rt/rpmbuild/SRPMS' } }
+    for (rpm_type, packages) in [('RPM', rpms), ('SRPM', srpms)]:
+        for (repo, repo_dir) in sorted(repo_dirs[rpm_type].items()):
+            write_repo(os.path.join(root, repo_dir), [pkg for pkg in packages if pkg['repo'] == repo])
+    os.makedirs(os.path.join(root, 'repo/cgcs-tis-repo'))
+    return (len(rpms), len(srpms))
+
+
+def main(argv):
+    parser = OptionParser('%prog [options] <root>')
+    parser.add_option('-n', '--packages', action='store', type='int',
+        dest='packages', default=1000,
+        help='number of rpms')
+    parser.add_option('-f', '--fanout', action='store', type='int',
+        dest='fanout', default=4,
+        help='most requires of an rpm')
+    parser.add_option('-c', '--cycles', action='store', type='int',
+        dest='cycles', default=10,
+        help='number of extra dependency cycles')
+    parser.add_option('-l', '--cycle_length', action='store', type='int',
+        dest='cycle_length', default=3,
+        help='number of rpms in each extra cycle')
+    parser.add_option('-F', '--file_requires', action='store', type='float',
+        dest='file_requires', default=0.1,
+        help='fraction of requires that are on a file')
+    parser.add_option('-r', '--rpms_per_srpm', action='store', type='int',
+        dest='rpms_per_srpm', default=3,
+        help='number of rpms built by each srpm')
+    parser.add_option('-s', '--seed', action='store', type='int',
+        dest='seed', default=0,
+        help='random seed')
+    (options, args) = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.print_usage()
+        return 1
+    if options.packages < 4:
+        print("ERROR: at least 4 packages are needed")
+        return 1
+
+    (n_rpms, n_srpms) = write_tree(args[0], options.packages, fanout=options.fanout,
+                                   cycles=options.cycles, cycle_length=options.cycle_length,
+                                   file_requires=options.file_requires,
+                                   rpms_per_srpm=options.rpms_per_srpm, seed=options.seed)
+    print("%s: %d rpms, %d srpms" % (args[0], n_rpms, n_srpms))
+    print("MY_REPO=%s MY_WORKSPACE=%s" % (os.path.join(args[0], 'repo'), os.path.join(args[0], 'workspace')))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,610 @@
+#
+# Copyright (c) 2018 Wind River Systems, Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+#
+
+import bz2
+import gzip
+import hashlib
+import json
+import lzma
+import os
+import pstats
+import shutil
+import sqlite3
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import create_dependancy_cache
+import dependancy_cache_index
+import dependancy_cache_synth
+from create_dependancy_cache import ProviderIndex, StringTable, compare_evr, rpmvercmp
+
+
+# Return the content of every cache file in 'cache_dir', as a map
+# cache file name -> text
+def read_cache_files(cache_dir):
+    content = {}
+    for cache_name in create_dependancy_cache.get_cache_names():
+        with open(os.path.join(cache_dir, cache_name)) as f:
+            content[cache_name] = f.read()
+    return content
+
+def find_package(packages, name):
+    for pkg in packages:
+        if pkg['name'] == name:
+            return pkg
+    raise KeyError(name)
+
+
+# Changes to a synthetic tree, each a function of (rpms, srpms) that
+# changes them in place
+
+# An rpm no longer requires anything
+def drop_requires(rpms, srpms):
+    for pkg in rpms:
+        if len(pkg['requires']) > 1:
+            pkg['requires'] = []
+            return
+
+# A new rpm takes over a capability, and a file, so requirements on them
+# resolve to it instead
+def take_over_capability(rpms, srpms):
+    pkg = find_package(rpms, 'pkg20')
+    rpms.append({ 'name': 'zz-new', 'arch': 'x86_64', 'version': '2.0',
+                  'sourcerpm': 'src0-1.0-1.src.rpm',
+                  'provides': [('zz-new', 'EQ', '2.0')] + pkg['provides'][1:] + [(pkg['name'], None, None)],
+                  'requires': [('kernel', None, None)],
+                  'files': ['/usr/bin/zz-new'] + pkg['files'][2:3], 'repo': 'std' })
+
+# A required rpm goes away
+def remove_rpm(rpms, srpms):
+    rpms.remove(find_package(rpms, 'pkg5'))
+
+# An rpm is now built by an other SRPM
+def move_rpm(rpms, srpms):
+    find_package(rpms, 'pkg7')['sourcerpm'] = 'src40-1.0-1.src.rpm'
+
+# A SRPM gets a new build requirement, and loses one
+def change_build_requires(rpms, srpms):
+    srpm = find_package(srpms, 'src10')
+    srpm['requires'] = srpm['requires'][1:] + [('pkg250', None, None)]
+
+# A package low in the graph joins a cycle with one high up
+def add_cycle(rpms, srpms):
+    find_package(rpms, 'pkg11')['requires'].append(('pkg290', None, None))
+
+# A SRPM, and the rpms it builds, go away
+def remove_srpm(rpms, srpms):
+    srpms.remove(find_package(srpms, 'src30'))
+    for pkg in [p for p in rpms if p['sourcerpm'] == 'src30-1.0-1.src.rpm']:
+        rpms.remove(pkg)
+
+# An rpm read last provides a package name at a version too low for the
+# versioned requirements on it, so those only resolve to it without
+# --versioned_requires
+def add_old_provider(rpms, srpms):
+    for pkg in rpms:
+        for (name, flags, version) in pkg['requires']:
+            if flags == 'GE':
+                rpms.append({ 'name': 'zz-compat', 'arch': 'noarch', 'version': '0.5',
+                              'sourcerpm': 'kernel-rt-1.0-1.src.rpm',
+                              'provides': [('zz-compat', 'EQ', '0.5'), (name, 'EQ', '0.5')],
+                              'requires': [], 'files': [], 'repo': 'rt' })
+                return
+
+tree_changes = [ drop_requires, take_over_capability, remove_rpm, move_rpm,
+                 change_build_requires, add_cycle, remove_srpm, add_old_provider ]
+
+
+# An incremental update gives the same cache files as a full rebuild
+@pytest.mark.parametrize('versioned_requires', [False, True])
+@pytest.mark.parametrize('change', tree_changes, ids=[c.__name__ for c in tree_changes])
+def test_incremental_update_matches_full_build(tmp_path, cache_builder, change, versioned_requires):
+    root = str(tmp_path / 'tree')
+    (rpms, srpms) = dependancy_cache_synth.make_tree(300, cycles=5, seed=2)
+    dependancy_cache_synth.write_packages(root, rpms, srpms)
+    cache_dir = str(tmp_path / 'incremental')
+    state_file = str(tmp_path / 'state')
+    cache_builder(root, cache_dir, state_file=state_file, versioned_requires=versioned_requires)
+    before = read_cache_files(cache_dir)
+
+    change(rpms, srpms)
+    dependancy_cache_synth.write_packages(root, rpms, srpms)
+    cache = cache_builder(root, cache_dir, state_file=state_file, incremental=True,
+                          versioned_requires=versioned_requires)
+    assert [entry['phase'] for entry in cache.phase_report if entry['phase'] == 'incremental']
+    full_dir = str(tmp_path / 'full')
+    cache_builder(root, full_dir, versioned_requires=versioned_requires)
+
+    after = read_cache_files(cache_dir)
+    assert after == read_cache_files(full_dir)
+    assert after != before
+
+    # and a second update, from the state the first one saved
+    next_change = tree_changes[(tree_changes.index(change) + 1) % len(tree_changes)]
+    next_change(rpms, srpms)
+    dependancy_cache_synth.write_packages(root, rpms, srpms)
+    cache_builder(root, cache_dir, state_file=state_file, incremental=True,
+                  versioned_requires=versioned_requires)
+    cache_builder(root, full_dir, versioned_requires=versioned_requires)
+    assert read_cache_files(cache_dir) == read_cache_files(full_dir)
+
+# Without a usable state, an incremental run does a full update
+def test_incremental_update_without_state(tmp_path, cache_builder, synth_tree, synth_cache):
+    (cache, cache_dir, db_path) = synth_cache
+    state_file = str(tmp_path / 'state')
+    with open(state_file, 'w') as f:
+        f.write("not a state file\n")
+    cache = cache_builder(synth_tree, str(tmp_path / 'cache'), state_file=state_file, incremental=True)
+    assert not [entry for entry in cache.phase_report if entry['phase'] == 'incremental']
+    assert read_cache_files(str(tmp_path / 'cache')) == read_cache_files(cache_dir)
+
+
+# Options that change how the cache is built, but not what is in it
+same_output_options = [ { 'jobs': 4 },
+                        { 'write_jobs': 4 },
+                        { 'write_jobs': 4, 'quiet': False } ]
+
+# Parsing with several processes, or writing with several threads, gives
+# the same cache files as one process
+@pytest.mark.parametrize('options', same_output_options,
+                         ids=['-'.join('%s=%s' % item for item in sorted(o.items())) for o in same_output_options])
+def test_options_match_serial_build(tmp_path, cache_builder, synth_tree, synth_cache, capsys, options):
+    (cache, cache_dir, db_path) = synth_cache
+    capsys.readouterr()
+    cache_builder(synth_tree, str(tmp_path / 'cache'), **options)
+    assert read_cache_files(str(tmp_path / 'cache')) == read_cache_files(cache_dir)
+    # only without --quiet is every package traced
+    assert (' needs ' in capsys.readouterr().out) == (not options.get('quiet', True))
+
+# With --repodata_cache_dir, only a repodata file that changed is parsed
+# again, and the cache is the same as without it
+def test_repodata_cache_dir(tmp_path, cache_builder, capsys):
+    root = str(tmp_path / 'tree')
+    (rpms, srpms) = dependancy_cache_synth.make_tree(300, cycles=5, seed=2)
+    dependancy_cache_synth.write_packages(root, rpms, srpms)
+    repodata_cache_dir = str(tmp_path / 'repodata-cache')
+    os.makedirs(repodata_cache_dir)
+    cache = cache_builder(root, str(tmp_path / 'cache'), repodata_cache_dir=repodata_cache_dir)
+    assert (cache.repodata_stats['files'], cache.repodata_stats['cached']) == (12, 0)
+
+    # rewrite the primary.xml.gz of the repo of pkg7 alone
+    move_rpm(rpms, srpms)
+    pkg = find_package(rpms, 'pkg7')
+    changed_root = str(tmp_path / 'changed')
+    dependancy_cache_synth.write_packages(changed_root, rpms, srpms)
+    for repodata_dir in find_repodata_dirs(changed_root):
+        with gzip.open(os.path.join(repodata_dir, 'primary.xml.gz'), 'rb') as f:
+            if ('<name>%s</name><arch>%s</arch>' % (pkg['name'], pkg['arch'])).encode('utf-8') in f.read():
+                shutil.copy(os.path.join(repodata_dir, 'primary.xml.gz'),
+                            os.path.join(root, os.path.relpath(repodata_dir, changed_root), 'primary.xml.gz'))
+    before = read_cache_files(str(tmp_path / 'cache'))
+    capsys.readouterr()
+    cache = cache_builder(root, str(tmp_path / 'cache'), repodata_cache_dir=repodata_cache_dir)
+    assert (cache.repodata_stats['files'], cache.repodata_stats['cached']) == (1, 11)
+    assert "11 files reused from %s" % repodata_cache_dir in capsys.readouterr().out
+    cache_builder(root, str(tmp_path / 'uncached'))
+    assert "reused" not in capsys.readouterr().out
+    after = read_cache_files(str(tmp_path / 'cache'))
+    assert after == read_cache_files(str(tmp_path / 'uncached'))
+    assert after != before
+
+# Repodata is found under every mirror root, at any depth up to that of
+# its rpm type, but never under a pruned directory such as Packages, nor
+# under an other repodata directory
+@pytest.mark.parametrize('discovery_jobs', [1, 4])
+def test_discover_repodata(tmp_path, discovery_jobs):
+    binary = str(tmp_path / 'Binary')
+    shared = str(tmp_path / 'shared')
+    repodata_dirs = [ 'Binary/repodata', 'Binary/a/b/c/repodata', 'Binary/Packages/x/repodata',
+                      'Binary/a/.git/repodata', 'Binary/a/repodata/x/y/z/repodata',
+                      'shared/repodata', 'shared/1/2/3/4/repodata', 'shared/1/2/3/4/5/6/repodata' ]
+    for d in repodata_dirs:
+        os.makedirs(str(tmp_path / d))
+        with open(str(tmp_path / d / 'primary.xml.gz'), 'w') as f:
+            f.write("")
+    mirror_roots = { 'RPM': [binary, shared, str(tmp_path / 'missing')],
+                     'SRPM': [shared] }
+    options = create_dependancy_cache.get_default_options(quiet=True, discovery_jobs=discovery_jobs)
+    cache = create_dependancy_cache.DependancyCache(mirror_roots, options)
+    (found, files, repomd) = cache.discover_repodata()
+    assert dict((root, sorted(dirs)) for (root, dirs) in found.items()) == {
+        binary: [(binary + '/a/b/c/repodata', 3), (binary + '/a/repodata', 1), (binary + '/repodata', 0)],
+        shared: [(shared + '/1/2/3/4/5/6/repodata', 6), (shared + '/1/2/3/4/repodata', 4),
+                 (shared + '/repodata', 0)] }
+    assert files[binary + '/repodata'] == [binary + '/repodata/primary.xml.gz']
+    assert repomd[binary + '/repodata'] is None
+    # a root searched for both rpm types is searched once, to the greater
+    # depth, but a SRPM repo deeper than its own depth is not used
+    assert sorted(cache.get_repodata_file_list(['primary'], rpm_type='RPM')) == sorted(
+        '%s/%s/primary.xml.gz' % (tmp_path, d) for d in repodata_dirs[:2] + repodata_dirs[5:])
+    assert sorted(cache.get_repodata_file_list(['primary'], rpm_type='SRPM')) == [
+        shared + '/1/2/3/4/repodata/primary.xml.gz', shared + '/repodata/primary.xml.gz']
+
+# The command line writes a --timing_report of every phase, with its item
+# counts, and --profile stats of the closure phases
+def test_timing_report_and_profile(tmp_path, synth_tree, synth_cache, monkeypatch):
+    (cache, cache_dir, db_path) = synth_cache
+    monkeypatch.setattr(create_dependancy_cache, 'mirror_dirs', [str(tmp_path)])
+    monkeypatch.setenv('MY_REPO', os.path.join(synth_tree, 'repo'))
+    monkeypatch.setenv('MY_WORKSPACE', os.path.join(synth_tree, 'workspace'))
+    report_path = str(tmp_path / 'timing.json')
+    profile_path = str(tmp_path / 'closure.pstats')
+    assert create_dependancy_cache.main(['-q', '-c', str(tmp_path / 'cache'),
+                                         '-T', report_path, '-P', profile_path]) == 0
+    assert read_cache_files(str(tmp_path / 'cache')) == read_cache_files(cache_dir)
+
+    with open(report_path) as f:
+        report = json.load(f)
+    assert report['options']['profile'] == profile_path
+    phases = [(entry['phase'], entry.get('rpm_type')) for entry in report['phases']]
+    assert phases == [('discovery', None)] + [(phase, rpm_type) for phase in ['primary', 'filelists']
+                                             for rpm_type in ['RPM', 'SRPM']] + \
+                     [(phase, rpm_type) for rpm_type in ['RPM', 'SRPM']
+                      for phase in ['direct', 'transitive_requires', 'transitive_descendants']] + \
+                     [('write', None), ('create_cache', None)]
+    counts = dict(((entry['phase'], entry.get('rpm_type')), entry['counts']) for entry in report['phases'])
+    assert counts[('discovery', None)] == { 'repodata_dirs': 6 }
+    assert counts[('primary', 'RPM')]['packages'] == len(read_cache_files(cache_dir)['RPM-direct-requires'].splitlines())
+    assert counts[('transitive_requires', 'RPM')] == { 'packages': counts[('primary', 'RPM')]['packages'] }
+    # a new cache directory, so every file is written
+    n_files = len(create_dependancy_cache.get_cache_names())
+    assert counts[('write', None)] == { 'files': n_files, 'changed': n_files }
+    for entry in report['phases']:
+        assert entry['wall_s'] >= 0 and entry['cpu_s'] >= 0
+
+    stats = pstats.Stats(profile_path)
+    assert [f for f in stats.stats if f[2] == 'calulate_all_transitive_requires']
+
+# A cache file written again without --index loses its stale index, while
+# the index of a file that did not change still matches it
+def test_stale_index_is_removed(tmp_path, cache_builder):
+    root = str(tmp_path / 'tree')
+    (rpms, srpms) = dependancy_cache_synth.make_tree(300, cycles=5, seed=2)
+    dependancy_cache_synth.write_packages(root, rpms, srpms)
+    cache_dir = str(tmp_path / 'cache')
+    cache_builder(root, cache_dir, index=True)
+    before = read_cache_files(cache_dir)
+
+    move_rpm(rpms, srpms)
+    dependancy_cache_synth.write_packages(root, rpms, srpms)
+    cache_builder(root, cache_dir)
+    after = read_cache_files(cache_dir)
+    for cache_name in create_dependancy_cache.get_cache_names():
+        index_path = os.path.join(cache_dir, cache_name) + dependancy_cache_index.INDEX_SUFFIX
+        if after[cache_name] != before[cache_name]:
+            assert not os.path.exists(index_path)
+        else:
+            with dependancy_cache_index.CacheIndex(index_path) as index:
+                assert dict(index.items()) == dependancy_cache_index.read_cache_text(os.path.join(cache_dir, cache_name))
+    assert sorted(cache_name for cache_name in after if after[cache_name] != before[cache_name])
+
+
+# With --compress and --manifest, each .zst copy decompresses to its cache
+# file, the manifest checks out as sha256sum -c would have it, and a second
+# run over the same tree rewrites nothing
+def test_compress_and_manifest(tmp_path, cache_builder, synth_tree):
+    zstandard = pytest.importorskip('zstandard')
+    cache_dir = str(tmp_path / 'cache')
+    cache_builder(synth_tree, cache_dir, compress=True, manifest=True)
+    content = read_cache_files(cache_dir)
+    for cache_name in create_dependancy_cache.get_cache_names():
+        with open(os.path.join(cache_dir, cache_name) + create_dependancy_cache.COMPRESSED_SUFFIX, 'rb') as f:
+            assert zstandard.ZstdDecompressor().stream_reader(f).read().decode('utf-8') == content[cache_name]
+
+    listed = []
+    with open(os.path.join(cache_dir, create_dependancy_cache.MANIFEST_NAME)) as f:
+        for line in f:
+            (sha256, name) = line.rstrip('\n').split('  ', 1)
+            assert create_dependancy_cache.hash_file(os.path.join(cache_dir, name)) == sha256
+            listed.append(name)
+    assert sorted(listed) == sorted(name for name in os.listdir(cache_dir)
+                                    if name != create_dependancy_cache.MANIFEST_NAME)
+
+    mtimes = dict((name, os.stat(os.path.join(cache_dir, name)).st_mtime_ns) for name in os.listdir(cache_dir))
+    cache = cache_builder(synth_tree, cache_dir, compress=True, manifest=True)
+    assert [entry['counts']['changed'] for entry in cache.phase_report if entry['phase'] == 'write'] == [0]
+    assert dict((name, os.stat(os.path.join(cache_dir, name)).st_mtime_ns) for name in os.listdir(cache_dir)) == mtimes
+
+# The cache of each --build_types view is the cache of that build type's
+# mirror roots alone, and the records kept for the views are released
+@pytest.mark.parametrize('lazy_filelists', [False, True])
+def test_build_type_views(tmp_path, cache_builder, synth_tree, lazy_filelists):
+    cache_dir = str(tmp_path / 'cache')
+    cache = cache_builder(synth_tree, cache_dir, build_types='std,rt', lazy_filelists=lazy_filelists)
+    cache_builder(synth_tree, str(tmp_path / 'main'), lazy_filelists=lazy_filelists)
+    assert cache.parsed_records is None
+    assert read_cache_files(cache_dir) == read_cache_files(str(tmp_path / 'main'))
+    assert sorted(set(entry['build_type'] for entry in cache.phase_report if 'build_type' in entry)) == ['rt', 'std']
+    for bt in ['std', 'rt']:
+        mirror_roots = create_dependancy_cache.make_mirror_roots(os.path.join(synth_tree, 'repo'),
+                                                                 os.path.join(synth_tree, 'workspace'),
+                                                                 build_types=[bt])
+        options = create_dependancy_cache.get_default_options(quiet=True, lazy_filelists=lazy_filelists)
+        bt_cache = create_dependancy_cache.DependancyCache(mirror_roots, options)
+        bt_cache_dir = str(tmp_path / bt)
+        os.makedirs(bt_cache_dir)
+        bt_cache.create_cache(bt_cache_dir)
+        assert read_cache_files(os.path.join(cache_dir, bt)) == read_cache_files(bt_cache_dir)
+
+
+# Return the repodata directories of a tree written by dependancy_cache_synth.py
+def find_repodata_dirs(root):
+    return sorted(d for (d, dirs, files) in os.walk(root) if os.path.basename(d) == 'repodata')
+
+# Rewrite 'repodata_dir'/repomd.xml to list 'data', a map data type -> file
+# name in 'repodata_dir'
+def write_repomd(repodata_dir, data):
+    with open(os.path.join(repodata_dir, 'repomd.xml'), 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<repomd xmlns="%s">\n' % dependancy_cache_synth.REPO_NS)
+        for data_type in sorted(data):
+            f.write('<data type="%s"><location href="repodata/%s"/></data>\n' % (data_type, data[data_type]))
+        f.write('</repomd>\n')
+
+# Write 'data' to 'repodata_dir', compressed with 'ext', under a name that
+# starts with its checksum, as createrepo names them.  Returns the name.
+def write_checksum_named(repodata_dir, base_name, ext, data):
+    if ext == '.xz':
+        data = lzma.compress(data)
+    elif ext == '.bz2':
+        data = bz2.compress(data)
+    elif ext == '.zst':
+        data = pytest.importorskip('zstandard').ZstdCompressor().compress(data)
+    name = '%s-%s%s' % (hashlib.sha256(data).hexdigest(), base_name, ext)
+    with open(os.path.join(repodata_dir, name), 'wb') as f:
+        f.write(data)
+    return name
+
+# A stale primary.xml.gz, of no packages at all
+def write_stale_primary(repodata_dir):
+    with gzip.open(os.path.join(repodata_dir, 'primary.xml.gz'), 'wb') as f:
+        f.write(('<?xml version="1.0" encoding="UTF-8"?>\n<metadata xmlns="%s" packages="0">\n</metadata>\n'
+                 % dependancy_cache_synth.COMMON_NS).encode('utf-8'))
+
+# The repodata listed in repomd.xml is read, in any compression, rather than
+# the primary.xml.gz left next to it
+@pytest.mark.parametrize('primary_ext,filelists_ext', [('.xz', '.zst'), ('.bz2', '.xz'), ('.zst', '.bz2')])
+def test_repomd_selects_compressed_repodata(tmp_path, cache_builder, synth_tree, synth_cache, primary_ext, filelists_ext):
+    (cache, cache_dir, db_path) = synth_cache
+    root = str(tmp_path / 'tree')
+    shutil.copytree(synth_tree, root)
+    for repodata_dir in find_repodata_dirs(root):
+        data = {}
+        for (data_type, ext) in [('primary', primary_ext), ('filelists', filelists_ext)]:
+            path = os.path.join(repodata_dir, '%s.xml.gz' % data_type)
+            with gzip.open(path, 'rb') as f:
+                data[data_type] = write_checksum_named(repodata_dir, '%s.xml' % data_type, ext, f.read())
+            os.remove(path)
+        write_stale_primary(repodata_dir)
+        write_repomd(repodata_dir, data)
+    cache_builder(root, str(tmp_path / 'cache'))
+    assert read_cache_files(str(tmp_path / 'cache')) == read_cache_files(cache_dir)
+
+# Write the packages of the primary.xml.gz of 'repodata_dir' to a primary
+# sqlite database at 'db_path', with the tables createrepo writes that
+# create_dependancy_cache.py reads
+def write_primary_db(repodata_dir, db_path):
+    common = '{%s}' % dependancy_cache_synth.COMMON_NS
+    rpm = '{%s}' % dependancy_cache_synth.RPM_NS
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE packages (pkgKey INTEGER PRIMARY KEY, name TEXT, arch TEXT, epoch TEXT,
+                               version TEXT, release TEXT, rpm_sourcerpm TEXT);
+        CREATE TABLE requires (name TEXT, flags TEXT, epoch TEXT, version TEXT, release TEXT, pkgKey INTEGER);
+        CREATE TABLE provides (name TEXT, flags TEXT, epoch TEXT, version TEXT, release TEXT, pkgKey INTEGER);
+        CREATE TABLE files (name TEXT, type TEXT, pkgKey INTEGER);""")
+    with gzip.open(os.path.join(repodata_dir, 'primary.xml.gz'), 'rb') as f:
+        packages = ET.parse(f).getroot().findall(common + 'package')
+    for (pkg_key, pkg) in enumerate(packages):
+        v = pkg.find(common + 'version')
+        fmt = pkg.find(common + 'format')
+        conn.execute("INSERT INTO packages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     (pkg_key, pkg.find(common + 'name').text, pkg.find(common + 'arch').text,
+                      v.get('epoch'), v.get('ver'), v.get('rel'), fmt.find(rpm + 'sourcerpm').text or ''))
+        for table in ['requires', 'provides']:
+            for e in fmt.findall('%s%s/%sentry' % (rpm, table, rpm)):
+                conn.execute("INSERT INTO %s VALUES (?, ?, ?, ?, ?, ?)" % table,
+                             (e.get('name'), e.get('flags'), e.get('epoch'), e.get('ver'), e.get('rel'), pkg_key))
+        for fn in fmt.findall(common + 'file'):
+            conn.execute("INSERT INTO files VALUES (?, 'file', ?)", (fn.text, pkg_key))
+    conn.commit()
+    conn.close()
+
+# With --primary_db, the primary sqlite database repomd.xml lists is read
+# in place of primary.xml, plain or compressed, and gives the same cache
+@pytest.mark.parametrize('versioned_requires', [False, True])
+@pytest.mark.parametrize('db_ext', ['', '.bz2'])
+def test_primary_db(tmp_path, cache_builder, synth_tree, db_ext, versioned_requires):
+    root = str(tmp_path / 'tree')
+    shutil.copytree(synth_tree, root)
+    for repodata_dir in find_repodata_dirs(root):
+        db_path = os.path.join(repodata_dir, 'primary.sqlite.tmp')
+        write_primary_db(repodata_dir, db_path)
+        with open(db_path, 'rb') as f:
+            primary_db = write_checksum_named(repodata_dir, 'primary.sqlite', db_ext, f.read())
+        os.remove(db_path)
+        os.rename(os.path.join(repodata_dir, 'primary.xml.gz'), os.path.join(repodata_dir, 'real-primary.xml.gz'))
+        write_stale_primary(repodata_dir)
+        write_repomd(repodata_dir, { 'primary': 'primary.xml.gz', 'primary_db': primary_db,
+                                     'filelists': 'filelists.xml.gz' })
+    cache_builder(root, str(tmp_path / 'db'), primary_db=True, versioned_requires=versioned_requires)
+    for repodata_dir in find_repodata_dirs(root):
+        os.rename(os.path.join(repodata_dir, 'real-primary.xml.gz'), os.path.join(repodata_dir, 'primary.xml.gz'))
+    cache_builder(root, str(tmp_path / 'xml'), versioned_requires=versioned_requires)
+    assert read_cache_files(str(tmp_path / 'db')) == read_cache_files(str(tmp_path / 'xml'))
+
+# (a, b, rpmvercmp(a, b)), from the test suite of rpm
+rpmvercmp_cases = [
+    ('1.0', '1.0', 0), ('1.0', '2.0', -1), ('2.0', '1.0', 1),
+    ('2.0.1', '2.0.1', 0), ('2.0', '2.0.1', -1), ('2.0.1', '2.0', 1),
+    ('2.0.1a', '2.0.1a', 0), ('2.0.1a', '2.0.1', 1), ('2.0.1', '2.0.1a', -1),
+    ('5.5p1', '5.5p1', 0), ('5.5p1', '5.5p2', -1), ('5.5p2', '5.5p1', 1),
+    ('5.5p10', '5.5p10', 0), ('5.5p1', '5.5p10', -1), ('5.5p10', '5.5p1', 1),
+    ('10xyz', '10.1xyz', -1), ('10.1xyz', '10xyz', 1),
+    ('xyz10', 'xyz10', 0), ('xyz10', 'xyz10.1', -1), ('xyz10.1', 'xyz10', 1),
+    ('xyz.4', 'xyz.4', 0), ('xyz.4', '8', -1), ('8', 'xyz.4', 1),
+    ('xyz.4', '2', -1), ('2', 'xyz.4', 1),
+    ('5.5p2', '5.6p1', -1), ('5.6p1', '5.5p2', 1),
+    ('5.6p1', '6.5p1', -1), ('6.5p1', '5.6p1', 1),
+    ('6.0.rc1', '6.0', 1), ('6.0', '6.0.rc1', -1),
+    ('10b2', '10a1', 1), ('10a2', '10b2', -1),
+    ('1.0aa', '1.0aa', 0), ('1.0a', '1.0aa', -1), ('1.0aa', '1.0a', 1),
+    ('10.0001', '10.0001', 0), ('10.0001', '10.1', 0), ('10.1', '10.0001', 0),
+    ('10.0001', '10.0039', -1), ('10.0039', '10.0001', 1),
+    ('4.999.9', '5.0', -1), ('5.0', '4.999.9', 1),
+    ('20101121', '20101121', 0), ('20101121', '20101122', -1), ('20101122', '20101121', 1),
+    ('2_0', '2_0', 0), ('2.0', '2_0', 0), ('2_0', '2.0', 0),
+    ('a', 'a', 0), ('a+', 'a+', 0), ('a+', 'a_', 0), ('a_', 'a+', 0),
+    ('+a', '+a', 0), ('+a', '_a', 0), ('_a', '+a', 0),
+    ('+_', '+_', 0), ('_+', '+_', 0), ('_+', '_', 0), ('+', '_', 0),
+    ('1.0~rc1', '1.0~rc1', 0), ('1.0~rc1', '1.0', -1), ('1.0', '1.0~rc1', 1),
+    ('1.0~rc1', '1.0~rc2', -1), ('1.0~rc2', '1.0~rc1', 1),
+    ('1.0~rc1~git123', '1.0~rc1~git123', 0), ('1.0~rc1~git123', '1.0~rc1', -1),
+    ('1.0~rc1', '1.0~rc1~git123', 1),
+    ('1.0^', '1.0^', 0), ('1.0^', '1.0', 1), ('1.0', '1.0^', -1),
+    ('1.0^git1', '1.0^git1', 0), ('1.0^git1', '1.0', 1), ('1.0', '1.0^git1', -1),
+    ('1.0^git1', '1.0^git2', -1), ('1.0^git2', '1.0^git1', 1),
+    ('1.0^git1', '1.01', -1), ('1.01', '1.0^git1', 1),
+    ('1.0^20160101', '1.0^20160101', 0), ('1.0^20160101', '1.0.1', -1), ('1.0.1', '1.0^20160101', 1),
+    ('1.0^20160101^git1', '1.0^20160101^git1', 0),
+    ('1.0^20160102', '1.0^20160101^git1', 1), ('1.0^20160101^git1', '1.0^20160102', -1),
+    ('1.0~rc1^git1', '1.0~rc1^git1', 0), ('1.0~rc1^git1', '1.0~rc1', 1), ('1.0~rc1', '1.0~rc1^git1', -1),
+    ('1.0^git1~pre', '1.0^git1~pre', 0), ('1.0^git1', '1.0^git1~pre', 1), ('1.0^git1~pre', '1.0^git1', -1) ]
+
+@pytest.mark.parametrize('a,b,expected', rpmvercmp_cases)
+def test_rpmvercmp(a, b, expected):
+    assert rpmvercmp(a, b) == expected
+
+def test_compare_evr():
+    # a missing epoch is 0, and the epoch wins over the version
+    assert compare_evr((None, '2.0', '1'), ('0', '2.0', '1')) == 0
+    assert compare_evr(('1', '0.1', '1'), (None, '2.0', '1')) == 1
+    assert compare_evr((None, '2.0', '2'), (None, '2.0', '1')) == 1
+    assert compare_evr((None, '2.0', '2'), (None, '2.0', '1'), ignore_release=True) == 0
+    assert compare_evr((None, '2.0', '1'), (None, '2.0~rc1', '9')) == 1
+
+# A ProviderIndex of capability 'cap', provided by the given packages, in
+# order, each (pkg, flags_evr).  Returns (index, strings).
+def make_provider_index(providers):
+    strings = StringTable()
+    index = ProviderIndex(strings)
+    for (pkg, flags_evr) in providers:
+        index.add(strings.intern('cap'), strings.intern(pkg), flags_evr)
+    return (index, strings)
+
+def select(index, strings, flags, evr):
+    pkg = index.select(strings.lookup('cap'), (flags, evr))
+    if pkg is None:
+        return None
+    return strings.names[pkg]
+
+def v(version, release=None, epoch=None):
+    return (epoch, version, release)
+
+def test_select_keeps_last_writer_if_it_qualifies():
+    (index, strings) = make_provider_index([ ('one', ('EQ', v('1.0', '1'))),
+                                             ('three', ('EQ', v('3.0', '1'))),
+                                             ('two', ('EQ', v('2.0', '1'))) ])
+    # 'two' is the last writer
+    assert select(index, strings, 'GE', v('1.0')) == 'two'
+    assert select(index, strings, 'LE', v('2.0')) == 'two'
+    assert select(index, strings, 'EQ', v('2.0', '1')) == 'two'
+    # else the newest version that qualifies
+    assert select(index, strings, 'GE', v('2.5')) == 'three'
+    assert select(index, strings, 'GT', v('2.0', '1')) == 'three'
+    assert select(index, strings, 'LT', v('2.0')) == 'one'
+    assert select(index, strings, 'EQ', v('1.0')) == 'one'
+    # if nothing qualifies, the last writer anyway
+    assert select(index, strings, 'GT', v('3.0')) == 'two'
+    # unversioned requirements, and unknown flags, take the last writer
+    assert index.select(strings.lookup('cap'), ('GE', v(None))) == strings.lookup('two')
+    assert select(index, strings, 'XX', v('9.0')) == 'two'
+    assert index.select(strings.intern('other'), ('GE', v('1.0'))) is None
+
+def test_select_release_and_epoch():
+    (index, strings) = make_provider_index([ ('rel2', ('EQ', v('2.0', '2'))),
+                                             ('epoch1', ('EQ', v('0.1', '1', epoch='1'))),
+                                             ('rel1', ('EQ', v('2.0', '1'))) ])
+    # without a release, any release of the version matches
+    assert select(index, strings, 'EQ', v('2.0')) == 'rel1'
+    assert select(index, strings, 'EQ', v('2.0', '2')) == 'rel2'
+    assert select(index, strings, 'GT', v('2.0', '1')) == 'epoch1'
+    assert select(index, strings, 'LE', v('2.0', '2')) == 'rel1'
+    assert not index.unsatisfied
+    assert select(index, strings, 'GE', v('5.0', None, '1')) == 'rel1'
+    assert index.unsatisfied == set([(strings.lookup('cap'), ('GE', v('5.0', None, '1')))])
+
+def test_select_tilde_and_caret():
+    (index, strings) = make_provider_index([ ('final', ('EQ', v('1.0', '1'))),
+                                             ('snapshot', ('EQ', v('1.0^git1', '1'))),
+                                             ('rc', ('EQ', v('1.0~rc1', '1'))),
+                                             ('next', ('EQ', v('1.0.1', '1'))) ])
+    # 1.0~rc1 < 1.0 < 1.0^git1 < 1.0.1
+    assert select(index, strings, 'LT', v('1.0')) == 'rc'
+    assert select(index, strings, 'LE', v('1.0')) == 'final'
+    assert select(index, strings, 'LT', v('1.0^git1')) == 'final'
+    assert select(index, strings, 'LT', v('1.0.1')) == 'snapshot'
+    assert select(index, strings, 'EQ', v('1.0^git1')) == 'snapshot'
+    assert select(index, strings, 'GT', v('1.0^git1')) == 'next'
+
+# A provider without a version satisfies any requirement, but a matching
+# version is preferred
+def test_select_unversioned_provider():
+    (index, strings) = make_provider_index([ ('any', None),
+                                             ('two', ('EQ', v('2.0', '1'))),
+                                             ('one', ('EQ', v('1.0', '1'))) ])
+    assert select(index, strings, 'GE', v('2.0')) == 'two'
+    assert select(index, strings, 'GE', v('3.0')) == 'any'
+    (index, strings) = make_provider_index([ ('one', ('EQ', v('1.0', '1'))),
+                                             ('ranged', ('GE', v('1.0'))) ])
+    assert select(index, strings, 'GE', v('3.0')) == 'ranged'
+
+# With --versioned_requires, a versioned requirement resolves to a
+# provider of a matching version, else as an unversioned one: to the last
+# package read that provides it, else to the owner of the file it names
+@pytest.mark.parametrize('versioned_requires,expected', [ (False, 'lib-old'),
+                                                          (True, 'lib-new,lib-old') ])
+def test_resolution_order(tmp_path, cache_builder, versioned_requires, expected):
+    def rpm(name, version, provides, requires, files, repo):
+        return { 'name': name, 'arch': 'x86_64', 'version': version, 'sourcerpm': 'src-%s-1.0-1.src.rpm' % name,
+                 'provides': [(name, 'EQ', version)] + provides, 'requires': requires, 'files': files,
+                 'repo': repo }
+    def srpm(name):
+        return { 'name': 'src-%s' % name, 'arch': 'src', 'version': '1.0', 'sourcerpm': '',
+                 'provides': [('src-%s' % name, 'EQ', '1.0')], 'requires': [], 'files': [], 'repo': 'centos' }
+    rpms = [ rpm('lib-new', '2.0', [('libfoo', 'EQ', '2.0')], [], ['/usr/lib64/libfoo.so.2'], 'centos'),
+             # read after lib-new, as the workspace comes after the mirror
+             rpm('lib-old', '1.0', [('libfoo', 'EQ', '1.0')], [], ['/usr/share/lib-old/data'], 'std'),
+             rpm('app', '1.0', [], [('libfoo', 'GE', '2.0'), ('/usr/share/lib-old/data', None, None)],
+                 [], 'centos') ]
+    srpms = [srpm(p['name']) for p in rpms]
+    root = str(tmp_path / 'tree')
+    dependancy_cache_synth.write_packages(root, rpms, srpms)
+    cache = cache_builder(root, str(tmp_path / 'cache'), versioned_requires=versioned_requires)
+    assert ','.join(cache.query('RPM-direct-requires', 'app')) == 'app,' + expected
+
+# A versioned requirement that no version satisfies is reported once, with
+# the packages that hit it, and not printed for each of them nor kept in
+# the StringTable
+def test_unsatisfied_version(tmp_path, cache_builder, capsys):
+    def rpm(name, version, requires):
+        return { 'name': name, 'arch': 'x86_64', 'version': version, 'sourcerpm': 'src-%s-1.0-1.src.rpm' % name,
+                 'provides': [(name, 'EQ', version)], 'requires': requires, 'files': [], 'repo': 'centos' }
+    rpms = [ rpm('lib', '1.0', []),
+             rpm('app', '1.0', [('lib', 'GE', '2.0')]),
+             rpm('tool', '1.0', [('lib', 'GE', '2.0'), ('lib', 'GE', '0.5')]) ]
+    srpms = [ { 'name': 'src-%s' % p['name'], 'arch': 'src', 'version': '1.0', 'sourcerpm': '',
+                'provides': [('src-%s' % p['name'], 'EQ', '1.0')], 'requires': [], 'files': [], 'repo': 'centos' }
+              for p in rpms ]
+    root = str(tmp_path / 'tree')
+    dependancy_cache_synth.write_packages(root, rpms, srpms)
+    cache = cache_builder(root, str(tmp_path / 'cache'), versioned_requires=True)
+    assert 'WARNING' not in capsys.readouterr().out
+    assert ','.join(cache.query('RPM-direct-requires', 'app')) == 'app,lib'
+    assert [line for line in cache.diagnostics.iter_lines()
+            if line.startswith(create_dependancy_cache.UNSATISFIED_VERSION)] == ['unsatisfied-version;RPM;lib GE 2.0-1;2;app,tool']
+    # the requirement is only formatted for the report
+    assert cache.strings.lookup('lib GE 2.0-1') is None
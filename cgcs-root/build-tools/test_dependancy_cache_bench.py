@@ -0,0 +1,98 @@
+#
+# Copyright (c) 2018 Wind River Systems, Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+#
+
+#
+# The benchmarks of create_dependancy_cache.py, run by pytest-benchmark on
+# trees written by dependancy_cache_synth.py, e.g.
+#   python3 -m pytest test_dependancy_cache_bench.py --benchmark-only
+# The best wall time of each stage, see dependancy_cache_bench.STAGES, is
+# saved in the extra_info of each benchmark.
+#
+
+import os
+
+import pytest
+
+import create_dependancy_cache
+import dependancy_cache_bench
+import dependancy_cache_synth
+from dependancy_cache_bench import compare, get_stage_times, growth
+
+try:
+    import pytest_benchmark
+except ImportError:
+    pytest_benchmark = None
+
+needs_benchmark = pytest.mark.skipif(pytest_benchmark is None, reason='needs pytest-benchmark')
+
+BENCH_SIZES = [1000, 5000]
+
+BENCH_OPTIONS = { 'default': {},
+                  'lazy-versioned': { 'lazy_filelists': True, 'versioned_requires': True } }
+
+
+@pytest.fixture(scope='module', params=BENCH_SIZES)
+def bench_tree(request, tmp_path_factory):
+    root = str(tmp_path_factory.mktemp('bench') / 'tree')
+    dependancy_cache_synth.write_tree(root, request.param, cycles=10, seed=0)
+    return (request.param, root)
+
+@needs_benchmark
+@pytest.mark.parametrize('options_name', sorted(BENCH_OPTIONS))
+def test_bench_create_cache(benchmark, bench_tree, options_name, tmp_path):
+    (n, root) = bench_tree
+    options = create_dependancy_cache.get_default_options(quiet=True, **BENCH_OPTIONS[options_name])
+    cache_dir = str(tmp_path / 'cache')
+    runs = []
+    def run():
+        with open(str(tmp_path / 'run.log'), 'w') as log:
+            runs.append(get_stage_times(dependancy_cache_bench.build_cache(root, cache_dir, options, log=log)))
+    benchmark.pedantic(run, rounds=3, iterations=1)
+    for (stage, phases) in dependancy_cache_bench.STAGES:
+        benchmark.extra_info[stage] = min([times[stage] for times in runs])
+    benchmark.extra_info['packages'] = n
+    assert os.path.getsize(os.path.join(cache_dir, 'RPM-transitive-requires')) > 0
+
+
+def test_get_stage_times():
+    phases = [ { 'phase': 'discovery', 'wall_s': 0.5 },
+               { 'phase': 'primary', 'rpm_type': 'RPM', 'wall_s': 1.0 },
+               { 'phase': 'primary', 'rpm_type': 'SRPM', 'wall_s': 0.25 },
+               { 'phase': 'transitive_requires', 'rpm_type': 'RPM', 'wall_s': 2.0 },
+               { 'phase': 'transitive_descendants', 'rpm_type': 'RPM', 'wall_s': 1.0 },
+               { 'phase': 'save_state', 'wall_s': 9.0 },
+               { 'phase': 'create_cache', 'wall_s': 5.0 } ]
+    assert get_stage_times(phases) == { 'parse': 1.75, 'direct': 0.0, 'closure': 3.0,
+                                        'write': 0.0, 'total': 5.0 }
+
+def test_growth():
+    assert growth(1000, 1.0, 10000, 10.0) == pytest.approx(1.0)
+    assert growth(1000, 1.0, 10000, 100.0) == pytest.approx(2.0)
+    # too short to tell
+    assert growth(1000, 0.01, 10000, 1.0) is None
+    assert growth(1000, 1.0, 1000, 2.0) is None
+
+def test_compare():
+    baseline = [ { 'packages': 1000, 'times': { 'parse': 1.0, 'closure': 0.01, 'total': 2.0 } } ]
+    results = [ { 'packages': 1000, 'times': { 'parse': 1.6, 'direct': 0.5, 'closure': 0.04,
+                                               'write': 0.0, 'total': 2.5 } },
+                { 'packages': 5000, 'times': { 'parse': 9.0, 'direct': 9.0, 'closure': 9.0,
+                                               'write': 9.0, 'total': 9.0 } } ]
+    # stages missing from the baseline, and sizes it lacks, are not compared
+    assert compare(results, baseline, 1.5) == ["1000 packages, parse: 1.600s, baseline 1.000s"]
+    assert compare(results, baseline, 2.0) == []
+
+# The bench runs in this process, on a tree with no mirror around it
+def test_main(tmp_path, capsys):
+    json_path = str(tmp_path / 'bench.json')
+    assert dependancy_cache_bench.main(['-n', '200,400', '-r', '1', '-w', str(tmp_path / 'work'),
+                                        '-j', json_path]) == 0
+    out = capsys.readouterr().out
+    assert out.splitlines()[0].split() == ['packages', 'generate', 'parse', 'direct', 'closure', 'write', 'total']
+    assert not os.path.exists(str(tmp_path / 'work'))
+    assert dependancy_cache_bench.main(['-n', '200', '-r', '1', '-b', json_path, '-t', '100']) == 0
+    assert "No regressions against %s" % json_path in capsys.readouterr().out
+    assert dependancy_cache_bench.main(['-n', '200', '--', '-j', '0']) == 1
@@ -0,0 +1,74 @@
+#
+# Copyright (c) 2018 Wind River Systems, Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+#
+
+import os
+
+import pytest
+
+import dependancy_cache_db
+import dependancy_cache_index
+import dependancy_cache_planner
+from dependancy_cache_db import CacheDb
+
+
+def read_cache(cache_dir, cache_name):
+    return dependancy_cache_index.read_cache_text(os.path.join(cache_dir, cache_name))
+
+
+# The recursive queries of the store give the transitive cache files.  A
+# SRPM-transitive-requires line names a SRPM once per rpm of it.
+@pytest.mark.parametrize('rpm_type', ['RPM', 'SRPM'])
+def test_transitive_queries_match_cache_files(synth_cache, rpm_type):
+    (cache, cache_dir, db_path) = synth_cache
+    requires = read_cache(cache_dir, '%s-transitive-requires' % rpm_type)
+    descendants = read_cache(cache_dir, '%s-transitive-descendants' % rpm_type)
+    with CacheDb(db_path) as db:
+        for (name, values) in requires.items():
+            assert db.transitive_requires(name, rpm_type=rpm_type) == sorted(set(values))
+        for (name, values) in descendants.items():
+            assert db.transitive_descendants(name, rpm_type=rpm_type) == values
+
+def test_provider(synth_cache):
+    (cache, cache_dir, db_path) = synth_cache
+    with CacheDb(db_path) as db:
+        assert db.provider('kernel') == 'kernel'
+        assert db.provider('/usr/bin/kernel') is None
+        assert db.provider('no-such-capability') is None
+        assert db.lookup('no-such-package') is None
+
+# The store rebuilds the same SRPMs dependancy_cache_planner.py plans, for
+# a changed SRPM, which is rebuilt itself, and for a changed rpm
+def test_rebuild_matches_planner(synth_cache):
+    (cache, cache_dir, db_path) = synth_cache
+    srpm_to_rpm = read_cache(cache_dir, 'srpm-to-rpm')
+    rpm_to_srpm = read_cache(cache_dir, 'rpm-to-srpm')
+    names = sorted(srpm_to_rpm) + sorted(rpm for rpm in rpm_to_srpm if rpm_to_srpm[rpm])[:50]
+    with CacheDb(db_path) as db:
+        for name in names:
+            waves = dependancy_cache_planner.plan_rebuild(cache_dir, [name])
+            planned = sorted(srpm for groups in waves for group in groups for srpm in group)
+            assert db.rebuild(name) == planned
+        assert 'kernel' in db.rebuild('kernel')
+
+def test_write_db_replaces_store(tmp_path):
+    db_path = str(tmp_path / 'graph.db')
+    for names in [['a', 'b'], ['a', 'b', 'c']]:
+        tables = { 'packages': [('RPM', i) for i in range(len(names))],
+                   'edges': [('RPM', i, i + 1) for i in range(len(names) - 1)] }
+        dependancy_cache_db.write_db(db_path, names, tables)
+    assert os.listdir(str(tmp_path)) == ['graph.db']
+    with CacheDb(db_path) as db:
+        assert db.transitive_requires('a') == ['b', 'c']
+        assert db.transitive_descendants('c') == ['a', 'b']
+
+def test_rejects_other_files(tmp_path):
+    with pytest.raises(ValueError):
+        CacheDb(str(tmp_path / 'missing.db'))
+    path = str(tmp_path / 'other.db')
+    with open(path, 'w') as f:
+        f.write("not a database\n")
+    with pytest.raises(ValueError):
+        CacheDb(path)
@@ -0,0 +1,66 @@
+#
+# Copyright (c) 2018 Wind River Systems, Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+#
+
+import os
+import shutil
+
+import pytest
+
+import dependancy_cache_diff
+from dependancy_cache_diff import ADDED, CHANGED, REMOVED, diff_cache_files
+
+
+def write_text(path, lines):
+    with open(path, 'w') as f:
+        for line in lines:
+            f.write(line + "\n")
+
+
+def test_diff_cache_files(tmp_path):
+    old_path = str(tmp_path / 'old')
+    new_path = str(tmp_path / 'new')
+    write_text(old_path, ['a;x,y', 'b;x', 'c;', 'd;y,z'])
+    write_text(new_path, ['a;y,z', 'c;', 'd;z,y', 'e;x'])
+    assert list(diff_cache_files(old_path, new_path)) == [ ('a', CHANGED, ['z'], ['x']),
+                                                           ('b', REMOVED, [], ['x']),
+                                                           ('e', ADDED, ['x'], []) ]
+
+# A missing file has no lines
+def test_diff_against_missing_file(tmp_path):
+    path = str(tmp_path / 'new')
+    write_text(path, ['a;x'])
+    missing = str(tmp_path / 'missing')
+    assert list(diff_cache_files(missing, path)) == [('a', ADDED, ['x'], [])]
+    assert list(diff_cache_files(path, missing)) == [('a', REMOVED, [], ['x'])]
+
+def test_diff_rejects_unsorted_file(tmp_path):
+    old_path = str(tmp_path / 'old')
+    new_path = str(tmp_path / 'new')
+    write_text(old_path, ['b;x', 'a;x'])
+    write_text(new_path, ['a;x'])
+    with pytest.raises(ValueError):
+        list(diff_cache_files(old_path, new_path))
+
+# The exit status is 0 for the same caches, 1 if they differ, as for diff
+def test_main(synth_cache, tmp_path, capsys):
+    (cache, cache_dir, db_path) = synth_cache
+    new_dir = str(tmp_path / 'new')
+    shutil.copytree(cache_dir, new_dir)
+    assert dependancy_cache_diff.main(['-a', cache_dir, new_dir]) == 0
+
+    path = os.path.join(new_dir, 'RPM-direct-requires')
+    with open(path) as f:
+        lines = f.read().splitlines()
+    (name, values) = lines[-1].split(';')
+    lines[-1] = "%s;%s" % (name, ','.join(sorted(values.split(',') + ['zz-new'])))
+    write_text(path, lines)
+    capsys.readouterr()
+    assert dependancy_cache_diff.main([cache_dir, new_dir]) == 1
+    out = capsys.readouterr().out
+    assert "%s;+zz-new;-\n" % name in out
+    assert "RPM-direct-requires: 0 packages added, 0 removed, 1 changed; 1 edges added, 0 removed" in out
+
+    assert dependancy_cache_diff.main([cache_dir, str(tmp_path / 'missing')]) == 2
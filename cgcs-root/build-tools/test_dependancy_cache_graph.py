@@ -0,0 +1,26 @@
+#
+# Copyright (c) 2018 Wind River Systems, Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+#
+
+from dependancy_cache_graph import strongly_connected_components
+
+
+def test_strongly_connected_components():
+    graph = { 'a': ['b'], 'b': ['c'], 'c': ['a', 'd'], 'd': ['e'], 'e': [], 'f': ['d', 'x'] }
+    components = [sorted(c) for c in strongly_connected_components(graph)]
+    assert sorted(components) == [['a', 'b', 'c'], ['d'], ['e'], ['f'], ['x']]
+    # a component comes after every component it reaches
+    position = dict((node, i) for (i, c) in enumerate(components) for node in c)
+    for (node, succs) in graph.items():
+        for succ in succs:
+            assert position[succ] <= position[node]
+
+def test_strongly_connected_components_deep_chain():
+    n = 100000
+    graph = dict((i, [i + 1]) for i in range(n))
+    graph[n] = [0]
+    components = strongly_connected_components(graph)
+    assert len(components) == 1
+    assert len(components[0]) == n + 1
@@ -0,0 +1,95 @@
+#
+# Copyright (c) 2018 Wind River Systems, Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+#
+
+import os
+import time
+
+import pytest
+
+import create_dependancy_cache
+import dependancy_cache_index
+from dependancy_cache_index import CacheIndex
+
+
+def write_text(path, lines):
+    with open(path, 'w') as f:
+        for line in lines:
+            f.write(line + "\n")
+
+
+# The index of every cache file holds the same rows as the text file
+@pytest.mark.parametrize('cache_name', create_dependancy_cache.get_cache_names())
+def test_index_matches_text(synth_cache, cache_name):
+    (cache, cache_dir, db_path) = synth_cache
+    text_path = os.path.join(cache_dir, cache_name)
+    text = dependancy_cache_index.read_cache_text(text_path)
+    with CacheIndex(text_path + dependancy_cache_index.INDEX_SUFFIX) as index:
+        assert len(index) == len(text)
+        assert list(index.keys()) == sorted(text)
+        assert dict(index.items()) == text
+        for (name, values) in text.items():
+            assert name in index
+            assert index[name] == values
+
+def test_index_lookups(tmp_path):
+    text_path = str(tmp_path / 'RPM-direct-requires')
+    # 'c' is only ever a value, 'e' has an empty row
+    write_text(text_path, ['a;b,c', 'b;c', 'e;'])
+    index_path = dependancy_cache_index.write_index_from_text(text_path)
+    assert index_path == text_path + '.idx'
+    with CacheIndex(index_path) as index:
+        assert index.n_names == 4
+        assert index.get('a') == ['b', 'c']
+        assert index.get('e') == []
+        assert index.get('c') is None
+        assert index.get('zz', 'default') == 'default'
+        assert 'c' not in index
+        assert 'e' in index
+        with pytest.raises(KeyError):
+            index['c']
+
+def test_index_rejects_unsorted_text(tmp_path):
+    text_path = str(tmp_path / 'RPM-direct-requires')
+    write_text(text_path, ['b;a', 'a;b'])
+    with pytest.raises(ValueError):
+        dependancy_cache_index.write_index_from_text(text_path)
+    assert os.listdir(str(tmp_path)) == ['RPM-direct-requires']
+
+@pytest.mark.parametrize('content', [b'', b'DCIX', b'not an index file at all, but long enough' * 4])
+def test_index_rejects_other_files(tmp_path, content):
+    path = str(tmp_path / 'bad.idx')
+    with open(path, 'wb') as f:
+        f.write(content)
+    with pytest.raises(ValueError):
+        CacheIndex(path)
+
+# open_cache() only trusts an index at least as new as the text file
+def test_open_cache(tmp_path):
+    cache_dir = str(tmp_path)
+    text_path = os.path.join(cache_dir, 'RPM-direct-requires')
+    write_text(text_path, ['a;b'])
+    assert dependancy_cache_index.open_cache(cache_dir, 'RPM-direct-requires') == {'a': ['b']}
+
+    index_path = dependancy_cache_index.write_index_from_text(text_path)
+    index = dependancy_cache_index.open_cache(cache_dir, 'RPM-direct-requires')
+    assert isinstance(index, CacheIndex)
+    assert index.get('a') == ['b']
+    index.close()
+
+    write_text(text_path, ['a;c'])
+    stale = time.time() - 60
+    os.utime(index_path, (stale, stale))
+    assert dependancy_cache_index.open_cache(cache_dir, 'RPM-direct-requires') == {'a': ['c']}
+
+@pytest.mark.parametrize('fn,expected', [('RPM-direct-requires', True),
+                                         ('rpm-to-srpm', True),
+                                         ('RPM-direct-requires.idx', False),
+                                         ('RPM-direct-requires.zst', False),
+                                         ('RPM-direct-requires.123.tmp', False),
+                                         ('MANIFEST.sha256', False),
+                                         ('.hidden', False)])
+def test_is_cache_text_name(fn, expected):
+    assert dependancy_cache_index.is_cache_text_name(fn) == expected
@@ -0,0 +1,76 @@
+#
+# Copyright (c) 2018 Wind River Systems, Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+#
+
+import os
+
+import pytest
+
+import dependancy_cache_index
+import dependancy_cache_planner
+from dependancy_cache_planner import NoSourceRpmError, plan_waves
+
+
+def test_plan_waves():
+    direct_requires = { 'app': ['lib', 'tool'], 'lib': ['base'], 'tool': ['base', 'tool'],
+                        'x': ['y'], 'y': ['x', 'lib'], 'base': ['outside'] }
+    rebuild = set(['app', 'lib', 'tool', 'base', 'x', 'y'])
+    assert plan_waves(rebuild, direct_requires) == [ [['base']],
+                                                     [['lib'], ['tool']],
+                                                     [['app'], ['x', 'y']] ]
+    # only the direct requires within the rebuild set order the waves
+    assert plan_waves(set(['app', 'base']), direct_requires) == [[['app'], ['base']]]
+    assert plan_waves(set(), direct_requires) == []
+
+# Every SRPM only build requires SRPMs of earlier waves, or of its own group
+def test_plan_rebuild(synth_cache):
+    (cache, cache_dir, db_path) = synth_cache
+    descendants = dependancy_cache_index.read_cache_text(os.path.join(cache_dir, 'SRPM-transitive-descendants'))
+    direct_requires = dependancy_cache_index.read_cache_text(os.path.join(cache_dir, 'SRPM-direct-requires'))
+    waves = dependancy_cache_planner.plan_rebuild(cache_dir, ['kernel'])
+    wave_of = {}
+    group_of = {}
+    for (i, groups) in enumerate(waves):
+        for group in groups:
+            for name in group:
+                assert name not in wave_of
+                wave_of[name] = i
+                group_of[name] = group
+    assert set(wave_of) == set(['kernel']) | set(descendants.get('kernel', ()))
+    for name in wave_of:
+        for r in direct_requires.get(name, ()):
+            if r in wave_of and r not in group_of[name]:
+                assert wave_of[r] < wave_of[name]
+
+# An rpm stands for the SRPM that builds it
+def test_plan_rebuild_of_rpm(synth_cache):
+    (cache, cache_dir, db_path) = synth_cache
+    assert (dependancy_cache_planner.plan_rebuild(cache_dir, ['kernel-devel']) ==
+            dependancy_cache_planner.plan_rebuild(cache_dir, ['kernel']))
+
+def test_plan_rebuild_of_unknown_name(synth_cache):
+    (cache, cache_dir, db_path) = synth_cache
+    with pytest.raises(KeyError):
+        dependancy_cache_planner.plan_rebuild(cache_dir, ['no-such-package'])
+
+# A known rpm that no known srpm builds is not an unknown name
+def test_plan_rebuild_of_rpm_without_srpm(tmp_path, capsys):
+    cache_dir = str(tmp_path)
+    for (cache_name, lines) in [ ('RPM-direct-requires', ['a;a', 'b;b', 'c;c']),
+                                 ('rpm-to-srpm', ['a;src-a', 'b;']),
+                                 ('srpm-to-rpm', ['src-a;a']),
+                                 ('SRPM-direct-requires', ['src-a;']),
+                                 ('SRPM-transitive-descendants', []) ]:
+        with open(os.path.join(cache_dir, cache_name), 'w') as f:
+            for line in lines:
+                f.write(line + "\n")
+    assert dependancy_cache_planner.plan_rebuild(cache_dir, ['a']) == [[['src-a']]]
+    for name in ['b', 'c']:
+        with pytest.raises(NoSourceRpmError):
+            dependancy_cache_planner.plan_rebuild(cache_dir, [name])
+    assert dependancy_cache_planner.main([cache_dir, 'c']) == 1
+    assert capsys.readouterr().out == "ERROR: rpm 'c' has no source rpm\n"
+    assert dependancy_cache_planner.main([cache_dir, 'd']) == 1
+    assert capsys.readouterr().out == "ERROR: 'd' is not a known srpm or rpm\n"
@@ -0,0 +1,91 @@
+#
+# Copyright (c) 2018 Wind River Systems, Inc.
+#
+# SPDX-License-Identifier: Apache-2.0
+#
+
+import os
+import socket
+import threading
+
+import pytest
+
+import dependancy_cache_server
+from dependancy_cache_server import CacheFiles, FOUND, NOT_FOUND, FAILED
+
+
+def write_text(path, lines):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        for line in lines:
+            f.write(line + "\n")
+    # replaced by rename, as create_dependancy_cache.py does
+    os.rename(tmp_path, path)
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    write_text(str(tmp_path / 'RPM-direct-requires'), ['a;b,c', 'b;', 'c;b'])
+    write_text(str(tmp_path / 'rpm-to-srpm'), ['a;src-a'])
+    return str(tmp_path)
+
+# A server on a socket in 'cache_dir', run in a thread for the test
+@pytest.fixture
+def server(cache_dir):
+    socket_path = os.path.join(cache_dir, '.test.sock')
+    cache_files = CacheFiles(cache_dir, quiet=True)
+    server = dependancy_cache_server.QueryServer(socket_path, cache_files)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield socket_path
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+def test_answer(cache_dir):
+    cache_files = CacheFiles(cache_dir, quiet=True)
+    assert cache_files.list_cache_names() == ['RPM-direct-requires', 'rpm-to-srpm']
+    assert cache_files.answer('RPM-direct-requires a') == FOUND + 'a;b,c'
+    assert cache_files.answer('RPM-direct-requires b') == FOUND + 'b;'
+    assert cache_files.answer('RPM-direct-requires z') == NOT_FOUND
+    for request in ['RPM-direct-requires', 'no-such-file a', '../RPM-direct-requires a',
+                    'RPM-direct-requires.idx a']:
+        assert cache_files.answer(request).startswith(FAILED)
+
+# A cache file replaced is read again, once the check interval is over
+def test_reload(cache_dir):
+    cache_files = CacheFiles(cache_dir, check_interval=0, quiet=True)
+    assert cache_files.lookup('RPM-direct-requires', 'a') == 'a;b,c'
+    write_text(os.path.join(cache_dir, 'RPM-direct-requires'), ['a;c'])
+    assert cache_files.lookup('RPM-direct-requires', 'a') == 'a;c'
+    os.remove(os.path.join(cache_dir, 'RPM-direct-requires'))
+    with pytest.raises(ValueError):
+        cache_files.lookup('RPM-direct-requires', 'a')
+
+def test_query_server(server, cache_dir, capsys):
+    assert dependancy_cache_server.send_queries(server, [('RPM-direct-requires', 'a'),
+                                                         ('RPM-direct-requires', 'z'),
+                                                         ('no-such-file', 'a')]) == [FOUND + 'a;b,c', NOT_FOUND,
+                                                                                     FAILED + "no cache file 'no-such-file' in %s" % cache_dir]
+    assert dependancy_cache_server.query(server, None, 'RPM-direct-requires', ['a', 'z', 'c']) == 0
+    assert capsys.readouterr().out == "a;b,c\nc;b\n"
+    assert dependancy_cache_server.query(server, None, 'RPM-direct-requires', ['a'], values_only=True) == 0
+    assert capsys.readouterr().out == "b,c\n"
+    assert dependancy_cache_server.query(server, None, 'RPM-direct-requires', ['z']) == 1
+    assert dependancy_cache_server.query(server, None, 'no-such-file', ['a']) == 2
+
+# Without a server, the client reads the cache file itself, if it may
+def test_query_without_server(cache_dir, capsys):
+    socket_path = os.path.join(cache_dir, '.none.sock')
+    assert dependancy_cache_server.query(socket_path, cache_dir, 'rpm-to-srpm', ['a']) == 0
+    assert capsys.readouterr().out == "a;src-a\n"
+    assert dependancy_cache_server.query(socket_path, None, 'rpm-to-srpm', ['a']) == 2
+
+def test_remove_stale_socket(server, cache_dir):
+    assert not dependancy_cache_server.remove_stale_socket(server)
+    stale_path = os.path.join(cache_dir, '.stale.sock')
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.bind(stale_path)
+    s.close()
+    assert dependancy_cache_server.remove_stale_socket(stale_path)
+    assert not os.path.exists(stale_path)
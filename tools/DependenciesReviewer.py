@@ -77,17 +77,69 @@ class MirrorInfo:
         """
         return "MirrorInfo: {} {}".format(self.path, self.src_pkgs)
 
+def get_mirror_infos(mirrorpath):
+    """
+    Return the list of MirrorInfo objects of the mirror's list files in
+    mirrorpath, in directory order
+    """
+    all_files = os.listdir(mirrorpath)
+    mirror_files = [x for x in all_files if DISTRO["prefix"] in x]
+    mirror_infos = []
+    for elem in mirror_files:
+        # Get package's content
+        _tmp_path = os.path.join(mirrorpath, elem)
+        _tmp_pkgs = get_content(_tmp_path)
+        # Do particular clean up for 3rd party packages' names
+        if elem == DISTRO["prefix"]+"from_3rd_parties.lst":
+            _tmp_pkgs = [x.split("#")[0] for x in _tmp_pkgs]
+        mirror_infos.append(MirrorInfo(path=_tmp_path, src_pkgs=_tmp_pkgs))
+    return mirror_infos
+
+def index_mirror(mirrorpath):
+    """
+    Return a dictionary of package name -> path of the mirror's list file
+    that has it, for the list files in mirrorpath. A package in several
+    lists maps to the last one, in directory order.
+    """
+    mirror_index = {}
+    for mirr in get_mirror_infos(mirrorpath):
+        for pkg in mirr.src_pkgs:
+            mirror_index[pkg] = mirr.path
+    return mirror_index
+
+def get_content(path):
+    """
+    Get path's content as a list. A missing file sets ERRORCODE to
+    FILENOTFOUND, and gives an empty list.
+    """
+    global ERRORCODE
+    try:
+        with open(path) as f:
+            text = f.read()
+        text_list = text.split("\n")
+        text_list = list(filter(None, text_list))
+        return text_list
+    except FileNotFoundError:
+        print("Mirror lst file not found {}".format(path.split("/")[-1]),
+              file=results)
+        ERRORCODE = FILENOTFOUND
+        return []
+
 class DependenciesReviewer:
     """
     DependenciesReviewer class reviews the content in stx-'s
     */centos/srpm_path matches with the information in the mirror's lists.
     If there are modules that does not match, the DependenciesReviewer can
     display the information.
+    The mirror's lists are looked up through one dictionary of package
+    name -> list file, see index_mirror(). It can be given as mirror_index,
+    to share it between the reviewers of several modules.
     """
     def __init__(self, modulepath=os.path.abspath(".."),
-                 mirrorpath=os.path.abspath(".")):
+                 mirrorpath=os.path.abspath("."), mirror_index=None):
         self.modulepath = modulepath
         self.mirrorpath = mirrorpath
+        self.mirror_index = mirror_index
         self._src_pkgs_dict = {}
         self._src_pkgs_list = []
 
@@ -95,29 +147,17 @@ class DependenciesReviewer:
         return "DependenciesReviewer: {} {} {}".format(self.modulepath,
                                                        self.mirrorpath)
 
-    def _find_elements(self, spkgsdict, mirror_list, mirror_path):
+    def _find_elements(self, spkgsdict, mirror_index):
         """
-        Fill the dictionary with the location in the mirror's list
+        Fill the dictionary with the location in the mirror's lists
         """
-        for key, value in spkgsdict.items():
-            for i in range(0, len(value)):
-                if value[i].name in mirror_list:
-                    spkgsdict[key][i].location = mirror_path
+        for value in spkgsdict.values():
+            for pkg in value:
+                location = mirror_index.get(pkg.name)
+                if location is not None:
+                    pkg.location = location
         return spkgsdict
 
-    def _get_content(self, path):
-        """ Get path's content as a list """
-        try:
-            text = open(path).read()
-            text_list = text.split("\n")
-            text_list = list(filter(None, text_list))
-            return text_list
-        except FileNotFoundError:
-            print("Mirror lst file not found {}".format(path.split("/")[-1]),
-                  file=results)
-            ERRORCODE = FILENOTFOUND
-            return []
-
     def check_missing(self):
         """
         Solve the dependencies
@@ -139,10 +179,10 @@ class DependenciesReviewer:
             pkgs_list = pkgs_list.split("\n")
             pkgs_list = list(filter(None, pkgs_list))
 
+            temp = []
             if not pkgs_list:
                 print("No content in: "+path, file=results)
             else:
-                temp = []
                 for pkg in pkgs_list:
                     if "mirror:" in pkg:
                         pkgname = pkg.split("/")[-1]
@@ -152,30 +192,17 @@ class DependenciesReviewer:
             self._src_pkgs_dict[path] = temp
 
         # MIRROR LISTS
-        # Generate list of MirrorInfo objects, which is needed for the review
-        all_files = os.listdir(self.mirrorpath)
-        mirror_files = [x for x in all_files if DISTRO["prefix"] in x]
-        _spkg_mirror = []
-        for elem in mirror_files:
-            # Get package's content
-            _tmp_path = os.path.join(self.mirrorpath, elem)
-            _tmp_pkgs = self._get_content(_tmp_path)
-            # Do particular clean up for 3rd party packages' names
-            if elem == DISTRO["prefix"]+"from_3rd_parties.lst":
-                _tmp_pkgs = [x.split("#")[0] for x in _tmp_pkgs]
-            # Create a list with the Mirror Info
-            _spkg_mirror.append(MirrorInfo(path=_tmp_path, src_pkgs=_tmp_pkgs))
+        # Index the packages of the mirror's lists by name, once
+        if self.mirror_index is None:
+            self.mirror_index = index_mirror(self.mirrorpath)
 
         # MATCHING
-        # Finding Packages in the mirror
-        for mirr in _spkg_mirror:
-            # Fill the dictinoary with the location
-            self._src_pkgs_dict = self._find_elements(self._src_pkgs_dict,
-                                                   mirr.src_pkgs,
-                                                   mirr.path)
-            # Leave on the list only the missing Source Packages
-            self._src_pkgs_list = [element for element in self._src_pkgs_list
-                                if element not in mirr.src_pkgs]
+        # Fill the dictionary with the location
+        self._src_pkgs_dict = self._find_elements(self._src_pkgs_dict,
+                                                  self.mirror_index)
+        # Leave on the list only the missing Source Packages
+        self._src_pkgs_list = [element for element in self._src_pkgs_list
+                               if element not in self.mirror_index]
 
     def how_many_missing(self):
         """
@@ -200,10 +227,12 @@ if __name__ == "__main__":
 
     if ERRORCODE == SUCCESS:
         stx_directories = []
+        mirror_index = index_mirror(MTOOLS)
         for directory in directories:
             if "stx-" in directory:
                 A = DependenciesReviewer(modulepath=os.path.join(REPOS, directory),
-                                         mirrorpath=MTOOLS)
+                                         mirrorpath=MTOOLS,
+                                         mirror_index=mirror_index)
                 A.check_missing()
                 if A.how_many_missing() > 0:
                     print("Missing Src Packages in module: "+directory,
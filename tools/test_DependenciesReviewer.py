@@ -0,0 +1,89 @@
+#
+# SPDX-License-Identifier: Apache-2.0
+#
+# Copyright (C) 2019 Intel Corporation
+#
+
+#
+# Run from this directory with
+#   python3 -m pytest test_DependenciesReviewer.py
+#
+
+import importlib
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+# The DependenciesReviewer module, imported in a scratch directory, as it
+# opens its log file in the current directory, with the log kept in memory
+# and ERRORCODE reset
+@pytest.fixture
+def reviewer(tmp_path, monkeypatch):
+    monkeypatch.chdir(str(tmp_path))
+    module = importlib.import_module('DependenciesReviewer')
+    monkeypatch.setattr(module, 'results', io.StringIO())
+    monkeypatch.setattr(module, 'ERRORCODE', module.SUCCESS)
+    return module
+
+def write_file(path, lines):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+
+# A mirror directory of two list files, and a file that is not a list
+@pytest.fixture
+def mirror(tmp_path):
+    mirrorpath = str(tmp_path / 'mirror')
+    write_file(os.path.join(mirrorpath, 'rpms_centos.lst'),
+               ['bash-4.2.46-30.el7.src.rpm', 'kernel-3.10.0-957.el7.src.rpm', ''])
+    write_file(os.path.join(mirrorpath, 'rpms_from_3rd_parties.lst'),
+               ['python-foo-1.0-1.src.rpm#http://example.com/python-foo-1.0-1.src.rpm'])
+    write_file(os.path.join(mirrorpath, 'other.lst'), ['ignored-1.0-1.src.rpm'])
+    return mirrorpath
+
+
+def test_index_mirror(reviewer, mirror):
+    index = reviewer.index_mirror(mirror)
+    assert index == { 'bash-4.2.46-30.el7.src.rpm': os.path.join(mirror, 'rpms_centos.lst'),
+                      'kernel-3.10.0-957.el7.src.rpm': os.path.join(mirror, 'rpms_centos.lst'),
+                      'python-foo-1.0-1.src.rpm': os.path.join(mirror, 'rpms_from_3rd_parties.lst') }
+    assert reviewer.ERRORCODE == reviewer.SUCCESS
+
+# The packages of srpm_path are looked up in the index, and only those
+# missing from every list are left
+@pytest.mark.parametrize('shared_index', [False, True])
+def test_check_missing(reviewer, mirror, tmp_path, shared_index):
+    modulepath = str(tmp_path / 'stx-foo')
+    srpm_path = os.path.join(modulepath, 'bar', 'centos', 'srpm_path')
+    write_file(srpm_path, ['mirror:Source/bash-4.2.46-30.el7.src.rpm',
+                           'mirror:Source/python-foo-1.0-1.src.rpm',
+                           'mirror:Source/missing-1.0-1.src.rpm',
+                           'repo:stx/git/bar'])
+    mirror_index = None
+    if shared_index:
+        mirror_index = reviewer.index_mirror(mirror)
+    review = reviewer.DependenciesReviewer(modulepath=modulepath, mirrorpath=mirror,
+                                           mirror_index=mirror_index)
+    review.check_missing()
+    assert review.how_many_missing() == 1
+    assert [(pkg.name, pkg.location) for pkg in review._src_pkgs_dict[srpm_path]] == [
+        ('bash-4.2.46-30.el7.src.rpm', os.path.join(mirror, 'rpms_centos.lst')),
+        ('python-foo-1.0-1.src.rpm', os.path.join(mirror, 'rpms_from_3rd_parties.lst')),
+        ('missing-1.0-1.src.rpm', 'NotFound') ]
+    review.show_missing()
+    assert reviewer.results.getvalue() == ">>> mirror:Source/missing-1.0-1.src.rpm %s\n" % srpm_path
+
+# A missing list file gives no packages, is logged, and sets ERRORCODE
+def test_get_content(reviewer, mirror):
+    assert reviewer.get_content(os.path.join(mirror, 'rpms_centos.lst')) == [
+        'bash-4.2.46-30.el7.src.rpm', 'kernel-3.10.0-957.el7.src.rpm']
+    assert reviewer.ERRORCODE == reviewer.SUCCESS
+    assert reviewer.get_content(os.path.join(mirror, 'rpms_missing.lst')) == []
+    assert reviewer.ERRORCODE == reviewer.FILENOTFOUND
+    assert reviewer.results.getvalue() == "Mirror lst file not found rpms_missing.lst\n"